@@ -1,28 +1,42 @@
 # backend/api/admin_edit_routers.py
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Body, Query
 from fastapi.responses import FileResponse
-from backend.schemas_enums.schemas import EventCreate, TicketTypeCreate, UserResponse, UserUpdate, PaginatedResponse
+from backend.schemas_enums.schemas import (
+    EventCreate, TicketTypeCreate, UserResponse, UserUpdate, PaginatedResponse, InventoryShardsUpdate, TicketInventoryResponse,
+    DeletionJobResponse
+)
 from backend.config.auth import get_current_admin, log_admin_activity, get_last_user_activity
-from backend.database.user_db import AsyncSession, NotificationTemplate, NotificationView, UserActivity, get_async_db, Event, User, TicketType, Registration, Media
+from backend.database.user_db import AsyncSession, DeletionJob, NotificationTemplate, NotificationView, UserActivity, get_async_db, Event, User, TicketType, Registration, ticket_inventory
 from backend.config.logging_config import logger
+from backend.dispatch.queue import enqueue_template_dispatch
+from backend.config.event_cache import build_canonical_slug, invalidate_event
+from backend.config.pagination import apply_keyset, next_cursor
+from backend.config.idempotency import idempotent
+from backend.config.inventory import configure_shards
+from backend.config.serialization import TrustedJSONResponse
+from backend.config.deletion_jobs import create_deletion_job, deletion_worker
+from backend.config.image_pipeline import image_pipeline
+from backend.config.media_store import discard_media, media_id_from_url, media_url, release, store_upload
+from backend.config.uploads import MAX_EVENT_IMAGE_UPLOAD_BYTES
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import select, delete, func, or_, asc, desc, case, cast, Integer, Float, outerjoin
+from sqlalchemy import select, func, or_, asc, desc, case, cast, Integer, Float, outerjoin, true
 from sqlalchemy.orm import selectinload
 from backend.schemas_enums.enums import EventStatus, Status
 from datetime import datetime, timedelta
 import os
-import uuid
-from typing import Optional, List
+from typing import Optional, List, Tuple
 import inspect
 from pydantic import BaseModel, field_validator
 import re
-import io
-from PIL import Image as PillowImage
-import glob
 
 router = APIRouter()
 bearer_scheme = HTTPBearer()
 
+def like_pattern(term: str) -> str:
+    """Шаблон подстрочного поиска для ILIKE с экранированными спецсимволами."""
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
 def make_naive(dt: datetime) -> datetime:
     if dt.tzinfo is not None:
         return dt.replace(tzinfo=None)
@@ -79,92 +93,41 @@ def generate_slug_with_id(slug: str, event_id: int, start_date: datetime) -> str
     # Возвращаем только базовый слаг без суффиксов
     return valid_slug
 
-async def process_image(image_file: Optional[UploadFile], remove_image: bool, old_image_url: Optional[str] = None) -> Optional[str]:
+async def process_image(
+    db: AsyncSession, image_file: Optional[UploadFile], remove_image: bool, old_image_url: Optional[str] = None
+) -> Tuple[Optional[str], Optional[str]]:
     """
-    Обрабатывает загруженное изображение, создает оптимизированные WebP версии
-    и сохраняет их. Возвращает путь к оптимизированной версии среднего размера.
-    Удаляет старые файлы при необходимости.
+    Принимает загруженное изображение в хранилище и переносит ссылку со старого изображения
+    в транзакции db. Возвращает (image_url, original_filename). Если загружено новое изображение,
+    image_url указывает на оригинал, а original_filename нужно передать в image_pipeline
+    после сохранения мероприятия - WebP-версии строятся в фоне, не блокируя event loop.
+    Замененное изображение передается в discard_media после коммита.
     """
-    media_dir = "private_media"
-    os.makedirs(media_dir, exist_ok=True)
-
-    # --- Логика удаления старых файлов ---
-    if (remove_image or image_file) and old_image_url:
-        try:
-            # Извлекаем имя файла без пути и расширения (предполагаем формат /images/uuid.ext)
-            old_filename = os.path.basename(old_image_url)
-            old_uuid_base = os.path.splitext(old_filename)[0]
-            # Ищем все файлы с этим UUID в media_dir
-            old_files_pattern = os.path.join(media_dir, f"{old_uuid_base}*")
-            logger.info(f"Searching for old files to delete with pattern: {old_files_pattern}")
-            for old_file_path in glob.glob(old_files_pattern):
-                try:
-                    os.remove(old_file_path)
-                    logger.info(f"Deleted old image file: {old_file_path}")
-                except OSError as e:
-                    logger.error(f"Error deleting old image file {old_file_path}: {e}")
-        except Exception as e:
-            logger.error(f"Error processing old image URL {old_image_url} for deletion: {e}")
-
-        # Если удаляем и нового файла нет, выходим
-        if remove_image and not image_file:
-            return None
-
-    # --- Логика обработки нового файла ---
     if image_file:
         try:
-            content = await image_file.read()
-            img = PillowImage.open(io.BytesIO(content))
-            img = img.convert("RGB") # Конвертируем в RGB для совместимости с WebP/JPEG
-
-            unique_uuid = str(uuid.uuid4())
-
-            # --- Сохранение оригинала ---
-            original_extension = image_file.filename.split('.')[-1].lower()
-            # Разрешаем только распространенные форматы
-            allowed_extensions = ['jpg', 'jpeg', 'png']
-            if original_extension not in allowed_extensions:
-                 raise HTTPException(status_code=400, detail=f"Unsupported image format: {original_extension}. Allowed: {allowed_extensions}")
-
-            original_filename = f"{unique_uuid}_original.{original_extension}"
-            original_path = os.path.join(media_dir, original_filename)
-            with open(original_path, "wb") as f:
-                 f.write(content)
-            logger.info(f"Saved original image: {original_path}")
-
-
-            # --- Оптимизация и сохранение WebP версий ---
-            optimized_paths = {}
-            sizes = {
-                "medium": 600,  # Ширина для карточек
-                "large": 1200  # Ширина для детального просмотра (пример)
-            }
-
-            for size_name, width in sizes.items():
-                img_copy = img.copy()
-                # Рассчитываем высоту, сохраняя пропорции
-                aspect_ratio = img_copy.height / img_copy.width
-                new_height = int(width * aspect_ratio)
-                img_copy.thumbnail((width, new_height)) # Используем thumbnail для сохранения качества
-
-                webp_filename = f"{unique_uuid}_{size_name}.webp"
-                webp_path = os.path.join(media_dir, webp_filename)
-                img_copy.save(webp_path, format="WEBP", quality=80, optimize=True)
-                optimized_paths[size_name] = f"/images/{webp_filename}"
-                logger.info(f"Saved optimized {size_name} WebP image: {webp_path}")
-
-            # Возвращаем путь к оптимизированной версии для карточки (medium)
-            return optimized_paths.get("medium")
-
+            # Файл пишется на диск частями; тип определяется по сигнатуре, а не по расширению
+            original_filename = await store_upload(
+                db, image_file,
+                max_bytes=MAX_EVENT_IMAGE_UPLOAD_BYTES,
+                allowed_types=("jpg", "png", "webp"),
+            )
         except HTTPException as e:
              raise e # Перебрасываем HTTP исключения
         except Exception as e:
             logger.error(f"Error processing uploaded image: {e}", exc_info=True)
             raise HTTPException(status_code=500, detail="Ошибка при обработке изображения.")
 
+        await release(db, old_image_url)
+        if old_image_url and media_id_from_url(old_image_url) == media_id_from_url(original_filename):
+            # Загружен тот же файл - URL и готовые версии остаются прежними
+            return old_image_url, None
+        return media_url(original_filename), original_filename
+
+    if remove_image and old_image_url:
+        await release(db, old_image_url)
+        return None, None
     # Если нового файла нет и старый не удалялся, возвращаем старый URL
-    # Или если удаляли старый, но не было нового файла (remove_image=True), то вернется None выше
-    return old_image_url if not remove_image else None
+    return old_image_url, None
 
 async def send_notifications(db: AsyncSession, event: Event, message: str, notification_type: str):
     # Создаем шаблон уведомления
@@ -211,6 +174,9 @@ async def send_notifications(db: AsyncSession, event: Event, message: str, notif
 
     await db.commit()
 
+    # Доставка в мессенджеры выполняется воркерами рассылки вне API-сервера
+    await enqueue_template_dispatch(template.id)
+
 # НОВАЯ модель Pydantic для обновления данных (только изменяемые поля)
 class EventUpdatePayload(BaseModel):
     title: str
@@ -247,6 +213,7 @@ class EventUpdatePayload(BaseModel):
         from_attributes = True
 
 @router.post("/", response_model=EventCreate)
+@idempotent("create_event", response_model=EventCreate)
 async def create_event(
     # Используем Form(...) для явного указания полей формы
     title: str = Form(...),
@@ -295,7 +262,7 @@ async def create_event(
         except ValueError as e:
             raise HTTPException(status_code=422, detail=f"Invalid data format: {e}")
 
-        image_url = await process_image(image_file, remove_image_bool)
+        image_url, pending_image = await process_image(db, image_file, remove_image_bool)
 
         event = Event(
             title=title,
@@ -304,6 +271,7 @@ async def create_event(
             end_date=end_date_dt,
             location=location,
             image_url=image_url,
+            variants_ready=pending_image is None,
             price=price_float,
             published=published,
             created_at=created_at_dt, # Устанавливаем текущее время
@@ -316,6 +284,7 @@ async def create_event(
         # Генерация и сохранение url_slug после получения id
         if url_slug:
             event.url_slug = generate_slug_with_id(url_slug, event.id, start_date_dt)
+        event.canonical_slug = build_canonical_slug(event.url_slug, event.title, event.start_date, event.id)
 
         ticket = TicketType(
             event_id=event.id,
@@ -329,6 +298,9 @@ async def create_event(
 
         await db.commit()
         await db.refresh(event, attribute_names=["tickets"])
+        await invalidate_event(event.id)
+        if pending_image:
+            image_pipeline.schedule(event.id, pending_image)
 
         if event.published and event.status != EventStatus.draft:
             await send_notifications(
@@ -340,8 +312,7 @@ async def create_event(
 
         await log_admin_activity(db, current_admin.id, request, action=f"create_event_{event.id}")
 
-        response_data = EventCreate.from_orm(event)
-        return response_data
+        return TrustedJSONResponse(EventCreate.model_validate(event))
 
     except HTTPException as http_exc:
         logger.error(f"HTTPException in create_event: {http_exc.detail}")
@@ -394,7 +365,7 @@ async def update_event(
              raise HTTPException(status_code=422, detail=f"Invalid form data: {validation_error}")
 
         # Ищем существующее событие
-        stmt = select(Event).where(Event.id == event_id).options(selectinload(Event.tickets))
+        stmt = select(Event).where(Event.id == event_id, Event.deleted_at.is_(None)).options(selectinload(Event.tickets))
         result = await db.execute(stmt)
         event = result.scalar_one_or_none()
 
@@ -415,7 +386,7 @@ async def update_event(
         # Обработка изображения
         old_image_url = event.image_url
         # Используем payload.remove_image (уже bool)
-        new_image_url = await process_image(image_file, payload.remove_image, old_image_url)
+        new_image_url, pending_image = await process_image(db, image_file, payload.remove_image, old_image_url)
 
         # Обновляем поля события данными из payload
         event.title = payload.title
@@ -424,6 +395,8 @@ async def update_event(
         event.end_date = end_date_dt
         event.location = payload.location
         event.image_url = new_image_url
+        if pending_image or not new_image_url:
+            event.variants_ready = pending_image is None
         event.price = payload.price
         event.published = payload.published
         event.status = payload.status
@@ -437,6 +410,8 @@ async def update_event(
             if new_base_slug != original_slug:
                 event.url_slug = new_base_slug
                 logger.info(f"URL slug updated for event {event_id} from '{original_slug}' to '{new_base_slug}'")
+        # Канонический slug зависит от названия, даты и базового slug - пересчитываем всегда
+        event.canonical_slug = build_canonical_slug(event.url_slug, event.title, event.start_date, event.id)
 
         # Обновляем или создаем тип билета
         ticket = event.tickets[0] if event.tickets else None
@@ -445,6 +420,10 @@ async def update_event(
             ticket.price = payload.price # Используем float из payload
             ticket.available_quantity = payload.ticket_type_available_quantity # Используем int из payload
             # sold_quantity не обновляется здесь
+            if ticket.shard_count > 0:
+                # Новая емкость перераспределяется по шардам остатка
+                await db.flush()
+                await configure_shards(db, ticket.id, ticket.shard_count)
         else:
             # Создаем новый билет, если его не было
             ticket = TicketType(
@@ -459,14 +438,18 @@ async def update_event(
 
         await db.commit()
         await db.refresh(event, attribute_names=["tickets"])
+        await invalidate_event(event.id)
+        if pending_image:
+            image_pipeline.schedule(event.id, pending_image)
+        if old_image_url and new_image_url != old_image_url:
+            await discard_media([old_image_url])
 
         # Логика уведомлений (если нужна)
 
         await log_admin_activity(db, current_admin.id, request, action=f"update_event_{event.id}")
 
         # Возвращаем данные в формате EventCreate
-        response_data = EventCreate.from_orm(event)
-        return response_data
+        return TrustedJSONResponse(EventCreate.model_validate(event))
 
     except HTTPException as http_exc:
         logger.error(f"HTTPException in update_event: {http_exc.detail}")
@@ -477,6 +460,15 @@ async def update_event(
         await db.rollback()
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal server error")
 
+@router.get("/images/pipeline")
+async def get_image_pipeline_metrics(
+    db: AsyncSession = Depends(get_async_db),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)
+):
+    """Состояние фоновой обработки изображений: очередь, ошибки и время этапов."""
+    await get_current_admin(credentials.credentials, db)
+    return image_pipeline.metrics()
+
 @router.get("/events", response_model=PaginatedResponse[EventCreate])
 async def get_admin_events(
     search: Optional[str] = Query(None),
@@ -487,6 +479,7 @@ async def get_admin_events(
     end_date_filter: Optional[str] = Query(None, alias="endDateFilter"),
     sort_by: Optional[str] = Query("published", alias="sortBy"),
     sort_order: Optional[str] = Query("desc", alias="sortOrder"),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_async_db),
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     request: Request = None
@@ -495,22 +488,43 @@ async def get_admin_events(
     if not admin:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    logger.info(f"Admin {admin.email} fetching events with params: search='{search}', statusFilter='{status_filter}', startDateFilter='{start_date_filter}', endDateFilter='{end_date_filter}', sortBy='{sort_by}', sortOrder='{sort_order}', skip={skip}, limit={limit}")
-
-    # Базовый запрос с LEFT JOIN к TicketType для сортировки по заполненности
-    base_query = select(Event).options(
-        selectinload(Event.tickets),
-        selectinload(Event.registrations)
-    ).outerjoin(TicketType, Event.id == TicketType.event_id)
+    logger.info(f"Admin {admin.email} fetching events with params: search='{search}', statusFilter='{status_filter}', startDateFilter='{start_date_filter}', endDateFilter='{end_date_filter}', sortBy='{sort_by}', sortOrder='{sort_order}', skip={skip}, limit={limit}, cursor={'yes' if cursor else 'no'}")
+
+    # Один запрос на страницу: первый тип билета через LATERAL (без размножения строк
+    # при нескольких типах) и число регистраций коррелированным подзапросом по индексу,
+    # чтобы стоимость страницы не зависела от количества участников мероприятий
+    first_ticket = (
+        select(
+            TicketType.name,
+            TicketType.price,
+            TicketType.available_quantity,
+            TicketType.sold_quantity,
+            TicketType.free_registration
+        )
+        .where(TicketType.event_id == Event.id)
+        .order_by(TicketType.id)
+        .limit(1)
+        .lateral("first_ticket")
+    )
+    registrations_count = (
+        select(func.count(Registration.id))
+        .where(Registration.event_id == Event.id)
+        .correlate(Event)
+        .scalar_subquery()
+    )
+    # Удаляемые мероприятия скрыты; ход удаления - GET /admin_edits/deletions/{job_id}
+    base_query = select(
+        Event, first_ticket, registrations_count.label("registrations_count")
+    ).outerjoin(first_ticket, true()).where(Event.deleted_at.is_(None))
 
-    # Запрос для подсчета общего количества (без join, т.к. он нужен только для сортировки)
-    count_base_query = select(func.count()).select_from(Event)
+    # Запрос для подсчета общего количества (без подзапросов, т.к. они нужны только для ответа)
+    count_base_query = select(func.count()).select_from(Event).where(Event.deleted_at.is_(None))
 
     # Применяем фильтры (к обоим запросам, где это применимо)
     filters = []
     if search:
-        search_term = f"%{search}%"
-        filters.append(Event.title.ilike(search_term))
+        # ILIKE '%...%' обслуживается триграммным GIN-индексом ix_events_title_trgm
+        filters.append(Event.title.ilike(like_pattern(search), escape="\\"))
 
     if start_date_filter:
         try:
@@ -550,29 +564,44 @@ async def get_admin_events(
 
     # --- Обновленная логика сортировки --- 
     sort_column = None
+    sort_name = sort_by
     if sort_by == "published":
-        sort_column = Event.published
+        sort_column = func.coalesce(Event.published, False)
     elif sort_by == "occupancy":
         # Сортируем по количеству проданных билетов. Используем coalesce на случай отсутствия билета.
-        sort_column = func.coalesce(TicketType.sold_quantity, 0)
+        sort_column = func.coalesce(first_ticket.c.sold_quantity, 0)
+    elif sort_by == "relevance" and search:
+        # Ранжирование по триграммному сходству названия с запросом
+        sort_column = func.similarity(Event.title, search)
     # created_at больше не опция
 
     # По умолчанию сортируем по published desc, если sort_by некорректный
     if sort_column is None:
-        sort_column = Event.published
+        sort_column = func.coalesce(Event.published, False)
+        sort_name = "published"
         order_func = desc # Явно ставим desc для дефолта
 
-    # Добавляем вторичную сортировку по ID для стабильности
-    query = base_query.order_by(order_func(sort_column), Event.id).offset(skip).limit(limit)
+    # Добавляем вторичную сортировку по ID для стабильности.
+    # Курсор продолжает выборку по ключу (sort_column, id); skip/OFFSET оставлен для старых клиентов
+    sort_keys = [(sort_column, order_func is desc), (Event.id, False)]
+    cursor_name = f"admin_events:{sort_name}"
+    query = apply_keyset(base_query.add_columns(sort_column.label("sort_key")), cursor_name, sort_keys, cursor)
+    if not cursor:
+        query = query.offset(skip)
     # --- Конец обновленной логики --- 
 
-    result = await db.execute(query)
-    events = result.scalars().unique().all()
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    cursor_out = next_cursor(cursor_name, sort_keys, (rows[-1].sort_key, rows[-1].Event.id) if has_more else None)
 
     event_responses = []
-    for event in events:
-        ticket = event.tickets[0] if event.tickets else None
-        remaining_quantity = ticket.available_quantity - ticket.sold_quantity if ticket else 0
+    for row in rows:
+        event = row.Event
+        # name у типа билета обязателен, поэтому None означает, что билета нет
+        ticket = row if row.name is not None else None
+        remaining_quantity = ticket.available_quantity - (ticket.sold_quantity or 0) if ticket else 0
         
         base_slug = generate_slug_with_id(event.url_slug or event.title, event.id, event.start_date)
         formatted_slug = f"{base_slug}-{event.start_date.year}-{event.id}" if base_slug else None
@@ -591,24 +620,27 @@ async def get_admin_events(
             updated_at=event.updated_at,
             status=event.status,
             url_slug=formatted_slug,
-            registrations_count=len(event.registrations),
+            registrations_count=row.registrations_count,
+            variants_ready=event.variants_ready,
             ticket_type=TicketTypeCreate(
                 name=ticket.name if ticket else None,
                 price=float(ticket.price) if ticket else 0.0,
                 available_quantity=ticket.available_quantity if ticket else 0,
                 free_registration=ticket.free_registration if ticket else False,
                 remaining_quantity=remaining_quantity,
-                sold_quantity=ticket.sold_quantity if ticket else 0
+                sold_quantity=ticket.sold_quantity or 0 if ticket else 0
             ) if ticket else None
         )
         event_responses.append(event_response)
 
-    return PaginatedResponse(
+    # Модели собраны из строк выборки - повторная проверка через response_model не нужна
+    return TrustedJSONResponse(PaginatedResponse[EventCreate](
         items=event_responses,
         total=total,
         skip=skip,
-        limit=limit
-    )
+        limit=limit,
+        next_cursor=cursor_out
+    ))
 
 @router.get("/users", response_model=PaginatedResponse[UserResponse])
 async def get_admin_users(
@@ -618,6 +650,7 @@ async def get_admin_users(
     # Параметры сортировки для пользователей
     sort_by: Optional[str] = Query("created_at", alias="sortBy"),
     sort_order: Optional[str] = Query("asc", alias="sortOrder"),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_async_db),
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     request: Request = None
@@ -626,19 +659,20 @@ async def get_admin_users(
     if not admin:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    logger.info(f"Admin {admin.email} fetching users with params: search='{search}', sortBy='{sort_by}', sortOrder='{sort_order}', skip={skip}, limit={limit}")
+    logger.info(f"Admin {admin.email} fetching users with params: search='{search}', sortBy='{sort_by}', sortOrder='{sort_order}', skip={skip}, limit={limit}, cursor={'yes' if cursor else 'no'}")
 
-    base_query = select(User).options(selectinload(User.activities))
-    count_query = select(func.count()).select_from(User)
+    base_query = select(User).options(selectinload(User.activities)).where(User.deleted_at.is_(None))
+    count_query = select(func.count()).select_from(User).where(User.deleted_at.is_(None))
 
     # Фильтр поиска
     if search:
-        search_term = f"%{search}%"
+        # Каждое условие обслуживается своим триграммным GIN-индексом (BitmapOr в плане)
+        search_term = like_pattern(search)
         search_filter = or_(
-            User.fio.ilike(search_term),
-            User.email.ilike(search_term),
-            User.telegram.ilike(search_term),
-            User.whatsapp.ilike(search_term)
+            User.fio.ilike(search_term, escape="\\"),
+            User.email.ilike(search_term, escape="\\"),
+            User.telegram.ilike(search_term, escape="\\"),
+            User.whatsapp.ilike(search_term, escape="\\")
         )
         base_query = base_query.where(search_filter)
         count_query = count_query.where(search_filter)
@@ -654,15 +688,36 @@ async def get_admin_users(
         "email": User.email
         # last_active требует доп. логики (join или subquery)
     }
-    sort_column = sort_column_map.get(sort_by, User.created_at)
+    sort_name = sort_by if sort_by in sort_column_map else "created_at"
+    sort_column = sort_column_map[sort_name]
 
     order_func = desc if sort_order == "desc" else asc
-    
-    # Добавляем вторичную сортировку по ID для стабильности
-    query = base_query.order_by(order_func(sort_column), asc(User.id)).offset(skip).limit(limit)
 
-    result = await db.execute(query)
-    users = result.scalars().unique().all()
+    if sort_by == "relevance" and search:
+        # Ранжирование по лучшему триграммному сходству среди полей поиска
+        sort_name = "relevance"
+        sort_column = func.greatest(
+            func.similarity(User.fio, search),
+            func.similarity(User.email, search),
+            func.similarity(User.telegram, search),
+            func.similarity(User.whatsapp, search)
+        )
+        order_func = desc
+    
+    # Добавляем вторичную сортировку по ID для стабильности.
+    # Курсор продолжает выборку по ключу (sort_column, id); skip/OFFSET оставлен для старых клиентов
+    sort_keys = [(sort_column, order_func is desc), (User.id, False)]
+    cursor_name = f"admin_users:{sort_name}"
+    query = apply_keyset(base_query.add_columns(sort_column.label("sort_key")), cursor_name, sort_keys, cursor)
+    if not cursor:
+        query = query.offset(skip)
+
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.unique().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    users = [row.User for row in rows]
+    cursor_out = next_cursor(cursor_name, sort_keys, (rows[-1].sort_key, rows[-1].User.id) if has_more else None)
 
     user_responses = []
     for user in users:
@@ -683,14 +738,15 @@ async def get_admin_users(
             )
         )
 
-    return PaginatedResponse(
+    return TrustedJSONResponse(PaginatedResponse[UserResponse](
         items=user_responses,
         total=total,
         skip=skip,
-        limit=limit
-    )
+        limit=limit,
+        next_cursor=cursor_out
+    ))
 
-@router.delete("/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
+@router.delete("/{event_id}", response_model=DeletionJobResponse, status_code=status.HTTP_202_ACCEPTED)
 async def delete_event(
     event_id: int,
     force: bool = False,
@@ -701,6 +757,8 @@ async def delete_event(
     """Удаление мероприятия (только в статусе черновик) с каскадным удалением связанных данных.
     
     Если параметр force=True, то мероприятие будет удалено вне зависимости от статуса.
+    Мероприятие сразу скрывается, а уведомления, регистрации, медиа и билеты удаляются
+    в фоне пакетами; ход удаления - GET /admin_edits/deletions/{job_id}.
     """
     try:
         token = credentials.credentials
@@ -708,63 +766,28 @@ async def delete_event(
         await log_admin_activity(db, current_admin.id, request, action=f"delete_event_{event_id}")
 
         # Проверка существования мероприятия
-        query = select(Event).where(Event.id == event_id)
+        query = select(Event).where(Event.id == event_id).with_for_update()
         result = await db.execute(query)
         event = result.scalar_one_or_none()
 
         if not event:
             raise HTTPException(status_code=404, detail="Мероприятие не найдено")
 
-        # Проверка статуса (пропускаем, если force=True)
-        if not force and event.status != EventStatus.draft:
+        # Проверка статуса (пропускаем, если force=True и при повторном запросе)
+        if not force and event.deleted_at is None and event.status != EventStatus.draft:
             raise HTTPException(status_code=400, detail="Мероприятие можно удалить только в статусе 'черновик'. Используйте параметр force=true для принудительного удаления.")
 
-        # 1. Находим и удаляем все NotificationView, связанные с шаблонами уведомлений для этого события
-        logger.info(f"Finding notification templates for event {event_id}")
-        notification_templates_query = select(NotificationTemplate).where(NotificationTemplate.event_id == event_id)
-        notification_templates = (await db.execute(notification_templates_query)).scalars().all()
-        
-        for template in notification_templates:
-            logger.info(f"Deleting notification views for template {template.id}")
-            notification_views_query = delete(NotificationView).where(NotificationView.template_id == template.id)
-            await db.execute(notification_views_query)
-        
-        # 2. Удаляем шаблоны уведомлений для этого события
-        logger.info(f"Deleting notification templates for event {event_id}")
-        notification_templates_query = delete(NotificationTemplate).where(NotificationTemplate.event_id == event_id)
-        await db.execute(notification_templates_query)
-
-        # 3. Удаляем все связанные регистрации
-        logger.info(f"Deleting registrations for event {event_id}")
-        registration_query = delete(Registration).where(Registration.event_id == event_id)
-        await db.execute(registration_query)
-        
-        # 4. Удаляем все связанные медиа
-        logger.info(f"Deleting media for event {event_id}")
-        media_query = delete(Media).where(Media.event_id == event_id)
-        await db.execute(media_query)
-
-        # 5. Удаляем все связанные типы билетов
-        logger.info(f"Deleting ticket types for event {event_id}")
-        ticket_query = delete(TicketType).where(TicketType.event_id == event_id)
-        await db.execute(ticket_query)
-
-        # 6. Удаляем файл изображения, если он существует
-        if event.image_url:
-            file_path = event.image_url.replace("/images/", "private_media/")
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                    logger.info(f"Удалён файл изображения: {file_path}")
-                except OSError as e:
-                    logger.warning(f"Не удалось удалить файл {file_path}: {str(e)}")
-
-        # 7. Удаляем само мероприятие
-        logger.info(f"Deleting event {event_id}")
-        await db.delete(event)
+        # Мягкое удаление: снятое с публикации мероприятие пропадает из выдачи и закрыто для регистрации
+        if event.deleted_at is None:
+            event.deleted_at = datetime.utcnow()
+            event.published = False
+        job = await create_deletion_job(db, "event", event_id, current_admin.id)
         await db.commit()
+        await invalidate_event(event_id)
+        deletion_worker.wake()
 
-        logger.info(f"Admin {current_admin.email} deleted event {event_id}")
+        logger.info(f"Admin {current_admin.email} scheduled deletion of event {event_id} (job {job.id})")
+        return job
     except HTTPException as e:
         await db.rollback()
         raise e
@@ -775,7 +798,55 @@ async def delete_event(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Не удалось удалить мероприятие: {str(e)}"
         )
-        
+
+@router.delete("/users/{user_id}", response_model=DeletionJobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def delete_user(
+    user_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    request: Request = None
+):
+    """Удаление аккаунта пользователя: вход запрещается сразу, связанные данные удаляются в фоне."""
+    try:
+        current_admin = await get_current_admin(credentials.credentials, db)
+        await log_admin_activity(db, current_admin.id, request, action=f"delete_user_{user_id}")
+
+        user = (await db.execute(select(User).where(User.id == user_id).with_for_update())).scalar_one_or_none()
+        if not user:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+        if user.deleted_at is None:
+            user.deleted_at = datetime.utcnow()
+        job = await create_deletion_job(db, "user", user_id, current_admin.id)
+        await db.commit()
+        deletion_worker.wake()
+
+        logger.info(f"Admin {current_admin.email} scheduled deletion of user {user_id} (job {job.id})")
+        return job
+    except HTTPException as e:
+        await db.rollback()
+        raise e
+    except Exception as e:
+        logger.error(f"Error deleting user {user_id}: {str(e)}")
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Не удалось удалить пользователя: {str(e)}"
+        )
+
+@router.get("/deletions/{job_id}", response_model=DeletionJobResponse)
+async def get_deletion_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)
+):
+    """Ход фонового удаления: текущий шаг и число удаленных строк по шагам."""
+    await get_current_admin(credentials.credentials, db)
+    job = await db.get(DeletionJob, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача удаления не найдена")
+    return job
+
 @router.get("/users/{user_id}", response_model=UserResponse)
 async def get_admin_user(
     user_id: int,
@@ -789,7 +860,7 @@ async def get_admin_user(
         current_admin = await get_current_admin(token, db)
         await log_admin_activity(db, current_admin.id, request, action=f"access_user_{user_id}")
 
-        query = select(User).where(User.id == user_id)
+        query = select(User).where(User.id == user_id, User.deleted_at.is_(None))
         result = await db.execute(query)
         user = result.scalar_one_or_none()
 
@@ -829,7 +900,7 @@ async def update_user(
         current_admin = await get_current_admin(token, db)
         await log_admin_activity(db, current_admin.id, request, action=f"update_user_{user_id}")
 
-        query = select(User).where(User.id == user_id)
+        query = select(User).where(User.id == user_id, User.deleted_at.is_(None))
         result = await db.execute(query)
         user = result.scalar_one_or_none()
 
@@ -858,6 +929,64 @@ async def update_user(
             detail=f"Не удалось обновить пользователя: {str(e)}"
         )   
             
+async def _ticket_inventory(db: AsyncSession, event_id: int) -> TicketInventoryResponse:
+    query = (
+        select(ticket_inventory, TicketType.shard_count)
+        .join(TicketType, TicketType.id == ticket_inventory.c.ticket_type_id)
+        .where(ticket_inventory.c.event_id == event_id)
+        .order_by(ticket_inventory.c.ticket_type_id)
+        .limit(1)
+    )
+    row = (await db.execute(query)).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Тип билета мероприятия не найден")
+    return TicketInventoryResponse(
+        ticket_type_id=row.ticket_type_id,
+        event_id=row.event_id,
+        shard_count=row.shard_count,
+        available_quantity=row.available_quantity,
+        sold_quantity=row.sold_quantity,
+        remaining_quantity=max(row.available_quantity - row.sold_quantity, 0)
+    )
+
+@router.get("/{event_id}/inventory", response_model=TicketInventoryResponse)
+async def get_event_inventory(
+    event_id: int,
+    db: AsyncSession = Depends(get_async_db),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme)
+):
+    """Точный остаток билетов мероприятия (через представление ticket_inventory)."""
+    await get_current_admin(credentials.credentials, db)
+    return await _ticket_inventory(db, event_id)
+
+@router.put("/{event_id}/inventory/shards", response_model=TicketInventoryResponse)
+async def update_event_inventory_shards(
+    event_id: int,
+    payload: InventoryShardsUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    request: Request = None
+):
+    """
+    Включение шардированного остатка для мероприятий с высоким спросом.
+    shard_count=0 возвращает остаток в одну строку ticket_types.
+    """
+    current_admin = await get_current_admin(credentials.credentials, db)
+    ticket_id = (await db.execute(
+        select(TicketType.id).where(TicketType.event_id == event_id).order_by(TicketType.id).limit(1)
+    )).scalar_one_or_none()
+    if ticket_id is None:
+        raise HTTPException(status_code=404, detail="Тип билета мероприятия не найден")
+    try:
+        await configure_shards(db, ticket_id, payload.shard_count)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    await log_admin_activity(db, current_admin.id, request, action=f"configure_inventory_shards_{event_id}")
+    await db.commit()
+    await invalidate_event(event_id)
+    logger.info(f"Admin {current_admin.email} set {payload.shard_count} inventory shards for event {event_id}")
+    return await _ticket_inventory(db, event_id)
+
 @router.get("/{event_id}", response_model=EventCreate)
 async def get_admin_event(
     event_id: int,
@@ -871,7 +1000,7 @@ async def get_admin_event(
         current_admin = await get_current_admin(token, db)
         await log_admin_activity(db, current_admin.id, request, action=f"access_event_{event_id}")
 
-        query = select(Event).where(Event.id == event_id).options(selectinload(Event.tickets))
+        query = select(Event).where(Event.id == event_id, Event.deleted_at.is_(None)).options(selectinload(Event.tickets))
         result = await db.execute(query)
         event = result.scalar_one_or_none()
 
@@ -894,7 +1023,8 @@ async def get_admin_event(
             "created_at": event.created_at,
             "updated_at": event.updated_at,
             "status": event.status,
-            "url_slug": event.url_slug
+            "url_slug": event.url_slug,
+            "variants_ready": event.variants_ready
         }
         if event.tickets:
             ticket = event.tickets[0]
@@ -906,7 +1036,7 @@ async def get_admin_event(
             }
 
         logger.info(f"Admin {current_admin.email} accessed event {event_id}")
-        return EventCreate(**event_dict)
+        return TrustedJSONResponse(EventCreate(**event_dict))
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -1,85 +1,159 @@
+import uuid
 from datetime import datetime
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Request
-from sqlalchemy import func
-from backend.database.user_db import AsyncSession, get_async_db, Event
+from typing import List, Optional, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from sqlalchemy import func, or_
+from backend.database.user_db import AsyncSession, get_async_db, Event, ticket_inventory
 from backend.config.logging_config import logger
+from backend.config.response_cache import EVENTS_LIST_TAG, CacheEntry, cache_get, cache_set, data_version
+from backend.config.event_cache import build_canonical_slug, event_detail_cache, slug_index
+from backend.config.inventory import current_sold
+from backend.config.pagination import apply_keyset, next_cursor
+from backend.config.http_cache import has_conditional_headers, is_not_modified, not_modified_response, validator_headers, weak_etag
+from constants import CACHE_CONTROL
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
+from backend.config.serialization import dump_json
 from backend.schemas_enums.schemas import EventCreate, TicketTypeCreate
 
 router = APIRouter()
 
+# Курсор следующей страницы публичного списка передается в заголовке, чтобы не менять формат ответа
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+EVENTS_SORT_KEYS = [(Event.start_date, True), (Event.id, True)]
+
+def _list_filters(start_date: Optional[str], end_date: Optional[str]) -> list:
+    """Условия отбора публичных мероприятий; общие для выборки и для расчета валидаторов."""
+    filters = [Event.status != "draft", Event.published == True]
+
+    # Improved date handling
+    if start_date:
+        try:
+            # Принимаем дату в формате YYYY-MM-DD
+            start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
+            
+            # Создаем datetime для начала этого дня (00:00:00)
+            start_datetime = datetime.combine(start_dt, datetime.min.time())
+            
+            logger.info(f"Filtering events with start_date >= {start_datetime}")
+            
+            # Применяем фильтр к полю start_date
+            filters.append(Event.start_date >= start_datetime)
+        except ValueError as e:
+            logger.error(f"Error parsing start_date '{start_date}': {str(e)}")
+            # Продолжаем запрос без этого фильтра, если парсинг даты не удался
+    
+    if end_date:
+        try:
+            # Принимаем дату в формате YYYY-MM-DD
+            end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
+            
+            # Создаем datetime для конца этого дня (23:59:59)
+            end_datetime = datetime.combine(end_dt, datetime.max.time())
+            
+            logger.info(f"Filtering events with start_date <= {end_datetime}")
+            
+            # Применяем фильтр к полю start_date
+            filters.append(Event.start_date <= end_datetime)
+        except ValueError as e:
+            logger.error(f"Error parsing end_date '{end_date}': {str(e)}")
+            # Продолжаем запрос без этого фильтра, если парсинг даты не удался
+    return filters
+
+
+async def list_validators(*key_parts) -> Tuple[str, Optional[datetime]]:
+    """
+    ETag и Last-Modified списка по версии каталога (без запросов к БД): версия меняется
+    при каждой инвалидации кэша мероприятий, в ETag входят все параметры запроса.
+    """
+    version = await data_version(EVENTS_LIST_TAG)
+    if version is None:
+        # Кэш недоступен: уникальный ETag, ответ 304 не отдается
+        return weak_etag("events", uuid.uuid4().hex), None
+    token, changed_at = version
+    return weak_etag("events", token, *key_parts), changed_at
+
+
+def _entry_validators(entry: CacheEntry) -> Tuple[str, Optional[datetime]]:
+    last_modified = entry.get("last_modified")
+    # Записи, сохраненные до появления валидаторов, получают ETag по телу ответа
+    etag = entry["etag"].decode() if "etag" in entry else weak_etag(entry["body"])
+    return etag, datetime.fromisoformat(last_modified.decode()) if last_modified else None
+
+
 # Маршрут для получения списка мероприятий (без авторизации)
 @router.get("", response_model=List[EventCreate])
 async def get_events(
+    request: Request,
     page: int = 1,
     limit: int = 6,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_async_db)
 ) -> List[EventCreate]:
+    cache_control = CACHE_CONTROL["events_list"]
     try:
-        offset = (page - 1) * limit
+        # Публичный список одинаков для всех посетителей, поэтому отдаем его из кэша.
+        # Кэш сбрасывается по тегу при изменении мероприятий и регистраций.
+        # При переданном курсоре page игнорируется, поэтому в ключ кэша он не входит
+        page_key = f"c{cursor}" if cursor else page
+        cache_key = f"events:list:{page_key}:{limit}:{start_date or ''}:{end_date or ''}"
+        cached = await cache_get(cache_key)
+        if cached is not None:
+            etag, last_modified = _entry_validators(cached)
+            if is_not_modified(request, etag, last_modified):
+                return not_modified_response(etag, last_modified, cache_control)
+            headers = validator_headers(etag, last_modified, cache_control)
+            if cached.get("next_cursor"):
+                headers[NEXT_CURSOR_HEADER] = cached["next_cursor"].decode()
+            return Response(content=cached["body"], media_type="application/json", headers=headers)
+
+        # Debug logs
+        logger.info(f"Request parameters: page={page}, limit={limit}, start_date={start_date}, end_date={end_date}")
+
+        # Валидаторы считаются до выборки: если клиент прислал актуальный ETag,
+        # отвечаем 304, не загружая и не сериализуя мероприятия
+        etag, last_modified = await list_validators(page_key, limit, start_date or "", end_date or "")
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified, cache_control)
+
+        filters = _list_filters(start_date, end_date)
+
         query = (
             select(Event)
-            .where(Event.status != "draft")
-            .where(Event.published == True)
+            .where(*filters)
             .options(selectinload(Event.tickets))
         )
 
-        # Debug logs
-        logger.info(f"Request parameters: page={page}, limit={limit}, start_date={start_date}, end_date={end_date}")
+        # Сортировка по убыванию; id делает порядок стабильным для курсора.
+        # Курсор (keyset) не зависит от глубины страницы, page/OFFSET оставлен для старых клиентов
+        query = apply_keyset(query, "events", EVENTS_SORT_KEYS, cursor)
+        if not cursor:
+            query = query.offset((page - 1) * limit)
 
-        # Improved date handling
-        if start_date:
-            try:
-                # Принимаем дату в формате YYYY-MM-DD
-                start_dt = datetime.strptime(start_date, "%Y-%m-%d").date()
-                
-                # Создаем datetime для начала этого дня (00:00:00)
-                start_datetime = datetime.combine(start_dt, datetime.min.time())
-                
-                logger.info(f"Filtering events with start_date >= {start_datetime}")
-                
-                # Применяем фильтр к полю start_date
-                query = query.where(Event.start_date >= start_datetime)
-            except ValueError as e:
-                logger.error(f"Error parsing start_date '{start_date}': {str(e)}")
-                # Продолжаем запрос без этого фильтра, если парсинг даты не удался
-        
-        if end_date:
-            try:
-                # Принимаем дату в формате YYYY-MM-DD
-                end_dt = datetime.strptime(end_date, "%Y-%m-%d").date()
-                
-                # Создаем datetime для конца этого дня (23:59:59)
-                end_datetime = datetime.combine(end_dt, datetime.max.time())
-                
-                logger.info(f"Filtering events with start_date <= {end_datetime}")
-                
-                # Применяем фильтр к полю start_date
-                query = query.where(Event.start_date <= end_datetime)
-            except ValueError as e:
-                logger.error(f"Error parsing end_date '{end_date}': {str(e)}")
-                # Продолжаем запрос без этого фильтра, если парсинг даты не удался
-
-        # Сортировка по убыванию
-        query = query.order_by(Event.start_date.desc())
-
-        # Execute query with pagination
-        result = await db.execute(query.offset(offset).limit(limit))
+        # Берем на одну запись больше, чтобы понять, есть ли следующая страница
+        result = await db.execute(query.limit(limit + 1))
         events = result.scalars().all()
+        has_more = len(events) > limit
+        events = events[:limit]
+        cursor_out = next_cursor(
+            "events", EVENTS_SORT_KEYS,
+            (events[-1].start_date, events[-1].id) if has_more else None
+        )
         
         # Log the events found
         logger.info(f"Found {len(events)} events matching the criteria")
         for event in events:
             logger.info(f"Event ID: {event.id}, Title: {event.title}, Start Date: {event.start_date}")
 
+        # Для шардированных билетов sold_quantity сводится с задержкой - берем точный остаток
+        sold = await current_sold(db, (event.tickets[0] for event in events if event.tickets))
+
         event_responses = []
         for event in events:
             ticket = event.tickets[0] if event.tickets else None
-            remaining_quantity = ticket.available_quantity - ticket.sold_quantity if ticket else 0
+            remaining_quantity = ticket.available_quantity - sold[ticket.id] if ticket else 0
             
             # Формируем канонический URL slug для списка мероприятий
             formatted_slug = None
@@ -113,7 +187,17 @@ async def get_events(
             )
             event_responses.append(event_response)
 
-        return event_responses
+        body = dump_json(event_responses, List[EventCreate])
+        entry = {"body": body, "etag": etag}
+        if last_modified is not None:
+            entry["last_modified"] = last_modified.isoformat()
+        if cursor_out:
+            entry["next_cursor"] = cursor_out
+        await cache_set(cache_key, entry, tags=[EVENTS_LIST_TAG])
+        headers = validator_headers(etag, last_modified, cache_control)
+        if cursor_out:
+            headers[NEXT_CURSOR_HEADER] = cursor_out
+        return Response(content=body, media_type="application/json", headers=headers)
 
     except HTTPException as e:
         raise e
@@ -122,107 +206,152 @@ async def get_events(
         raise HTTPException(status_code=500, detail="Ошибка сервера при загрузке мероприятий")
     
     
+async def resolve_event_id(slug_or_id: str, db: AsyncSession) -> Optional[int]:
+    """Определяет id мероприятия по числовому id, slug-индексу или одним запросом к БД."""
+    if slug_or_id.isdigit():
+        return int(slug_or_id)
+
+    event_id = slug_index.get(slug_or_id)
+    if event_id is not None:
+        return event_id
+
+    # Один индексный запрос: канонический slug (base-year-id) или базовый url_slug
+    result = await db.execute(
+        select(Event.id)
+        .where(or_(Event.canonical_slug == slug_or_id, Event.url_slug == slug_or_id))
+        .limit(1)
+    )
+    event_id = result.scalar_one_or_none()
+    if event_id is not None:
+        slug_index.put(slug_or_id, event_id)
+        return event_id
+
+    # Устаревший или неканонический slug: пробуем взять id из последней части (base-year-id)
+    parts = slug_or_id.split('-')
+    if len(parts) >= 2 and parts[-1].isdigit():
+        event_id = int(parts[-1])
+        logger.info(f"Extracted event ID {event_id} from slug {slug_or_id}")
+        return event_id
+    return None
+
+
+def event_etag(event_id: int, updated_at: Optional[datetime], sold: int, available: int) -> str:
+    return weak_etag("event", event_id, updated_at, sold, available)
+
+
+async def event_validators(event_id: int, db: AsyncSession) -> Optional[Tuple[str, Optional[datetime]]]:
+    """Валидаторы карточки без загрузки мероприятия (None - мероприятие не опубликовано)."""
+    result = await db.execute(
+        select(
+            Event.updated_at,
+            func.coalesce(func.sum(ticket_inventory.c.sold_quantity), 0),
+            func.coalesce(func.sum(ticket_inventory.c.available_quantity), 0),
+        )
+        .select_from(Event)
+        .outerjoin(ticket_inventory, ticket_inventory.c.event_id == Event.id)
+        .where(Event.id == event_id, Event.published == True)
+        .group_by(Event.id)
+    )
+    row = result.first()
+    if row is None:
+        return None
+    updated_at, sold, available = row
+    return event_etag(event_id, updated_at, sold, available), updated_at
+
+
+async def load_event_detail(event_id: int, db: AsyncSession) -> Optional[CacheEntry]:
+    """Загружает опубликованное мероприятие и сериализует ответ для кэша карточек."""
+    db_event = await db.get(Event, event_id, options=[selectinload(Event.tickets)])
+    if not db_event or not db_event.published:
+        return None
+
+    # Создаем словарь с данными мероприятия
+    event_dict = {
+        "id": db_event.id,
+        "title": db_event.title,
+        "description": db_event.description,
+        "start_date": db_event.start_date,
+        "end_date": db_event.end_date,
+        "location": db_event.location,
+        "image_url": db_event.image_url,
+        "price": float(db_event.price) if db_event.price is not None else 0.0,
+        "published": db_event.published,
+        "created_at": db_event.created_at,
+        "updated_at": db_event.updated_at,
+        "status": db_event.status,
+    }
+
+    sold_by_ticket = await current_sold(db, db_event.tickets)
+    if db_event.tickets and len(db_event.tickets) > 0:
+        ticket = db_event.tickets[0]
+        remaining_quantity = ticket.available_quantity - sold_by_ticket[ticket.id]
+        event_dict["ticket_type"] = TicketTypeCreate(
+            name=ticket.name,
+            price=float(ticket.price),
+            available_quantity=ticket.available_quantity,
+            free_registration=ticket.free_registration,
+            remaining_quantity=remaining_quantity,
+            sold_quantity=sold_by_ticket[ticket.id]
+        ).model_dump()
+
+    # Канонический slug хранится в БД; для старых записей без него формируем на лету
+    event_dict["url_slug"] = db_event.canonical_slug or build_canonical_slug(
+        db_event.url_slug, db_event.title, db_event.start_date, db_event.id
+    )
+    if not db_event.canonical_slug:
+        logger.info(f"No canonical_slug in database, generated: {event_dict['url_slug']} for event {db_event.id}")
+
+    sold = sum(sold_by_ticket.values())
+    available = sum(t.available_quantity or 0 for t in db_event.tickets)
+    entry = {
+        "body": EventCreate(**event_dict).model_dump_json().encode(),
+        "canonical_slug": event_dict["url_slug"],
+        "etag": event_etag(db_event.id, db_event.updated_at, sold, available),
+    }
+    if db_event.updated_at is not None:
+        entry["last_modified"] = db_event.updated_at.isoformat()
+    return entry
+
+
 @router.get("/{slug_or_id}", response_model=EventCreate)
 async def get_event(
     slug_or_id: str,
     db: AsyncSession = Depends(get_async_db),
     request: Request = None
 ):
+    cache_control = CACHE_CONTROL["event_detail"]
     try:
-        db_event = None
-        accessed_by_id = False
-        
-        # Если это числовой ID, ищем по ID
-        if slug_or_id.isdigit():
-            db_event = await db.get(Event, int(slug_or_id), options=[selectinload(Event.tickets)])
-            accessed_by_id = True
-        else:
-            # Сначала пытаемся найти по точному соответствию url_slug
-            query = select(Event).where(Event.url_slug == slug_or_id).options(selectinload(Event.tickets))
-            result = await db.execute(query)
-            db_event = result.scalars().first()
-            
-            # Если не найдено по slug, проверяем является ли это составным слагом (base-year-id)
-            if not db_event:
-                parts = slug_or_id.split('-')
-                if len(parts) >= 2 and parts[-1].isdigit():
-                    # Получаем ID из последней части slug
-                    event_id = int(parts[-1])
-                    logger.info(f"Extracted event ID {event_id} from slug {slug_or_id}")
-                    
-                    # Ищем мероприятие по ID
-                    db_event = await db.get(Event, event_id, options=[selectinload(Event.tickets)])
-                    
-                    # Если мероприятие найдено, проверяем соответствует ли запрошенный slug каноническому
-                    if db_event and db_event.url_slug:
-                        # Получаем год из даты начала события
-                        event_year = db_event.start_date.year
-                        
-                        # Формируем полный канонический url_slug
-                        canonical_slug = f"{db_event.url_slug}-{event_year}-{db_event.id}"
-                        
-                        # Если запрошенный slug не соответствует каноническому - 
-                        # вместо 404 ошибки просто записываем предупреждение и возвращаем событие
-                        # с правильным url_slug, чтобы клиент мог выполнить перенаправление
-                        if canonical_slug != slug_or_id:
-                            logger.warning(f"Non-canonical slug: {slug_or_id}, canonical: {canonical_slug}")
-                            # Продолжаем выполнение, клиент выполнит перенаправление
-        
-        if not db_event or not db_event.published:
+        event_id = await resolve_event_id(slug_or_id, db)
+        if event_id is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found or not published")
-        
-        # Создаем словарь с данными мероприятия
-        event_dict = {
-            "id": db_event.id,
-            "title": db_event.title,
-            "description": db_event.description,
-            "start_date": db_event.start_date,
-            "end_date": db_event.end_date,
-            "location": db_event.location,
-            "image_url": db_event.image_url,
-            "price": float(db_event.price) if db_event.price is not None else 0.0,
-            "published": db_event.published,
-            "created_at": db_event.created_at,
-            "updated_at": db_event.updated_at,
-            "status": db_event.status,
-        }
-
-        if db_event.tickets and len(db_event.tickets) > 0:
-            ticket = db_event.tickets[0]
-            remaining_quantity = ticket.available_quantity - ticket.sold_quantity
-            event_dict["ticket_type"] = TicketTypeCreate(
-                name=ticket.name,
-                price=float(ticket.price),
-                available_quantity=ticket.available_quantity,
-                free_registration=ticket.free_registration,
-                remaining_quantity=remaining_quantity,
-                sold_quantity=ticket.sold_quantity
-            ).model_dump()
-        
-        # Формируем канонический URL slug для ответа
-        if db_event.url_slug:
-            # Получаем год из даты начала события
-            event_year = db_event.start_date.year
-            
-            # Формируем полный url_slug в формате base-year-id
-            formatted_slug = f"{db_event.url_slug}-{event_year}-{db_event.id}"
-            
-            # Добавляем в ответ
-            event_dict["url_slug"] = formatted_slug
-            
-            # Если был доступ по ID, логируем информацию о каноническом URL
-            if accessed_by_id:
-                logger.info(f"Accessed by ID {db_event.id}, canonical slug is: {formatted_slug}")
-        else:
-            # Формируем временный slug из названия
-            base_slug = db_event.title.lower().replace(' ', '-')
-            event_year = db_event.start_date.year
-            formatted_slug = f"{base_slug}-{event_year}-{db_event.id}"
-            event_dict["url_slug"] = formatted_slug
-            logger.info(f"No url_slug in database, generated: {formatted_slug} for event {db_event.id}")
-        
-        logger.info(f"Public request for event {db_event.id} with url_slug: {event_dict['url_slug']}")
-        return EventCreate(**event_dict)
+
+        entry = await event_detail_cache.peek(event_id)
+        if entry is None and has_conditional_headers(request):
+            # Карточки нет в кэше, но у клиента есть копия: проверяем ее дешевым запросом
+            validators = await event_validators(event_id, db)
+            if validators is not None and is_not_modified(request, *validators):
+                return not_modified_response(*validators, cache_control)
+
+        # При всплеске трафика на одно мероприятие в БД уходит одна загрузка,
+        # остальные запросы ждут ее результат или берут карточку из кэша
+        if entry is None:
+            entry = await event_detail_cache.get_or_load(event_id, lambda: load_event_detail(event_id, db))
+        if entry is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found or not published")
+
+        canonical_slug = entry["canonical_slug"].decode()
+        if not slug_or_id.isdigit() and canonical_slug != slug_or_id:
+            # Вместо 404 ошибки записываем предупреждение и возвращаем событие
+            # с правильным url_slug, чтобы клиент мог выполнить перенаправление
+            logger.warning(f"Non-canonical slug: {slug_or_id}, canonical: {canonical_slug}")
+
+        etag, last_modified = _entry_validators(entry)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified_response(etag, last_modified, cache_control)
+
+        logger.info(f"Public request for event {event_id} with url_slug: {canonical_slug}")
+        return Response(content=entry["body"], media_type="application/json",
+                        headers=validator_headers(etag, last_modified, cache_control))
     except HTTPException as e:
         raise e
     except ValueError:
@@ -232,4 +361,4 @@ async def get_event(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Failed to retrieve event: {str(e)}"
-        )
\ No newline at end of file
+        )
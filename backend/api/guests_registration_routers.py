@@ -1,128 +1,267 @@
 # backend/api/guests_registration_routers.py
-from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from backend.database.user_db import AsyncSession, Event, get_async_db, Registration, TicketType
+from backend.database.user_db import AsyncSession, Event, get_async_db, Registration
+from backend.config.inventory import (
+    cancel_and_release, close_registration, confirm_hold, release_hold, reopen_registration, reserve_and_register
+)
 from backend.config.auth import get_current_user, log_user_activity
 from sqlalchemy.future import select
+from sqlalchemy.exc import IntegrityError
 from backend.config.logging_config import logger
-from backend.schemas_enums.schemas import RegistrationRequest, CancelRegistrationRequest, RegistrationResponse
+from backend.config.response_cache import invalidate_event_caches
+from backend.config.idempotency import idempotent
+from backend.config.ticket_holds import TICKET_HOLD_TTL_SECONDS, track_hold, untrack_hold
+from backend.config.waiting_room import WAITING_ROOM_ENABLED, is_admitted, join_queue, queue_status
+from backend.schemas_enums.schemas import RegistrationRequest, CancelRegistrationRequest, RegistrationResponse, QueueJoinRequest, QueueStatusResponse, TicketHoldRequest, TicketHoldResponse
 from backend.schemas_enums.enums import EventStatus, Status
-from sqlalchemy import func
-from typing import Callable, List
+from typing import Callable, List, Optional
+from constants import MAX_REGISTRATION_CANCELLATIONS
 
 router = APIRouter()
 bearer_scheme = HTTPBearer()
 
+@router.post("/queue/join", response_model=QueueStatusResponse)
+async def join_registration_queue(
+    data: QueueJoinRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Встать в очередь на регистрацию (повторный вызов возвращает тот же номер)."""
+    current_user = await get_current_user(credentials.credentials, db)
+    if not WAITING_ROOM_ENABLED:
+        # Очередь выключена - регистрация доступна сразу
+        return QueueStatusResponse(event_id=data.event_id, position=0, ahead=0, admitted=True)
+    return QueueStatusResponse(**await join_queue(data.event_id, current_user.id))
+
+@router.get("/queue/status", response_model=QueueStatusResponse)
+async def get_registration_queue_status(token: str = Query(..., description="Токен очереди из /queue/join")):
+    """Статус в очереди. Не требует авторизации и не обращается к БД: личность подтверждает подписанный токен."""
+    queue_state = await queue_status(token)
+    if queue_state is None:
+        raise HTTPException(status_code=400, detail="Недействительный токен очереди")
+    return QueueStatusResponse(**queue_state)
+
+async def _registration_conflict_reason(db: AsyncSession, user_id: int, event_id: int) -> str:
+    """Причина отказа для клиента; запрос выполняется только при неудачной регистрации."""
+    result = await db.execute(
+        select(Registration.status, Registration.cancellation_count)
+        .where(Registration.user_id == user_id, Registration.event_id == event_id)
+    )
+    regs = result.all()
+    if regs and all(reg.status == Status.cancelled for reg in regs) and \
+            max(reg.cancellation_count for reg in regs) >= MAX_REGISTRATION_CANCELLATIONS:
+        return f"Превышен лимит отмен регистраций на это мероприятие (максимум {MAX_REGISTRATION_CANCELLATIONS})"
+    return "Вы уже зарегистрированы на это мероприятие"
+
+async def _reserve_seat(
+    db: AsyncSession,
+    current_user,
+    request: Request,
+    queue_token: Optional[str],
+    *,
+    event_id: int,
+    user_id: int,
+    action: str,
+    reg_status: Status = Status.approved,
+    hold_expires_at: Optional[datetime] = None
+):
+    """
+    Общая часть регистрации и брони: проверки, резервирование места и запись регистрации.
+    Транзакцию фиксирует вызывающий код.
+    """
+    # При включенной очереди регистрация принимается только с действующим допуском
+    if WAITING_ROOM_ENABLED and not is_admitted(queue_token, event_id, current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Регистрация проходит через очередь. Встаньте в очередь и дождитесь допуска",
+            headers={"Retry-After": "1"}
+        )
+    
+    # Логируем действие пользователя до резервирования, чтобы строка билета
+    # была заблокирована только на время одной команды и коммита
+    await log_user_activity(db, current_user.id, request, action=action)
+    
+    # Создаем номер билета
+    ticket_number = f"{event_id}-{user_id}"
+    
+    # Резервирование места и запись регистрации одной командой: условный UPDATE остатка
+    # и INSERT ... ON CONFLICT (или реактивация отмененной регистрации) в одном запросе.
+    # Повторную регистрацию отклоняет уникальный индекс активных регистраций
+    try:
+        reserved = await reserve_and_register(
+            db,
+            user_id=user_id,
+            event_id=event_id,
+            ticket_number=ticket_number,
+            status=reg_status,
+            hold_expires_at=hold_expires_at
+        )
+    except IntegrityError:
+        # Реактивация отмененной регистрации столкнулась с параллельно созданной активной
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Вы уже зарегистрированы на это мероприятие")
+    
+    if reserved is None:
+        # Мест нет или регистрация закрыта - уточняем причину для клиента
+        await db.rollback()
+        event = await db.get(Event, event_id)
+        if not event or event.status != EventStatus.registration_open:
+            raise HTTPException(status_code=400, detail="Регистрация на это мероприятие недоступна")
+        await close_registration(db, event_id)
+        await db.commit()
+        await invalidate_event_caches(event_id)
+        raise HTTPException(status_code=400, detail="Билеты на это мероприятие распроданы")
+    
+    if reserved.registration_id is None:
+        # Регистрацию записать нельзя - откатываем резерв места и уточняем причину
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=await _registration_conflict_reason(db, user_id, event_id))
+    
+    # Проверяем, не закончились ли билеты после этой регистрации
+    if reserved.sold_quantity >= reserved.available_quantity:
+        await close_registration(db, event_id)
+    
+    return reserved, ticket_number
+
 @router.post("/register", response_model=RegistrationResponse)
+@idempotent("register_for_event", response_model=RegistrationResponse)
 async def register_for_event(
     data: RegistrationRequest,
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     db: AsyncSession = Depends(get_async_db),
-    request: Request = None
+    request: Request = None,
+    queue_token: Optional[str] = Header(None, alias="X-Queue-Token")
 ):
     token = credentials.credentials
     current_user = await get_current_user(token, db)
     event_id = data.event_id
     user_id = data.user_id
     
-    # Проверка существующей активной регистрации
-    existing_active_reg = await db.execute(
-        select(Registration).where(
-            Registration.user_id == user_id,
-            Registration.event_id == event_id,
-            Registration.status != Status.cancelled.name
-        )
+    reserved, ticket_number = await _reserve_seat(
+        db, current_user, request, queue_token,
+        event_id=event_id, user_id=user_id, action="register_for_event"
     )
     
-    if existing_active_reg.scalars().first():
-        raise HTTPException(status_code=400, detail="Вы уже зарегистрированы на это мероприятие")
+    await db.commit()
+    # Изменилось количество оставшихся мест - сбрасываем кэш публичных ответов
+    await invalidate_event_caches(event_id)
     
-    # Проверяем, есть ли отмененная регистрация для этого пользователя и мероприятия
-    cancelled_reg_query = await db.execute(
-        select(Registration).where(
-            Registration.user_id == user_id,
-            Registration.event_id == event_id,
-            Registration.status == Status.cancelled.name
-        ).order_by(Registration.submission_time.desc())
+    return RegistrationResponse(
+        message="Регистрация успешно завершена",
+        id=reserved.registration_id,
+        event_id=event_id,
+        user_id=user_id,
+        ticket_type=reserved.name, # Используем имя типа билета
+        status=Status.approved.name,
+        ticket_number=ticket_number # Возвращаем актуальный номер билета
     )
+
+@router.post("/hold", response_model=TicketHoldResponse)
+@idempotent("hold_ticket", response_model=TicketHoldResponse)
+async def hold_ticket(
+    data: TicketHoldRequest,
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+    request: Request = None,
+    queue_token: Optional[str] = Header(None, alias="X-Queue-Token")
+):
+    """
+    Временная бронь места на TICKET_HOLD_TTL_SECONDS для оплаты.
+    Место списывается из остатка сразу, бронь нужно подтвердить до истечения срока,
+    иначе место вернется в продажу автоматически.
+    """
+    current_user = await get_current_user(credentials.credentials, db)
+    event_id = data.event_id
+    expires_at = datetime.utcnow() + timedelta(seconds=TICKET_HOLD_TTL_SECONDS)
     
-    cancelled_reg = cancelled_reg_query.scalars().first()
+    reserved, ticket_number = await _reserve_seat(
+        db, current_user, request, queue_token,
+        event_id=event_id, user_id=current_user.id, action="hold_ticket",
+        reg_status=Status.pending, hold_expires_at=expires_at
+    )
     
-    # Проверка лимита отмен регистраций
-    if cancelled_reg and cancelled_reg.cancellation_count >= 3:
-        raise HTTPException(status_code=400, detail="Превышен лимит отмен регистраций на это мероприятие (максимум 3)")
+    if reserved.free_registration:
+        # Бесплатному билету оплата не нужна - бронь сразу становится регистрацией
+        await confirm_hold(db, reserved.registration_id, current_user.id, mark_paid=True)
+        expires_at = None
     
-    # Получаем данные о мероприятии и билете
-    event = await db.get(Event, event_id)
-    if not event or event.status.value != "registration_open":
-        raise HTTPException(status_code=400, detail="Регистрация на это мероприятие недоступна")
+    await db.commit()
+    await invalidate_event_caches(event_id)
+    if expires_at is not None:
+        await track_hold(reserved.registration_id)
     
-    # Получаем доступный билет
-    ticket_query = await db.execute(
-        select(TicketType).where(TicketType.event_id == event_id)
+    logger.info(f"Ticket hold {reserved.registration_id} created for user {current_user.id}, event {event_id}")
+    return TicketHoldResponse(
+        id=reserved.registration_id,
+        event_id=event_id,
+        ticket_type=reserved.name,
+        ticket_number=ticket_number,
+        amount=0 if reserved.free_registration else reserved.price,
+        status=Status.pending.name if expires_at else Status.approved.name,
+        expires_at=expires_at
     )
-    ticket = ticket_query.scalars().first()
-    
-    if not ticket or ticket.available_quantity <= ticket.sold_quantity:
-        event.status = EventStatus.registration_closed
-        raise HTTPException(status_code=400, detail="Билеты на это мероприятие распроданы")
-    
-    # Создаем номер билета
-    ticket_number = f"{event_id}-{user_id}"
+
+@router.post("/hold/{hold_id}/confirm", response_model=RegistrationResponse)
+@idempotent("confirm_ticket_hold", response_model=RegistrationResponse)
+async def confirm_ticket_hold(
+    hold_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+    request: Request = None
+):
+    """
+    Подтверждение брони: место закрепляется за пользователем, остаток билетов не меняется.
+    Отметку об оплате (payment_status) этот эндпоинт не ставит - как и при обычной регистрации,
+    ее ставит администратор после проверки платежа.
+    """
+    current_user = await get_current_user(credentials.credentials, db)
     
-    # Если есть отмененная регистрация, обновляем ее, иначе создаем новую
-    if cancelled_reg:
-        # Обновляем существующую отмененную регистрацию
-        cancelled_reg.status = Status.approved.name
-        cancelled_reg.ticket_type_id = ticket.id
-        cancelled_reg.ticket_number = ticket_number
-        cancelled_reg.payment_status = ticket.free_registration
-        cancelled_reg.amount_paid = 0 if ticket.free_registration else ticket.price
-        cancelled_reg.submission_time = datetime.utcnow()  # Обновляем время регистрации
-        registration = cancelled_reg
-    else:
-        # Регистрируем нового участника
-        registration = Registration(
-            user_id=user_id,
-            event_id=event_id,
-            ticket_type_id=ticket.id,
-            ticket_number=ticket_number,
-            payment_status=ticket.free_registration,
-            status=Status.approved.name,
-            amount_paid=0 if ticket.free_registration else ticket.price,
-            cancellation_count=0
-        )
-        db.add(registration)
+    confirmed = await confirm_hold(db, hold_id, current_user.id)
+    if confirmed is None:
+        await db.rollback()
+        raise HTTPException(status_code=410, detail="Бронь не найдена или срок ее действия истек")
     
-    # Обновляем счетчик проданных билетов только если регистрация действительно новая или реактивированная
-    if registration.status == Status.approved.name: # Проверяем финальный статус
-        ticket.sold_quantity += 1
+    await log_user_activity(db, current_user.id, request, action="confirm_ticket_hold")
+    await db.commit()
+    await untrack_hold(hold_id)
     
-    # Проверяем, не закончились ли билеты после этой регистрации
-    if ticket.available_quantity <= ticket.sold_quantity:
-        event.status = EventStatus.registration_closed
+    logger.info(f"Ticket hold {hold_id} confirmed by user {current_user.id}")
+    return RegistrationResponse(
+        message="Регистрация успешно завершена",
+        id=confirmed.id,
+        event_id=confirmed.event_id,
+        user_id=current_user.id,
+        status=Status.approved.name,
+        ticket_number=confirmed.ticket_number
+    )
+
+@router.delete("/hold/{hold_id}", response_model=RegistrationResponse)
+async def release_ticket_hold(
+    hold_id: int,
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Отказ от брони до оплаты: место сразу возвращается в продажу, лимит отмен не расходуется."""
+    current_user = await get_current_user(credentials.credentials, db)
     
-    # Логируем действие пользователя
-    await log_user_activity(db, current_user.id, request, action="register_for_event")
+    released = await release_hold(db, hold_id, user_id=current_user.id)
+    if released is None:
+        await db.rollback()
+        raise HTTPException(status_code=404, detail="Активная бронь не найдена")
     
+    if released.available_quantity is not None and released.available_quantity > released.sold_quantity:
+        await reopen_registration(db, released.event_id)
     await db.commit()
-    await db.refresh(registration) # Обновляем объект регистрации после коммита
-    # Убедимся, что ticket тоже обновлен, если его статус менялся
-    if event.status == EventStatus.registration_closed:
-        await db.refresh(event)
-    await db.refresh(ticket)
+    await untrack_hold(hold_id)
+    await invalidate_event_caches(released.event_id)
     
-    return RegistrationResponse(
-        id=registration.id,
-        event_id=registration.event_id,
-        user_id=registration.user_id,
-        ticket_type=ticket.name, # Используем имя типа билета
-        status=registration.status,
-        ticket_number=ticket_number # Возвращаем актуальный номер билета
-    )
+    logger.info(f"Ticket hold {hold_id} released by user {current_user.id}")
+    return RegistrationResponse(message="Бронь отменена", id=hold_id, event_id=released.event_id)
 
 @router.post("/cancel", response_model=RegistrationResponse)
+@idempotent("cancel_registration", response_model=RegistrationResponse)
 async def cancel_registration(
     data: CancelRegistrationRequest,
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
@@ -139,26 +278,9 @@ async def cancel_registration(
     event_id = data.event_id
     user_id = data.user_id
 
-    # Проверка существующей регистрации
-    registration_query = await db.execute(
-        select(Registration).where(
-            Registration.user_id == user_id,
-            Registration.event_id == event_id,
-            Registration.status != Status.cancelled.name  # Используем .name
-        )
-    )
-    registration = registration_query.scalars().first()
-    
-    if not registration:
-        logger.warning(f"Active registration not found for user_id={user_id}, event_id={event_id}")
-        raise HTTPException(status_code=404, detail="Активная регистрация не найдена")
-    
-    # Получаем информацию о билете и мероприятии
-    ticket = await db.get(TicketType, registration.ticket_type_id)
     event = await db.get(Event, event_id)
-    
-    if not ticket or not event:
-        logger.error(f"Ticket or event not found: ticket_id={registration.ticket_type_id}, event_id={event_id}")
+    if not event:
+        logger.error(f"Event not found: event_id={event_id}")
         raise HTTPException(status_code=404, detail="Билет или мероприятие не найдены")
     
     # Проверяем, можно ли отменить регистрацию
@@ -166,22 +288,24 @@ async def cancel_registration(
         logger.warning(f"Cannot cancel registration for completed event: event_id={event_id}")
         raise HTTPException(status_code=400, detail="Нельзя отменить регистрацию на завершенное мероприятие")
     
-    logger.info(f"Processing cancellation for registration_id={registration.id}")
-    
-    # Уменьшаем счетчик проданных билетов
-    ticket.sold_quantity -= 1
+    # Логируем действие пользователя
+    await log_user_activity(db, current_user.id, request, action="cancel_registration")
     
-    # Если мероприятие было закрыто из-за отсутствия мест, открываем его снова
-    if event.status.value == "registration_closed" and ticket.available_quantity > ticket.sold_quantity:
-        event.status = EventStatus.registration_open
+    # Отмена регистрации и возврат места в остаток одной командой (условные UPDATE ... RETURNING)
+    cancelled = await cancel_and_release(db, user_id=user_id, event_id=event_id)
+    if cancelled is None:
+        await db.rollback()
+        logger.warning(f"Active registration not found for user_id={user_id}, event_id={event_id}")
+        raise HTTPException(status_code=404, detail="Активная регистрация не найдена")
     
-    # Обновляем запись о регистрации вместо удаления
-    registration.status = Status.cancelled.name  # Используем .name для получения строкового значения
-    registration.cancellation_count += 1
+    logger.info(f"Processing cancellation for registration_id={cancelled.registration_id}")
     
-    # Логируем действие пользователя
-    await log_user_activity(db, current_user.id, request, action="cancel_registration")
+    # Если мероприятие было закрыто из-за отсутствия мест, открываем его снова
+    if cancelled.available_quantity is not None and cancelled.available_quantity > cancelled.sold_quantity:
+        await reopen_registration(db, event_id)
     
     await db.commit()
-    logger.info(f"Registration successfully cancelled: id={registration.id}, event_id={event_id}, user_id={user_id}")
+    await invalidate_event_caches(event_id)
+    registration_id = cancelled.registration_id
+    logger.info(f"Registration successfully cancelled: id={registration_id}, event_id={event_id}, user_id={user_id}")
     return RegistrationResponse(message="Регистрация успешно отменена")
\ No newline at end of file
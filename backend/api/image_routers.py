@@ -0,0 +1,118 @@
+# backend/api/image_routers.py
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import FileResponse
+from starlette.convertors import Convertor, register_url_convertor
+
+from backend.config.image_cache import image_cache
+from backend.config.image_pipeline import image_pipeline
+from backend.config.image_variants import AVIF_SUPPORTED, OUTPUT_FORMATS, render_resized
+from backend.config.logging_config import logger
+from backend.config.media_store import media_files, media_relpath
+from backend.config.storage import storage
+from constants import CACHE_CONTROL, IMAGE_DEFAULT_WIDTH, IMAGE_QUALITY, IMAGE_WIDTHS
+
+router = APIRouter()
+
+
+class MediaIdConvertor(Convertor):
+    """id изображения: sha256 объекта хранилища или uuid старых загрузок. Имена файлов с версией не совпадают."""
+    regex = "[0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+
+    def convert(self, value: str) -> str:
+        return value
+
+    def to_string(self, value: str) -> str:
+        return value
+
+
+register_url_convertor("media_id", MediaIdConvertor())
+
+# Порядок предпочтения при согласовании формата по Accept
+NEGOTIATION_ORDER = (["avif"] if AVIF_SUPPORTED else []) + ["webp"]
+
+
+def snap_width(width: Optional[int]) -> int:
+    """Округляет запрошенную ширину вверх до ближайшей разрешенной."""
+    if width is None:
+        return IMAGE_DEFAULT_WIDTH
+    for allowed in IMAGE_WIDTHS:
+        if allowed >= width:
+            return allowed
+    return IMAGE_WIDTHS[-1]
+
+
+def negotiate_format(accept: str) -> str:
+    """Выбирает AVIF/WebP по заголовку Accept; JPEG понимают все клиенты."""
+    accepted = {}
+    for part in accept.split(","):
+        media_type, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_type.strip().lower()] = quality
+    for fmt in NEGOTIATION_ORDER:
+        if accepted.get(OUTPUT_FORMATS[fmt][1], 0) > 0:
+            return fmt
+    return "jpeg"
+
+
+# Источник для масштабирования по убыванию качества
+SOURCE_VARIANTS = ("original", "large", "medium", "thumb")
+
+
+async def find_source(image_id: str) -> Optional[str]:
+    """Ключ оригинала в хранилище; для загрузок без оригинала - самой крупной из версий."""
+    if len(image_id) == 64:
+        # Объект хранилища: файлы берутся из манифеста, без перечисления хранилища
+        files = await media_files(image_id) or {}
+        for variant in SOURCE_VARIANTS:
+            if variant in files and await storage.exists(media_relpath(files[variant])):
+                return media_relpath(files[variant])
+        return None
+    for prefix in (f"{image_id}_original.", f"{image_id}_large.webp", f"{image_id}_medium.webp"):
+        async for stored in storage.iter_objects(prefix):
+            return stored.key
+    return None
+
+
+@router.get("/images/{image_id:media_id}")
+async def get_resized_image(
+    image_id: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=10000, description="Ширина, округляется до разрешенной"),
+    fmt: Optional[str] = Query(None, pattern="^(avif|webp|jpeg)$", description="Формат; по умолчанию - по Accept"),
+):
+    """
+    Версия изображения нужной ширины. Каждая версия генерируется один раз и хранится
+    в дисковом LRU-кэше; ответы неизменны и кэшируются клиентами и CDN на год.
+    """
+    if fmt == "avif" and not AVIF_SUPPORTED:
+        raise HTTPException(status_code=406, detail="AVIF не поддерживается сервером")
+    negotiated = fmt is None
+    output_format = fmt or negotiate_format(request.headers.get("accept", ""))
+    width = snap_width(w)
+    cache_key = f"{image_id}_w{width}.{output_format}"
+
+    async def generate() -> bytes:
+        source_key = await find_source(image_id)
+        if source_key is None:
+            raise HTTPException(status_code=404, detail="Изображение не найдено")
+        async with storage.fetch(source_key) as source_path:
+            content = await image_pipeline.run(
+                render_resized, source_path, width, output_format, IMAGE_QUALITY[output_format]
+            )
+        logger.info(f"Generated image variant {cache_key} ({len(content)} bytes)")
+        return content
+
+    path = await image_cache.get_or_create(cache_key, generate)
+    headers = {"Cache-Control": CACHE_CONTROL["images"]}
+    if negotiated:
+        headers["Vary"] = "Accept"
+    return FileResponse(path, media_type=OUTPUT_FORMATS[output_format][1], headers=headers)
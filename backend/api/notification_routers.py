@@ -7,6 +7,8 @@ from typing import Optional, List
 from backend.database.user_db import get_async_db, NotificationTemplate, NotificationView, User, UserActivity, Event
 from backend.config.auth import generate_device_fingerprint, get_current_user, log_user_activity
 from backend.config.logging_config import logger
+from backend.config.notification_buffer import notification_view_buffer
+from backend.dispatch.queue import enqueue_template_dispatch
 from backend.schemas_enums.schemas import NotificationViewResponse
 from datetime import datetime
 
@@ -51,6 +53,11 @@ async def get_public_notifications(
         result = await db.execute(query)
         notifications = result.all()
 
+        # Отметки о просмотре, которые еще лежат в write-behind буфере
+        pending_views = notification_view_buffer.pending_for(
+            current_user.id if current_user else None, device_fingerprint
+        )
+
         response = []
         for template, view in notifications:
             if not view and template:
@@ -65,14 +72,20 @@ async def get_public_notifications(
                 await db.commit()
                 await db.refresh(view)
 
+            is_viewed = view.is_viewed if view else False
+            viewed_at = view.viewed_at if view else None
+            if not is_viewed and template.id in pending_views:
+                is_viewed = True
+                viewed_at = pending_views[template.id]
+
             response.append(
                 NotificationViewResponse(
                     id=view.id if view else None,
                     template_id=template.id,
                     user_id=view.user_id if view else current_user.id if current_user else None,
                     fingerprint=view.fingerprint if view else device_fingerprint if not current_user else None,
-                    is_viewed=view.is_viewed if view else False,
-                    viewed_at=view.viewed_at if view else None,
+                    is_viewed=is_viewed,
+                    viewed_at=viewed_at,
                     created_at=view.created_at if view else template.created_at,
                 )
             )
@@ -90,6 +103,9 @@ async def get_public_notifications(
         logger.error(f"Error retrieving notifications: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve notifications")
 
+# Максимальное количество шаблонов в одном пакетном запросе
+MAX_VIEW_BATCH_SIZE = 500
+
 @router.post("/notifications/view")
 async def mark_notification_viewed(
     template_id: int = Body(...),
@@ -99,31 +115,15 @@ async def mark_notification_viewed(
 ):
     try:
         device_fingerprint = generate_device_fingerprint(request)
+        # Отметка попадает в write-behind буфер и будет записана в БД пачкой
+        notification_view_buffer.mark(current_user.id if current_user else None, device_fingerprint, [template_id])
         if current_user:
-            stmt = (
-                update(NotificationView)
-                .where(NotificationView.template_id == template_id)
-                .where(NotificationView.user_id == current_user.id)
-                .values(is_viewed=True, viewed_at=datetime.utcnow())
-            )
-            result = await db.execute(stmt)
-            if result.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Notification not found for this user")
             await log_user_activity(db, current_user.id, request, action=f"view_notification_{template_id}")
+            await db.commit()
             logger.info(f"User {current_user.email} marked notification {template_id} as viewed")
         else:
-            stmt = (
-                update(NotificationView)
-                .where(NotificationView.template_id == template_id)
-                .where(NotificationView.fingerprint == device_fingerprint)
-                .values(is_viewed=True, viewed_at=datetime.utcnow())
-            )
-            result = await db.execute(stmt)
-            if result.rowcount == 0:
-                raise HTTPException(status_code=404, detail="Notification not found for this device")
             logger.info(f"Notification {template_id} marked as viewed for fingerprint: {device_fingerprint}")
 
-        await db.commit()
         return {"message": "Notification marked as viewed"}
     except HTTPException as e:
         raise e
@@ -132,6 +132,42 @@ async def mark_notification_viewed(
         await db.rollback()
         raise HTTPException(status_code=500, detail="Failed to mark notification as viewed")
 
+@router.post("/notifications/view/batch")
+async def mark_notifications_viewed_batch(
+    template_ids: List[int] = Body(..., embed=True),
+    db: AsyncSession = Depends(get_async_db),
+    current_user=Depends(get_current_user_optional),
+    request: Request = None
+):
+    """Пакетная отметка уведомлений как просмотренных."""
+    unique_ids = list(dict.fromkeys(template_ids))
+    if len(unique_ids) > MAX_VIEW_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"Too many notifications in one batch (max {MAX_VIEW_BATCH_SIZE})")
+    try:
+        device_fingerprint = generate_device_fingerprint(request)
+        viewed_at = notification_view_buffer.mark(
+            current_user.id if current_user else None, device_fingerprint, unique_ids
+        )
+        if current_user:
+            await log_user_activity(db, current_user.id, request, action="view_notifications_batch")
+            await db.commit()
+            logger.info(f"User {current_user.email} marked {len(unique_ids)} notifications as viewed")
+        else:
+            logger.info(f"{len(unique_ids)} notifications marked as viewed for fingerprint: {device_fingerprint}")
+
+        return {
+            "message": f"Marked {len(unique_ids)} notifications as viewed",
+            "template_ids": unique_ids,
+            "is_viewed": True,
+            "viewed_at": viewed_at,
+        }
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error marking notifications {unique_ids} as viewed: {str(e)}")
+        await db.rollback()
+        raise HTTPException(status_code=500, detail="Failed to mark notifications as viewed")
+
 @router.post("/notifications/rebind")
 async def rebind_notifications(
     fingerprint: str = Body(...),
@@ -142,6 +178,7 @@ async def rebind_notifications(
     try:
         token = credentials.credentials
         current_user = await get_current_user(token, db)
+        notification_view_buffer.rebind(fingerprint, current_user.id)
         
         stmt = (
             update(NotificationView)
@@ -215,6 +252,7 @@ async def send_event_notification(
                 db.add(view)
 
         await db.commit()
+        await enqueue_template_dispatch(template.id)
         await log_user_activity(db, current_user.id, request, action=f"send_notification_event_{event_id}")
         logger.info(f"Admin {current_user.email} sent notification for event {event_id}")
         return {"message": "Notification sent successfully"}
@@ -266,6 +304,7 @@ async def clear_notifications(
 ):
     try:
         device_fingerprint = generate_device_fingerprint(request)
+        notification_view_buffer.discard(current_user.id if current_user else None, device_fingerprint)
         if current_user:
             stmt = delete(NotificationView).where(NotificationView.user_id == current_user.id)
             result = await db.execute(stmt)
@@ -0,0 +1,64 @@
+# backend/api/telegram_routers.py
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import update
+
+from backend.config.auth import get_current_user, log_user_activity
+from backend.config.logging_config import logger
+from backend.config.telegram_link import (
+    TELEGRAM_LINK_TTL, TELEGRAM_WEBHOOK_SECRET, consume_link, create_link
+)
+from backend.database.user_db import AsyncSession, User, get_async_db
+from backend.schemas_enums.schemas import TelegramLinkResponse
+
+router = APIRouter()
+bearer_scheme = HTTPBearer()
+
+
+@router.post("/link", response_model=TelegramLinkResponse)
+async def create_telegram_link(
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    db: AsyncSession = Depends(get_async_db),
+    request: Request = None
+) -> TelegramLinkResponse:
+    """Ссылка на бота для привязки чата: после "/start" бот сможет присылать рассылки."""
+    current_user = await get_current_user(credentials.credentials, db)
+    url = await create_link(current_user.id)
+    if url is None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Бот Telegram не настроен")
+    await log_user_activity(db, current_user.id, request, action="telegram_link")
+    return TelegramLinkResponse(url=url, expires_in=TELEGRAM_LINK_TTL, linked=current_user.telegram_chat_id is not None)
+
+
+@router.post("/webhook")
+async def telegram_webhook(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    secret_token: str = Header("", alias="X-Telegram-Bot-Api-Secret-Token"),
+):
+    """Обновления бота: сохраняет chat_id пользователя по "/start <токен>" из ссылки привязки."""
+    if not TELEGRAM_WEBHOOK_SECRET or not hmac.compare_digest(secret_token, TELEGRAM_WEBHOOK_SECRET):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+
+    update_data = await request.json()
+    message = update_data.get("message") or {}
+    chat = message.get("chat") or {}
+    parts = (message.get("text") or "").split()
+    # Привязываются только личные чаты; остальные обновления подтверждаем без обработки
+    if len(parts) != 2 or parts[0] != "/start" or chat.get("type") != "private":
+        return {"ok": True}
+
+    user_id = await consume_link(parts[1])
+    if user_id is None:
+        logger.info(f"Telegram /start with unknown or expired link token from chat {chat.get('id')}")
+        return {"ok": True}
+
+    # Чат может быть привязан только к одному пользователю: переносим его на нового владельца
+    await db.execute(update(User).where(User.telegram_chat_id == chat["id"], User.id != user_id).values(telegram_chat_id=None))
+    await db.execute(update(User).where(User.id == user_id).values(telegram_chat_id=chat["id"]))
+    await db.commit()
+    logger.info(f"Telegram chat linked for user {user_id}")
+    # Ответ webhook выполняется как вызов Bot API: подтверждение уходит пользователю в тот же чат
+    return {"method": "sendMessage", "chat_id": chat["id"], "text": "Уведомления подключены"}
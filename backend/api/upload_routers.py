@@ -0,0 +1,145 @@
+# backend/api/upload_routers.py
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import select
+
+from backend.config.auth import get_current_admin, log_admin_activity
+from backend.config.event_cache import invalidate_event
+from backend.config.image_pipeline import image_pipeline
+from backend.config.logging_config import logger
+from backend.config.media_store import acquire, discard_media, media_id_from_url, media_relpath, media_url, release
+from backend.config.storage import storage
+from backend.config.upload_intents import create_intent, read_intent, receive_direct_upload, verify_uploaded
+from backend.database.user_db import AsyncSession, Event, Media, get_async_db
+from backend.schemas_enums.enums import MediaType
+from backend.schemas_enums.schemas import (
+    UploadCompleteRequest, UploadCompleteResponse, UploadIntentRequest, UploadIntentResponse
+)
+
+router = APIRouter()
+bearer_scheme = HTTPBearer()
+
+
+@router.post("/intents", response_model=UploadIntentResponse)
+async def create_upload_intent(
+    payload: UploadIntentRequest,
+    db: AsyncSession = Depends(get_async_db),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+):
+    """
+    Заявка на загрузку: клиент передает тип, размер и sha256 файла и получает URL, по которому
+    загружает файл напрямую в хранилище, затем вызывает /uploads/complete с токеном заявки.
+    """
+    current_admin = await get_current_admin(credentials.credentials, db)
+    event_exists = (await db.execute(select(Event.id).where(Event.id == payload.event_id, Event.deleted_at.is_(None)))).scalar_one_or_none()
+    if event_exists is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Мероприятие не найдено")
+    return await create_intent(
+        payload.target, payload.event_id, payload.content_type, payload.size, payload.sha256, current_admin.id
+    )
+
+
+@router.put("/{token}", status_code=status.HTTP_204_NO_CONTENT)
+async def put_upload(token: str, request: Request):
+    """
+    Прием файла для локального хранилища; с S3 клиент загружает файл по подписанному URL бакета
+    и этот эндпоинт не используется. Авторизация - подписанный токен заявки.
+    """
+    intent = read_intent(token)
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) != intent["size"]:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Размер файла не совпадает с заявкой")
+    await receive_direct_upload(intent, request.stream())
+
+
+@router.post("/complete", response_model=UploadCompleteResponse)
+async def complete_upload(
+    payload: UploadCompleteRequest,
+    db: AsyncSession = Depends(get_async_db),
+    credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
+    request: Request = None
+):
+    """
+    Завершение загрузки: регистрирует объект хранилища и привязывает его к мероприятию -
+    как обложку (версии строятся в фоне) или как фото/видео галереи (запись Media).
+    """
+    current_admin = await get_current_admin(credentials.credentials, db)
+    intent = read_intent(payload.token)
+    if intent["admin_id"] != current_admin.id:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Заявка на загрузку выдана другому администратору")
+    await verify_uploaded(intent)
+
+    filename = intent["filename"]
+    media_id = media_id_from_url(filename)
+    extension = filename.rsplit(".", 1)[1]
+    try:
+        event = (await db.execute(
+            select(Event).where(Event.id == intent["event_id"], Event.deleted_at.is_(None)).with_for_update()
+        )).scalar_one_or_none()
+        if event is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Мероприятие не найдено")
+
+        media_type = MediaType.video if intent["target"] == "event_video" else MediaType.photo
+        if intent["target"] != "event_image":
+            # Повтор завершения (ретрай клиента, тот же токен): запись галереи уже есть - возвращаем ее
+            # без второй ссылки на объект. Строка мероприятия заблокирована, параллельные повторы ждут
+            existing = (await db.execute(
+                select(Media).where(Media.event_id == event.id, Media.url == media_url(filename), Media.type == media_type)
+                .order_by(Media.id).limit(1)
+            )).scalar_one_or_none()
+            if existing is not None:
+                await db.rollback()
+                logger.info(f"Upload {filename} already completed for event {event.id} (media {existing.id})")
+                return UploadCompleteResponse(url=existing.url, media_id=media_id, event_id=event.id, record_id=existing.id)
+
+        await acquire(db, media_id, extension, intent["size"])
+        # Строка объекта заблокирована acquire: если очистка успела удалить файл до этого, он не вернется
+        if not await storage.exists(media_relpath(filename)):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Файл удален, загрузите его заново")
+
+        if intent["target"] == "event_image":
+            old_image_url = event.image_url
+            # Повтор завершения для той же обложки идемпотентен: acquire и release одного объекта взаимно гасятся
+            await release(db, old_image_url)
+            pending_image = None
+            if not (old_image_url and media_id_from_url(old_image_url) == media_id):
+                # Как при загрузке через форму: до готовности версий отдается оригинал
+                event.image_url = media_url(filename)
+                event.variants_ready = False
+                pending_image = filename
+            event.updated_at = datetime.utcnow()
+            await db.commit()
+            await invalidate_event(event.id)
+            if pending_image:
+                image_pipeline.schedule(event.id, pending_image)
+            if old_image_url and old_image_url != event.image_url:
+                await discard_media([old_image_url])
+            response = UploadCompleteResponse(
+                url=event.image_url, media_id=media_id, event_id=event.id, variants_pending=pending_image is not None
+            )
+        else:
+            media = Media(
+                event_id=event.id,
+                admin_uploaded_by_id=current_admin.id,
+                type=media_type,
+                url=media_url(filename),
+                caption=payload.caption,
+                approved=True,
+            )
+            db.add(media)
+            await db.commit()
+            # Фото галереи масштабируются по запросу (/images/{id}?w=); видео отдается как загружено
+            response = UploadCompleteResponse(url=media.url, media_id=media_id, event_id=event.id, record_id=media.id)
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        logger.error(f"Error completing upload {filename}: {e!r}")
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Не удалось завершить загрузку")
+
+    logger.info(f"Admin {current_admin.email} completed direct upload {filename} ({intent['target']}, event {intent['event_id']})")
+    await log_admin_activity(db, current_admin.id, request, action=f"upload_{intent['target']}_{intent['event_id']}")
+    return response
@@ -8,6 +8,7 @@ from backend.config.logging_config import logger
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from datetime import timedelta
 from backend.config.rate_limiter import rate_limit
+from backend.config.notification_buffer import notification_view_buffer
 from sqlalchemy import update, select
 from sqlalchemy.sql.expression import desc
 
@@ -43,6 +44,7 @@ async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_d
         
         # Перепривязка уведомлений от фингерпринта к user_id
         device_fingerprint = generate_device_fingerprint(request)
+        notification_view_buffer.rebind(device_fingerprint, new_user.id)
         stmt = (
             update(NotificationView)
             .where(NotificationView.fingerprint == device_fingerprint)
@@ -71,6 +73,9 @@ async def register_user(user: UserCreate, db: AsyncSession = Depends(get_async_d
 async def login_user(user: UserLogin, db: AsyncSession = Depends(get_async_db), request: Request = None):
     """Авторизация пользователя с возвратом токена и данных пользователя, перепривязка уведомлений."""
     db_user = await get_user_by_username(db, user.email)
+    if db_user and db_user.deleted_at is not None:
+        # Аккаунт удаляется: вход запрещен, активность не записывается
+        db_user = None
     if not db_user or not pwd_context.verify(user.password, db_user.password_hash):
         if db_user:
             await log_user_activity(db, db_user.id, request, action="login_failed")
@@ -87,6 +92,7 @@ async def login_user(user: UserLogin, db: AsyncSession = Depends(get_async_db),
     
     try:
         device_fingerprint = generate_device_fingerprint(request)
+        notification_view_buffer.rebind(device_fingerprint, db_user.id)
         stmt = (
             update(NotificationView)
             .where(NotificationView.fingerprint == device_fingerprint)
@@ -7,10 +7,15 @@ from backend.schemas_enums.schemas import UserResponse, UserUpdate
 from backend.database.user_db import AsyncSession, get_async_db, User
 from backend.config.auth import get_current_user, log_user_activity
 from backend.config.logging_config import logger
+from backend.config.idempotency import idempotent
+from backend.config.uploads import MAX_AVATAR_UPLOAD_BYTES
+from backend.config.image_pipeline import image_pipeline
+from backend.config.image_variants import render_avatar
+from backend.config.media_store import discard_media, media_id_from_url, media_relpath, media_url, record_variants, release, store_upload
+from backend.config.storage import storage
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
-import uuid
-from constants import USERS_AVATARS_DIR, BASE_DIR
+from constants import AVATAR_THUMBNAIL_SIZE
 
 router = APIRouter()
 bearer_scheme = HTTPBearer()
@@ -27,26 +32,17 @@ async def update_user_profile(
         current_user = await get_current_user(token, db)
         
         update_data = user_data.dict(exclude_unset=True, exclude={'email'})
+        released_avatar_url = None
         
         # Handle avatar removal if requested
         if update_data.get('remove_avatar'):
             logger.info(f"User {current_user.email} requested avatar removal")
             
-            # Delete the avatar file if it exists
+            # Release the avatar; its files are deleted after commit if nothing else references them
             if current_user.avatar_url:
-                # Extract filename from URL
-                avatar_filename = current_user.avatar_url.split('/')[-1]
-                avatar_path = os.path.join(USERS_AVATARS_DIR, avatar_filename)
-                
-                if os.path.exists(avatar_path):
-                    try:
-                        os.remove(avatar_path)
-                        logger.info(f"Deleted avatar file: {avatar_path}")
-                    except OSError as e:
-                        logger.warning(f"Failed to delete avatar file {avatar_path}: {str(e)}")
-                else:
-                    logger.warning(f"Avatar file not found at path: {avatar_path}")
-                
+                released_avatar_url = current_user.avatar_url
+                await release(db, released_avatar_url)
+
                 # Set avatar_url to None in the database
                 current_user.avatar_url = None
                 logger.info(f"Set avatar_url to None for user {current_user.email}")
@@ -66,6 +62,9 @@ async def update_user_profile(
         await db.commit()
         await db.refresh(current_user)
 
+        if released_avatar_url:
+            await discard_media([released_avatar_url])
+
         await log_user_activity(db, current_user.id, request, action="update_profile")
         logger.info(f"User {current_user.email} updated their profile")
         return current_user
@@ -80,6 +79,7 @@ async def update_user_profile(
         )
 
 @router.post("/upload-avatar", response_model=UserResponse)
+@idempotent("upload_avatar", response_model=UserResponse)
 async def upload_user_avatar(
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_async_db),
@@ -90,48 +90,46 @@ async def upload_user_avatar(
         token = credentials.credentials
         current_user = await get_current_user(token, db)
 
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Только изображения разрешены"
-            )
-
-        os.makedirs(USERS_AVATARS_DIR, exist_ok=True)
+        # Загрузка пишется на диск частями с проверкой размера и сигнатуры файла;
+        # одинаковые файлы хранятся один раз под sha256 содержимого
+        original_filename = await store_upload(
+            db, file,
+            max_bytes=MAX_AVATAR_UPLOAD_BYTES,
+            allowed_types=("jpg", "png", "webp", "gif"),
+        )
 
-        # Удаляем старый аватар, если он существует
-        if current_user.avatar_url:
-            # Извлекаем имя файла из URL
-            avatar_filename = current_user.avatar_url.split('/')[-1]  # Например, "old_filename.jpg"
-            old_file_path = os.path.join(USERS_AVATARS_DIR, avatar_filename)  # Путь: private_media/users_avatars/old_filename.jpg
-            
-            if os.path.exists(old_file_path):
+        # Отдается миниатюра, а не загруженный оригинал; декодирование - в пуле процессов
+        media_id = media_id_from_url(original_filename)
+        thumbnail_filename = f"{media_id}_thumb.webp"
+        thumbnail_key = media_relpath(thumbnail_filename)
+        if not await storage.exists(thumbnail_key):
+            async with storage.fetch(media_relpath(original_filename)) as source_path, storage.staging() as work_dir:
+                thumbnail_path = os.path.join(work_dir, thumbnail_filename)
                 try:
-                    os.remove(old_file_path)
-                    logger.info(f"Удалён старый аватар: {old_file_path}")
-                except OSError as e:
-                    logger.warning(f"Не удалось удалить старый аватар {old_file_path}: {str(e)}")
-            else:
-                logger.warning(f"Старый аватар не найден по пути: {old_file_path}")
-            current_user.avatar_url = None  # Очищаем старый URL сразу
+                    await image_pipeline.run(render_avatar, source_path, thumbnail_path, AVATAR_THUMBNAIL_SIZE)
+                except Exception as e:
+                    # Файл без ссылок останется в хранилище до сборщика мусора
+                    logger.warning(f"Failed to build avatar thumbnail from {original_filename}: {e!r}")
+                    await db.rollback()
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Файл не является изображением"
+                    )
+                await storage.put_file(thumbnail_key, thumbnail_path)
+        await record_variants(db, media_id, {"thumb": thumbnail_filename})
 
-        # Загружаем новый аватар
-        file_extension = file.filename.split('.')[-1]
-        unique_filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(USERS_AVATARS_DIR, unique_filename)
-        
-        content = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(content)
+        # Ссылка переносится со старого аватара; его файлы удаляются после коммита
+        old_avatar_url = current_user.avatar_url
+        avatar_url = media_url(thumbnail_filename)
+        await release(db, old_avatar_url)
 
-        avatar_url = f"/images/users_avatars/{unique_filename}"
-        if not avatar_url.startswith('/'):
-            avatar_url = f"/{avatar_url}"  # Double-ensure leading slash
-            
         current_user.avatar_url = avatar_url
         await db.commit()
         await db.refresh(current_user)
 
         logger.info(f"User {current_user.email} uploaded new avatar: {avatar_url}")
+        if old_avatar_url and old_avatar_url != avatar_url:
+            await discard_media([old_avatar_url])
         
         await log_user_activity(db, current_user.id, request, action="upload_avatar")
         return current_user
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Request, Query
 from sqlalchemy import select, func
 from backend.schemas_enums.schemas import UserTicketResponse
@@ -7,17 +7,22 @@ from backend.config.auth import get_current_user, log_user_activity
 from backend.config.logging_config import logger
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import selectinload
+from backend.config.pagination import apply_keyset, next_cursor
+from backend.config.serialization import TrustedJSONResponse
 
 router = APIRouter()
 bearer_scheme = HTTPBearer()
 
+TICKETS_SORT_KEYS = [(Registration.submission_time, True), (Registration.id, True)]
+
 @router.get("/my-tickets", response_model=Dict[str, Any])
 async def get_user_tickets(
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     db: AsyncSession = Depends(get_async_db),
     request: Request = None,
     page: int = Query(1, ge=1, description="Номер страницы"),
-    per_page: int = Query(10, ge=1, le=100, description="Количество билетов на странице")
+    per_page: int = Query(10, ge=1, le=100, description="Количество билетов на странице"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (вместо page)")
 ) -> Dict[str, Any]:
     """
     Get all tickets for the current user with pagination.
@@ -38,7 +43,8 @@ async def get_user_tickets(
         total_count_result = await db.execute(count_query)
         total_count = total_count_result.scalar_one()
 
-        # Query registrations for the current user with event and ticket type details, applying pagination
+        # Query registrations for the current user with event and ticket type details, applying pagination.
+        # Cursor pagination continues after (submission_time, id); page/OFFSET is kept for old clients
         offset = (page - 1) * per_page
         query = (
             select(Registration)
@@ -46,12 +52,18 @@ async def get_user_tickets(
             .join(Event)
             .join(TicketType)
             .options(selectinload(Registration.event), selectinload(Registration.ticket_type))
-            .order_by(Registration.submission_time.desc())
-            .offset(offset)
-            .limit(per_page)
         )
-        result = await db.execute(query)
+        query = apply_keyset(query, "my_tickets", TICKETS_SORT_KEYS, cursor)
+        if not cursor:
+            query = query.offset(offset)
+        result = await db.execute(query.limit(per_page + 1))
         registrations = result.scalars().all()
+        has_more = len(registrations) > per_page
+        registrations = registrations[:per_page]
+        cursor_out = next_cursor(
+            "my_tickets", TICKETS_SORT_KEYS,
+            (registrations[-1].submission_time, registrations[-1].id) if has_more else None
+        )
         
         # Log user activity
         await log_user_activity(db, current_user.id, request, action="view_tickets")
@@ -76,13 +88,15 @@ async def get_user_tickets(
             for registration in registrations
         ]
 
-        return {
+        # Билеты уже проверены при создании моделей: response_model не проверяет их повторно
+        return TrustedJSONResponse({
             "tickets": tickets_response,
             "total_count": total_count,
             "page": page,
             "per_page": per_page,
-            "has_more": (offset + len(registrations)) < total_count
-        }
+            "has_more": has_more,
+            "next_cursor": cursor_out
+        })
     except HTTPException as e:
         raise e
     except Exception as e:
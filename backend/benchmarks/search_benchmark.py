@@ -0,0 +1,134 @@
+# backend/benchmarks/search_benchmark.py
+# Сравнение поиска пользователей ILIKE '%...%' без индексов и с триграммными GIN-индексами.
+# Запуск: python backend/benchmarks/search_benchmark.py --rows 1000000
+# Данные генерируются в отдельной таблице bench_search_users, рабочие таблицы не затрагиваются.
+#
+# Результаты (PostgreSQL 18.6 локально, 1 vCPU, 1 000 000 строк, медиана из 5 запросов, два прогона, мс):
+#   запрос         без индекса      pg_trgm
+#   user_777777    1254 / 985       80 / 32
+#   ова 12345      1382 / 1264      16 / 6
+#   @mail          4958 / 4092      4593 / 3937
+#   7916123        1746 / 1244      16 / 7
+# Редкие подстроки ускоряются в 15-200 раз (bitmap scan по GIN вместо полного прохода).
+# "@mail" совпадает с третью таблицы: индекс почти ничего не отсекает, и время уходит
+# на similarity() и сортировку по ней - такие частые подстроки индекс не ускоряет.
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine
+
+TABLE = "bench_search_users"
+SEARCH_COLUMNS = ("fio", "email", "telegram", "whatsapp")
+# Редкие и частые подстроки: точное совпадение по нику, часть фамилии, домен почты
+SEARCH_TERMS = ("user_777777", "ова 12345", "@mail", "7916123")
+
+SEARCH_SQL = f"""
+SELECT id, fio, email,
+       greatest({", ".join(f"similarity({c}, :raw)" for c in SEARCH_COLUMNS)}) AS rank
+FROM {TABLE}
+WHERE {" OR ".join(f"{c} ILIKE :term" for c in SEARCH_COLUMNS)}
+ORDER BY rank DESC, id
+LIMIT 20
+"""
+
+
+async def prepare_table(conn, rows: int) -> None:
+    await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    await conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+    await conn.execute(text(f"""
+        CREATE TABLE {TABLE} (
+            id SERIAL PRIMARY KEY,
+            fio VARCHAR(255) NOT NULL,
+            email VARCHAR(255) NOT NULL,
+            telegram VARCHAR(255) NOT NULL,
+            whatsapp VARCHAR(255) NOT NULL
+        )
+    """))
+    await conn.execute(text(f"""
+        INSERT INTO {TABLE} (fio, email, telegram, whatsapp)
+        SELECT
+            (ARRAY['Иванова','Петров','Смирнова','Кузнецов','Попова','Соколов'])[1 + g % 6]
+                || ' ' || g || ' ' || md5(g::text),
+            'user' || g || '@' || (ARRAY['mail.ru','gmail.com','yandex.ru'])[1 + g % 3],
+            'user_' || g,
+            '79' || lpad((g::bigint * 7919 % 1000000000)::text, 9, '0')
+        FROM generate_series(1, :rows) AS g
+    """), {"rows": rows})
+    await conn.execute(text(f"ANALYZE {TABLE}"))
+
+
+async def create_trgm_indexes(conn) -> None:
+    for column in SEARCH_COLUMNS:
+        await conn.execute(text(
+            f"CREATE INDEX ix_{TABLE}_{column}_trgm ON {TABLE} USING gin ({column} gin_trgm_ops)"
+        ))
+    await conn.execute(text(f"ANALYZE {TABLE}"))
+
+
+async def measure(conn, repeats: int) -> dict:
+    results = {}
+    for term in SEARCH_TERMS:
+        params = {"term": f"%{term}%", "raw": term}
+        timings = []
+        for _ in range(repeats):
+            started = time.perf_counter()
+            await conn.execute(text(SEARCH_SQL), params)
+            timings.append((time.perf_counter() - started) * 1000)
+        plan = await conn.execute(text("EXPLAIN " + SEARCH_SQL), params)
+        uses_index = any("Bitmap Index Scan" in row[0] for row in plan)
+        results[term] = {"median_ms": statistics.median(timings), "index": uses_index}
+    return results
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Trigram search benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="не удалять тестовую таблицу")
+    args = parser.parse_args()
+
+    try:
+        async with engine.begin() as conn:
+            print(f"Генерация {args.rows} пользователей в {TABLE}...")
+            started = time.perf_counter()
+            await prepare_table(conn, args.rows)
+            print(f"Готово за {time.perf_counter() - started:.1f} с")
+
+        async with engine.connect() as conn:
+            baseline = await measure(conn, args.repeats)
+
+        async with engine.begin() as conn:
+            started = time.perf_counter()
+            await create_trgm_indexes(conn)
+            print(f"Триграммные индексы построены за {time.perf_counter() - started:.1f} с")
+
+        async with engine.connect() as conn:
+            indexed = await measure(conn, args.repeats)
+
+        print(f"\n{'запрос':<16}{'без индекса, мс':>18}{'pg_trgm, мс':>14}{'ускорение':>12}")
+        for term in SEARCH_TERMS:
+            before, after = baseline[term]["median_ms"], indexed[term]["median_ms"]
+            marker = "" if indexed[term]["index"] else "  (seq scan)"
+            print(f"{term:<16}{before:>18.1f}{after:>14.1f}{before / max(after, 0.001):>11.1f}x{marker}")
+    finally:
+        if not args.keep:
+            async with engine.begin() as conn:
+                await conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
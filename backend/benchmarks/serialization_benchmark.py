@@ -0,0 +1,174 @@
+# backend/benchmarks/serialization_benchmark.py
+# Сериализация ответов: response_model + json (stdlib), response_model + orjson и доверенный путь
+# (TrustedJSONResponse) на списке мероприятий админки и на списке билетов пользователя.
+# Запуск: python backend/benchmarks/serialization_benchmark.py --items 100 --repeat 200
+# БД не нужна: строки ORM создаются в памяти, модели ответа строятся так же, как в обработчиках.
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.config.serialization import TrustedJSONResponse
+from backend.database.user_db import Event, Registration, TicketType
+from backend.schemas_enums.enums import EventStatus, Status
+from backend.schemas_enums.schemas import EventCreate, PaginatedResponse, TicketTypeCreate, UserTicketResponse
+
+
+def make_events(count: int) -> list:
+    now = datetime.utcnow()
+    events = []
+    for i in range(1, count + 1):
+        event = Event(
+            id=i,
+            title=f"Мероприятие {i}",
+            description="Описание мероприятия " * 20,
+            start_date=now + timedelta(days=i),
+            end_date=now + timedelta(days=i, hours=3),
+            location="Москва, ул. Тверская, 1",
+            image_url=f"/images/{i:064x}_original.jpg",
+            price=Decimal("1500.00"),
+            published=True,
+            created_at=now,
+            updated_at=now,
+            status=EventStatus.registration_open,
+            url_slug=f"event-{i}",
+            variants_ready=True,
+        )
+        event.tickets = [TicketType(name="standart", price=Decimal("1500.00"), available_quantity=100, sold_quantity=i % 100, free_registration=False)]
+        events.append(event)
+    return events
+
+
+def build_events_payload(events: list) -> PaginatedResponse[EventCreate]:
+    """Как admin_edit_routers.get_admin_events: модели собираются вручную из строк выборки."""
+    items = []
+    for event in events:
+        ticket = event.tickets[0]
+        items.append(EventCreate(
+            id=event.id,
+            title=event.title,
+            description=event.description,
+            start_date=event.start_date,
+            end_date=event.end_date,
+            location=event.location,
+            image_url=event.image_url,
+            price=float(event.price),
+            published=event.published,
+            created_at=event.created_at,
+            updated_at=event.updated_at,
+            status=event.status,
+            url_slug=f"{event.url_slug}-{event.start_date.year}-{event.id}",
+            registrations_count=ticket.sold_quantity,
+            variants_ready=event.variants_ready,
+            ticket_type=TicketTypeCreate(
+                name=ticket.name,
+                price=float(ticket.price),
+                available_quantity=ticket.available_quantity,
+                free_registration=ticket.free_registration,
+                remaining_quantity=ticket.available_quantity - ticket.sold_quantity,
+                sold_quantity=ticket.sold_quantity,
+            ),
+        ))
+    return PaginatedResponse[EventCreate](items=items, total=len(items) * 10, skip=0, limit=len(items))
+
+
+def build_tickets_payload(events: list) -> Dict[str, Any]:
+    """Как user_tickets_router.get_user_tickets: мероприятие билета передается строкой ORM."""
+    tickets = []
+    for event in events:
+        registration = Registration(
+            id=event.id,
+            event=event,
+            ticket_type=event.tickets[0],
+            submission_time=event.created_at,
+            status=Status.approved,
+            cancellation_count=0,
+            ticket_number=f"T-{event.id:08d}",
+        )
+        tickets.append(UserTicketResponse(
+            id=registration.id,
+            event=registration.event,
+            ticket_type=registration.ticket_type.name,
+            registration_date=registration.submission_time,
+            status=registration.status,
+            cancellation_count=registration.cancellation_count,
+            ticket_number=registration.ticket_number,
+        ))
+    return {"tickets": tickets, "total_count": len(tickets), "page": 1, "per_page": len(tickets), "has_more": False, "next_cursor": None}
+
+
+async def render_validated(field, content, response_class) -> bytes:
+    """Путь FastAPI для обработчика, вернувшего модели: проверка по response_model, затем кодирование."""
+    return response_class(await serialize_response(field=field, response_content=content)).body
+
+
+async def render_trusted(content) -> bytes:
+    """Доверенный путь: модели уже проверены, тело кодирует кэшированный TypeAdapter."""
+    return TrustedJSONResponse(content).body
+
+
+async def measure(render, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await render()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+async def bench_payload(name: str, response_model: Any, content: Any, repeat: int) -> None:
+    field = create_model_field(name="Response_" + name, type_=response_model, mode="serialization")
+    paths = {
+        "response_model + json": lambda: render_validated(field, content, JSONResponse),
+        "response_model + orjson": lambda: render_validated(field, content, ORJSONResponse),
+        "trusted (TypeAdapter)": lambda: render_trusted(content),
+    }
+
+    # Все пути должны отдавать одинаковый JSON
+    bodies = {path: await render() for path, render in paths.items()}
+    reference = json.loads(bodies["response_model + json"])
+    for path, body in bodies.items():
+        if json.loads(body) != reference:
+            raise SystemExit(f"{name}: ответ '{path}' отличается от ответа response_model")
+
+    print(f"\n{name}: {len(bodies['response_model + json'])} байт")
+    baseline = None
+    for path, render in paths.items():
+        await measure(render, max(repeat // 10, 1))  # прогрев
+        timings = await measure(render, repeat)
+        median = statistics.median(timings)
+        baseline = baseline or median
+        p95 = statistics.quantiles(timings, n=20)[18] if len(timings) >= 20 else max(timings)
+        print(f"  {path:<26} median {median:8.3f} ms  p95 {p95:8.3f} ms  x{baseline / median:5.2f}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Serialization benchmark for response models")
+    parser.add_argument("--items", type=int, default=100, help="Записей в ответе")
+    parser.add_argument("--repeat", type=int, default=200, help="Повторов для каждого пути")
+    args = parser.parse_args()
+
+    events = make_events(args.items)
+    await bench_payload("events", PaginatedResponse[EventCreate], build_events_payload(events), args.repeat)
+    await bench_payload("tickets", Dict[str, Any], build_tickets_payload(events), args.repeat)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
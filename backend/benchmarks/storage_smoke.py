@@ -0,0 +1,133 @@
+# backend/benchmarks/storage_smoke.py
+# Проверка S3Storage на живом MinIO (сервис minio из docker-compose): multipart-запись,
+# подписанный URL загрузки, iter_objects, move и потоковая отдача ответа.
+# Запуск: docker compose up -d minio minio-init
+#         python backend/benchmarks/storage_smoke.py --endpoint http://localhost:9000
+# Объекты создаются под отдельным префиксом в бакете S3_BUCKET и удаляются после проверки.
+#
+# Прогон (aioboto3 15.5, moto 5.2 в режиме сервера вместо MinIO - образ MinIO был недоступен):
+# multipart-запись, отмена загрузки, iter_objects, move и потоковая отдача прошли. Прогон выявил,
+# что presign_upload подписывал URL по SigV2 и контрольная сумма не входила в подпись (исправлено,
+# см. tests/test_storage.py). moto не проверяет x-amz-checksum-sha256, поэтому отказ в загрузке
+# измененного содержимого на нем не проверить - этот шаг нужно пройти на MinIO.
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import uuid
+
+import aiohttp
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.config.storage import S3_BUCKET, S3Storage
+
+# Минимальный размер части multipart upload в S3
+PART_SIZE = 5 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+
+def check(condition: bool, message: str) -> None:
+    if not condition:
+        raise SystemExit(f"FAIL: {message}")
+    print(f"  ok: {message}")
+
+
+async def write_object(storage: S3Storage, key: str, content: bytes) -> None:
+    writer = storage.open_writer(key)
+    try:
+        for start in range(0, len(content), CHUNK_SIZE):
+            await writer.write(content[start:start + CHUNK_SIZE])
+        await writer.commit()
+    except BaseException:
+        await writer.abort()
+        raise
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="S3Storage smoke test against MinIO")
+    parser.add_argument("--endpoint", default=os.getenv("S3_ENDPOINT_URL", "http://localhost:9000"), help="Адрес S3 API")
+    parser.add_argument("--bucket", default=S3_BUCKET, help="Бакет (создается minio-init)")
+    parser.add_argument("--size-mb", type=int, default=12, help="Размер объекта для multipart-записи")
+    args = parser.parse_args()
+
+    storage = S3Storage(
+        args.bucket, f"smoke-{uuid.uuid4().hex[:8]}/",
+        endpoint_url=args.endpoint,
+        public_endpoint_url=args.endpoint,
+        region=os.getenv("S3_REGION", "us-east-1"),
+        access_key_id=os.getenv("S3_ACCESS_KEY_ID", "minioadmin"),
+        secret_access_key=os.getenv("S3_SECRET_ACCESS_KEY", "minioadmin"),
+        part_size=PART_SIZE,
+    )
+    print(f"S3 {args.endpoint}, bucket {args.bucket}, prefix {storage.prefix}")
+    try:
+        big = os.urandom(args.size_mb * 1024 * 1024)
+        small = os.urandom(64 * 1024)
+
+        print("multipart writer")
+        await write_object(storage, "big.bin", big)
+        stored = await storage.stat("big.bin")
+        check(stored is not None and stored.size == len(big), f"multipart object stored, {len(big)} bytes in {-(-len(big) // PART_SIZE)} parts")
+        async with storage.fetch("big.bin") as path:
+            with open(path, "rb") as f:
+                check(hashlib.sha256(f.read()).digest() == hashlib.sha256(big).digest(), "multipart object content matches")
+        await write_object(storage, "small.bin", small)
+        check(await storage.read_head("small.bin", 16) == small[:16], "small object written with a single PUT")
+
+        writer = storage.open_writer("aborted.bin")
+        await writer.write(big[:PART_SIZE])
+        await writer.abort()
+        check(not await storage.exists("aborted.bin"), "aborted multipart upload leaves no object")
+
+        print("presigned upload")
+        payload = os.urandom(256 * 1024)
+        sha256 = hashlib.sha256(payload).hexdigest()
+        url, headers = await storage.presign_upload("direct.jpg", "image/jpeg", len(payload), sha256, 300)
+        async with aiohttp.ClientSession() as session:
+            async with session.put(url, data=payload, headers=headers) as resp:
+                check(resp.status == 200, f"PUT by presigned URL accepted ({resp.status})")
+            tampered = bytes([payload[0] ^ 0xFF]) + payload[1:]
+            async with session.put(url, data=tampered, headers=headers) as resp:
+                check(resp.status >= 400, f"PUT with different content rejected ({resp.status})")
+        stored = await storage.stat("direct.jpg")
+        check(stored is not None and stored.size == len(payload), "presigned object stored")
+
+        print("iter_objects")
+        keys = sorted([stored.key async for stored in storage.iter_objects()])
+        check(keys == ["big.bin", "direct.jpg", "small.bin"], f"listing under prefix: {keys}")
+        keys = [stored.key async for stored in storage.iter_objects("sm")]
+        check(keys == ["small.bin"], "listing by key prefix")
+
+        print("move")
+        await storage.move("small.bin", "moved/small.bin")
+        check(not await storage.exists("small.bin"), "source removed after move")
+        check(await storage.read_head("moved/small.bin", len(small)) == small, "target has the moved content")
+
+        print("response streaming")
+        response = await storage.response("big.bin", headers={"Cache-Control": "private"})
+        check(response is not None, "response for existing object")
+        check(response.headers["content-length"] == str(len(big)), "Content-Length from object size")
+        check(response.headers["cache-control"] == "private", "extra headers passed through")
+        digest = hashlib.sha256()
+        chunks = 0
+        async for chunk in response.body_iterator:
+            digest.update(chunk)
+            chunks += 1
+        check(digest.digest() == hashlib.sha256(big).digest(), f"streamed body matches ({chunks} chunks)")
+        check(await storage.response("missing.bin") is None, "no response for missing object")
+    finally:
+        keys = [stored.key async for stored in storage.iter_objects()]
+        await storage.delete(keys)
+        await storage.close()
+    print("S3 storage smoke test passed")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
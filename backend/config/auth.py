@@ -136,7 +136,8 @@ async def get_current_user(token: str, db: AsyncSession = Depends(get_async_db))
         
     # Используем email из token_data.sub
     user = await get_user_by_username(db, email=token_data.sub) 
-    if user is None:
+    # Токены удаленного пользователя недействительны сразу, до завершения фонового удаления
+    if user is None or user.deleted_at is not None:
         logger.warning(f"User not found for email from token: {token_data.sub}")
         raise credentials_exception
     return user
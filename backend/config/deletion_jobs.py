@@ -0,0 +1,289 @@
+# backend/config/deletion_jobs.py
+"""
+Фоновое удаление мероприятий и пользователей.
+
+Обработчик запроса только помечает сущность удаленной (deleted_at) и создает DeletionJob.
+Обработчик задач удаляет зависимые строки пакетами по DELETION_BATCH_SIZE - каждый пакет в своей
+короткой транзакции вместе с записью прогресса (шаг и число удаленных строк), поэтому блокировки
+не накапливаются, а после перезапуска задача продолжается с того же шага. Последним шагом
+удаляется сама сущность. Пакеты одной задачи сериализуются блокировкой строки задачи:
+обработчики нескольких процессов не мешают друг другу.
+"""
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from backend.config.event_cache import invalidate_event
+from backend.config.inventory import release_ticket
+from backend.config.logging_config import logger
+from backend.config.media_store import discard_media, release
+from backend.database.user_db import (
+    AsyncSession, AsyncSessionLocal, DeletionJob, Event, Media, NotificationTemplate, NotificationView,
+    Registration, TicketType, User, UserActivity, UserParams,
+)
+from backend.schemas_enums.enums import Status
+
+# --- Загрузка конфигурации из .env ---
+DELETION_BATCH_SIZE = max(int(os.getenv("DELETION_BATCH_SIZE", "1000")), 1)
+# Пауза между пакетами: фоновое удаление уступает рабочей нагрузке и репликации
+DELETION_PAUSE_MS = int(os.getenv("DELETION_PAUSE_MS", "20"))
+DELETION_POLL_SECONDS = int(os.getenv("DELETION_POLL_SECONDS", "30"))  # 0 отключает обработчик
+DELETION_MAX_ATTEMPTS = int(os.getenv("DELETION_MAX_ATTEMPTS", "5"))
+# --- Конец загрузки конфигурации ---
+
+ACTIVE_STATUSES = ("pending", "running")
+FINAL_STEP = "entity"
+
+RowsHook = Callable[[AsyncSession, List[int]], Awaitable[None]]
+
+
+class ChunkStep(NamedTuple):
+    name: str
+    model: Any
+    condition: Callable[[int], Any]  # entity_id -> условие отбора строк шага
+    url_column: Any = None           # ссылка на медиа: снимается release, файлы удаляются после коммита
+    detach_column: Any = None        # вместо удаления строки обнуляется этот столбец
+    before: Optional[RowsHook] = None  # действие над пакетом перед удалением (в той же транзакции)
+
+
+async def _cancel_upcoming_registrations(db: AsyncSession, registration_ids: List[int]) -> None:
+    """Активные регистрации удаляемого пользователя на будущие мероприятия отменяются с возвратом мест."""
+    rows = (await db.execute(
+        select(Registration.id, Registration.ticket_type_id)
+        .join(Event, Event.id == Registration.event_id)
+        .where(
+            Registration.id.in_(registration_ids),
+            Registration.status != Status.cancelled,
+            Event.start_date >= datetime.utcnow(),
+        )
+    )).all()
+    for registration_id, ticket_type_id in rows:
+        await db.execute(
+            update(Registration)
+            .where(Registration.id == registration_id)
+            .values(status=Status.cancelled, hold_expires_at=None)
+        )
+        if ticket_type_id is not None:
+            await release_ticket(db, ticket_type_id)
+
+
+# Порядок шагов учитывает внешние ключи: зависимые строки удаляются раньше строк, на которые ссылаются
+DELETION_STEPS: Dict[str, List[ChunkStep]] = {
+    "event": [
+        ChunkStep(
+            "notification_views", NotificationView,
+            lambda event_id: NotificationView.template_id.in_(
+                select(NotificationTemplate.id).where(NotificationTemplate.event_id == event_id)
+            ),
+        ),
+        ChunkStep("notification_templates", NotificationTemplate, lambda event_id: NotificationTemplate.event_id == event_id),
+        ChunkStep("registrations", Registration, lambda event_id: Registration.event_id == event_id),
+        ChunkStep("medias", Media, lambda event_id: Media.event_id == event_id, url_column=Media.url),
+        # Шарды остатка удаляются каскадно (ON DELETE CASCADE)
+        ChunkStep("ticket_types", TicketType, lambda event_id: TicketType.event_id == event_id),
+    ],
+    "user": [
+        ChunkStep("notification_views", NotificationView, lambda user_id: NotificationView.user_id == user_id),
+        ChunkStep("user_activities", UserActivity, lambda user_id: UserActivity.user_id == user_id),
+        ChunkStep("medias", Media, lambda user_id: Media.user_uploaded_by_id == user_id, url_column=Media.url),
+        # Регистрации остаются в статистике мероприятий без привязки к пользователю
+        ChunkStep(
+            "registrations", Registration, lambda user_id: Registration.user_id == user_id,
+            detach_column=Registration.user_id, before=_cancel_upcoming_registrations,
+        ),
+        ChunkStep("users_params", UserParams, lambda user_id: UserParams.user_id == user_id),
+    ],
+}
+
+
+async def _delete_event(db: AsyncSession, event_id: int) -> List[Optional[str]]:
+    image_url = (await db.execute(select(Event.image_url).where(Event.id == event_id))).scalar_one_or_none()
+    await release(db, image_url)
+    await db.execute(delete(Event).where(Event.id == event_id))
+    return [image_url]
+
+
+async def _delete_user(db: AsyncSession, user_id: int) -> List[Optional[str]]:
+    avatar_url = (await db.execute(select(User.avatar_url).where(User.id == user_id))).scalar_one_or_none()
+    await release(db, avatar_url)
+    await db.execute(delete(User).where(User.id == user_id))
+    return [avatar_url]
+
+
+# Удаление самой сущности; возвращает URL медиа, ссылки на которые сняты
+FINALIZERS: Dict[str, Callable[[AsyncSession, int], Awaitable[List[Optional[str]]]]] = {
+    "event": _delete_event,
+    "user": _delete_user,
+}
+
+
+async def create_deletion_job(db: AsyncSession, entity_type: str, entity_id: int, admin_id: Optional[int] = None) -> DeletionJob:
+    """Создает задачу в транзакции db (повторный запрос возвращает существующую задачу)."""
+    await db.execute(
+        pg_insert(DeletionJob)
+        .values(entity_type=entity_type, entity_id=entity_id, requested_by_admin_id=admin_id, deleted_rows={})
+        .on_conflict_do_nothing(constraint="uq_deletion_jobs_entity")
+    )
+    result = await db.execute(
+        select(DeletionJob).where(DeletionJob.entity_type == entity_type, DeletionJob.entity_id == entity_id)
+    )
+    return result.scalar_one()
+
+
+async def _run_step_chunk(db: AsyncSession, step: ChunkStep, entity_id: int, batch_size: int) -> Tuple[int, List[str]]:
+    """Обрабатывает один пакет шага; возвращает (число строк, URL со снятыми ссылками)."""
+    columns = [step.model.id] + ([step.url_column] if step.url_column is not None else [])
+    rows = (await db.execute(
+        select(*columns).where(step.condition(entity_id)).order_by(step.model.id).limit(batch_size).with_for_update()
+    )).all()
+    if not rows:
+        return 0, []
+    ids = [row[0] for row in rows]
+    urls = [row[1] for row in rows if row[1]] if step.url_column is not None else []
+    for url in urls:
+        await release(db, url)
+    if step.before is not None:
+        await step.before(db, ids)
+    if step.detach_column is not None:
+        await db.execute(update(step.model).where(step.model.id.in_(ids)).values({step.detach_column.key: None}))
+    else:
+        await db.execute(delete(step.model).where(step.model.id.in_(ids)))
+    return len(ids), urls
+
+
+async def run_deletion_chunk(job_id: int, batch_size: int = DELETION_BATCH_SIZE) -> Optional[bool]:
+    """
+    Выполняет следующий пакет задачи. True - задача завершена, False - работа осталась,
+    None - задача не активна или пакет сейчас выполняет другой процесс.
+    """
+    released: List[str] = []
+    async with AsyncSessionLocal() as db:
+        job = (await db.execute(
+            select(DeletionJob)
+            .where(DeletionJob.id == job_id, DeletionJob.status.in_(ACTIVE_STATUSES))
+            .with_for_update(skip_locked=True)
+        )).scalar_one_or_none()
+        if job is None:
+            return None
+        steps = DELETION_STEPS[job.entity_type]
+        names = [step.name for step in steps]
+        index = len(steps) if job.step == FINAL_STEP else names.index(job.step) if job.step in names else 0
+        job.status = "running"
+        now = datetime.utcnow()
+
+        if index < len(steps):
+            count, released = await _run_step_chunk(db, steps[index], job.entity_id, batch_size)
+            if count:
+                job.step = names[index]
+                job.deleted_rows = {**job.deleted_rows, names[index]: job.deleted_rows.get(names[index], 0) + count}
+            else:
+                # Шаг переходит к следующему только на пустом пакете: строки, заблокированные
+                # параллельными транзакциями, дождутся следующего пакета
+                job.step = names[index + 1] if index + 1 < len(steps) else FINAL_STEP
+            finished = False
+        else:
+            released = [url for url in await FINALIZERS[job.entity_type](db, job.entity_id) if url]
+            job.status = "completed"
+            job.completed_at = now
+            finished = True
+        job.attempts = 0
+        job.error = None
+        job.updated_at = now
+        entity_type, entity_id = job.entity_type, job.entity_id
+        await db.commit()
+
+    if released:
+        await discard_media(released)
+    if finished:
+        if entity_type == "event":
+            await invalidate_event(entity_id)
+        logger.info(f"Deletion job {job_id} completed: {entity_type} {entity_id}")
+    return finished
+
+
+async def _record_failure(job_id: int, error: Exception) -> None:
+    async with AsyncSessionLocal() as db:
+        job = await db.get(DeletionJob, job_id)
+        if job is None:
+            return
+        job.attempts += 1
+        job.error = repr(error)[:2000]
+        if job.attempts >= DELETION_MAX_ATTEMPTS:
+            # Задачу можно перезапустить, вернув status = 'pending'
+            job.status = "failed"
+        await db.commit()
+
+
+async def run_deletion_job(job_id: int) -> Optional[bool]:
+    """Выполняет задачу до конца пакетами; ошибка пакета записывается в задачу, повтор - при следующем проходе."""
+    while True:
+        try:
+            finished = await run_deletion_chunk(job_id)
+        except Exception as e:
+            logger.error(f"Deletion job {job_id} failed: {e!r}", exc_info=True)
+            await _record_failure(job_id, e)
+            return None
+        if finished is not False:
+            return finished
+        if DELETION_PAUSE_MS > 0:
+            await asyncio.sleep(DELETION_PAUSE_MS / 1000)
+
+
+class DeletionWorker:
+    """Обработчик задач удаления внутри процесса сервера: по сигналу wake() и периодически."""
+
+    def __init__(self, poll_seconds: int):
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    async def _active_jobs(self) -> List[int]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(DeletionJob.id).where(DeletionJob.status.in_(ACTIVE_STATUSES)).order_by(DeletionJob.id)
+            )
+            return list(result.scalars().all())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                for job_id in await self._active_jobs():
+                    await run_deletion_job(job_id)
+            except Exception as e:
+                logger.error(f"Error during deletion jobs processing: {str(e)}", exc_info=True)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def wake(self) -> None:
+        """Запускает обработку сразу после создания задачи, не дожидаясь опроса."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def start(self) -> None:
+        if self.poll_seconds <= 0:
+            logger.info("Deletion worker is disabled")
+            return
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            # Первый проход сразу: незавершенные задачи продолжаются после перезапуска
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Deletion worker polls every {self.poll_seconds} seconds")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+deletion_worker = DeletionWorker(DELETION_POLL_SECONDS)
@@ -0,0 +1,126 @@
+# backend/config/event_cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, Optional, Set
+
+from backend.config.logging_config import logger
+from backend.config.response_cache import CacheEntry, cache_get, cache_set, encode_entry, event_tag, invalidate_event_caches
+
+
+def build_canonical_slug(url_slug: Optional[str], title: str, start_date: datetime, event_id: int) -> str:
+    """Канонический slug мероприятия в формате base-year-id."""
+    # Если базовый slug не задан, формируем временный из названия
+    base_slug = url_slug or title.lower().replace(' ', '-')
+    return f"{base_slug}-{start_date.year}-{event_id}"
+
+
+class SlugIndex:
+    """LRU-отображение slug -> id мероприятия с TTL и обратным индексом для инвалидации."""
+
+    def __init__(self, max_entries: int = 10000, ttl: int = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._slugs: "OrderedDict[str, tuple]" = OrderedDict()
+        self._by_event: Dict[int, Set[str]] = {}
+
+    def get(self, slug: str) -> Optional[int]:
+        item = self._slugs.get(slug)
+        if item is None:
+            return None
+        expires_at, event_id = item
+        if expires_at < time.monotonic():
+            self._remove(slug)
+            return None
+        self._slugs.move_to_end(slug)
+        return event_id
+
+    def put(self, slug: str, event_id: int) -> None:
+        self._remove(slug)
+        self._slugs[slug] = (time.monotonic() + self.ttl, event_id)
+        self._by_event.setdefault(event_id, set()).add(slug)
+        while len(self._slugs) > self.max_entries:
+            oldest = next(iter(self._slugs))
+            self._remove(oldest)
+
+    def invalidate_event(self, event_id: int) -> None:
+        for slug in self._by_event.pop(event_id, set()):
+            self._slugs.pop(slug, None)
+
+    def _remove(self, slug: str) -> None:
+        item = self._slugs.pop(slug, None)
+        if item is not None:
+            slugs = self._by_event.get(item[1])
+            if slugs is not None:
+                slugs.discard(slug)
+                if not slugs:
+                    self._by_event.pop(item[1], None)
+
+
+# Результат single-flight, означающий "загрузка отменена, повторите ее сами"
+_LOAD_CANCELLED = object()
+
+
+class EventDetailCache:
+    """
+    Кэш карточек мероприятий с single-flight загрузкой: при промахе
+    одновременные запросы одного мероприятия ждут одну загрузку из БД.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[int, asyncio.Future] = {}
+
+    @staticmethod
+    def cache_key(event_id: int) -> str:
+        return f"events:detail:{event_id}"
+
+    async def peek(self, event_id: int) -> Optional[CacheEntry]:
+        return await cache_get(self.cache_key(event_id))
+
+    async def get_or_load(self, event_id: int, loader: Callable[[], Awaitable[Optional[CacheEntry]]]) -> Optional[CacheEntry]:
+        while True:
+            cached = await cache_get(self.cache_key(event_id))
+            if cached is not None:
+                return cached
+
+            inflight = self._inflight.get(event_id)
+            if inflight is not None:
+                entry = await asyncio.shield(inflight)
+                if entry is _LOAD_CANCELLED:
+                    # Загружавший запрос отменен (клиент отключился) - загружаем сами
+                    continue
+                return entry
+
+            future = asyncio.get_running_loop().create_future()
+            # Исключение забирают ожидающие; если их нет, не засоряем лог предупреждениями
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            self._inflight[event_id] = future
+            try:
+                entry = await loader()
+                if entry is not None:
+                    # Загрузчик отдает строки, из кэша приходят bytes: вызывающие всегда получают bytes
+                    entry = encode_entry(entry)
+                    await cache_set(self.cache_key(event_id), entry, tags=[event_tag(event_id)])
+                future.set_result(entry)
+                return entry
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            except BaseException:
+                # Отмену не передаем ожидающим: они повторят загрузку без этого запроса
+                future.set_result(_LOAD_CANCELLED)
+                raise
+            finally:
+                self._inflight.pop(event_id, None)
+
+
+slug_index = SlugIndex()
+event_detail_cache = EventDetailCache()
+
+
+async def invalidate_event(event_id: int) -> None:
+    """Сбрасывает все кэши, связанные с мероприятием (slug-индекс, карточка, списки)."""
+    slug_index.invalidate_event(event_id)
+    await invalidate_event_caches(event_id)
+    logger.info(f"Event {event_id} caches invalidated")
@@ -0,0 +1,68 @@
+# backend/config/http_cache.py
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+
+def weak_etag(*parts) -> str:
+    """Слабый ETag из набора значений, от которых зависит содержимое ответа."""
+    digest = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def http_date(dt: datetime) -> str:
+    # В БД хранятся наивные UTC-даты
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def validator_headers(etag: str, last_modified: Optional[datetime], cache_control: str) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+
+def _strip_weak(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def has_conditional_headers(request: Request) -> bool:
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Проверяет условия запроса (RFC 7232): If-None-Match имеет приоритет,
+    If-Modified-Since учитывается только если ETag клиент не прислал.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        wanted = _strip_weak(etag)
+        return any(_strip_weak(tag) == wanted for tag in if_none_match.split(","))
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since is None:
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        modified = last_modified if last_modified.tzinfo else last_modified.replace(tzinfo=timezone.utc)
+        # HTTP-даты имеют точность до секунды
+        return modified.replace(microsecond=0) <= since
+    return False
+
+
+def not_modified_response(etag: str, last_modified: Optional[datetime], cache_control: str) -> Response:
+    return Response(status_code=304, headers=validator_headers(etag, last_modified, cache_control))
@@ -0,0 +1,249 @@
+# backend/config/idempotency.py
+"""
+Идемпотентность мутирующих эндпоинтов по заголовку Idempotency-Key.
+
+Первый запрос с ключом выполняет обработчик и сохраняет ответ; повтор с тем же ключом
+и тем же содержимым получает сохраненный ответ, не затрагивая бизнес-таблицы.
+Параллельный дубликат ждет завершения первого запроса.
+"""
+import asyncio
+import hashlib
+import os
+import time
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from starlette.datastructures import UploadFile as StarletteUploadFile
+
+from backend.config.logging_config import logger
+from backend.config.redis_client import get_redis
+from backend.config.serialization import adapter_for, dump_json
+
+# --- Загрузка конфигурации из .env ---
+# "memory" - хранилище внутри процесса, "redis" - общее для всех экземпляров сервера
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory").lower()
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "86400"))          # сколько хранится ответ
+IDEMPOTENCY_LOCK_TTL = int(os.getenv("IDEMPOTENCY_LOCK_TTL", "60"))   # сколько живет метка "в работе"
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "10"))
+# --- Конец загрузки конфигурации ---
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# Временные ответы не сохраняются: повтор запроса должен выполниться заново
+TRANSIENT_STATUS_CODES = {409, 429}
+
+IdempotencyRecord = Dict[str, bytes]
+
+
+class InMemoryIdempotencyStore:
+    def __init__(self):
+        self._records: Dict[str, tuple] = {}
+
+    def _get(self, key: str) -> Optional[dict]:
+        item = self._records.get(key)
+        if item is None:
+            return None
+        expires_at, record = item
+        if expires_at < time.monotonic():
+            self._records.pop(key, None)
+            return None
+        return record
+
+    async def get(self, key: str) -> Optional[IdempotencyRecord]:
+        return self._get(key)
+
+    async def claim(self, key: str, fingerprint: str, ttl: int) -> bool:
+        if self._get(key) is not None:
+            return False
+        self._records[key] = (time.monotonic() + ttl, {"state": b"in_progress", "fp": fingerprint.encode()})
+        return True
+
+    async def complete(self, key: str, record: Dict[str, Any], ttl: int) -> None:
+        self._records[key] = (
+            time.monotonic() + ttl,
+            {k: v.encode() if isinstance(v, str) else v for k, v in record.items()},
+        )
+
+    async def release(self, key: str) -> None:
+        self._records.pop(key, None)
+
+
+class RedisIdempotencyStore:
+    prefix = "idem:"
+
+    async def get(self, key: str) -> Optional[IdempotencyRecord]:
+        record = await get_redis().hgetall(self.prefix + key)
+        if not record:
+            return None
+        return {k.decode(): v for k, v in record.items()}
+
+    async def claim(self, key: str, fingerprint: str, ttl: int) -> bool:
+        redis_key = self.prefix + key
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hsetnx(redis_key, "state", "in_progress")
+            pipe.expire(redis_key, ttl, nx=True)
+            claimed, _ = await pipe.execute()
+        if claimed:
+            await get_redis().hset(redis_key, "fp", fingerprint)
+        return bool(claimed)
+
+    async def complete(self, key: str, record: Dict[str, Any], ttl: int) -> None:
+        redis_key = self.prefix + key
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.hset(redis_key, mapping=record)
+            pipe.expire(redis_key, ttl)
+            await pipe.execute()
+
+    async def release(self, key: str) -> None:
+        await get_redis().delete(self.prefix + key)
+
+
+_store = None
+
+
+def get_idempotency_store():
+    global _store
+    if _store is None:
+        _store = RedisIdempotencyStore() if IDEMPOTENCY_BACKEND == "redis" else InMemoryIdempotencyStore()
+        logger.info(f"Idempotency store backend: {type(_store).__name__}")
+    return _store
+
+
+async def request_fingerprint(request: Request) -> str:
+    """Отпечаток запроса: метод, путь и содержимое (JSON-тело или поля формы с файлами)."""
+    digest = hashlib.sha256(f"{request.method} {request.url.path}?{request.url.query}".encode())
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("multipart/form-data", "application/x-www-form-urlencoded")):
+        # Форма уже разобрана FastAPI и закэширована в request
+        form = await request.form()
+        for name, value in sorted(form.multi_items(), key=lambda item: item[0]):
+            digest.update(name.encode())
+            if isinstance(value, StarletteUploadFile):
+                while chunk := await value.read(1024 * 1024):
+                    digest.update(chunk)
+                await value.seek(0)
+            else:
+                digest.update(str(value).encode())
+    else:
+        digest.update(await request.body())
+    return digest.hexdigest()
+
+
+def _scope(action: str, request: Request, key: str) -> str:
+    # Ключ действует в пределах действия и владельца токена (или IP для анонимных запросов)
+    owner = request.headers.get("Authorization") or (request.client.host if request.client else "")
+    owner_hash = hashlib.sha256(owner.encode()).hexdigest()[:32]
+    return f"{action}:{owner_hash}:{key}"
+
+
+def _replay(record: IdempotencyRecord) -> Response:
+    return Response(
+        content=record.get("body", b""),
+        status_code=int(record["status"]),
+        media_type=record.get("media_type", b"application/json").decode(),
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+async def _wait_for_result(store, scope: str) -> Optional[IdempotencyRecord]:
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+        record = await store.get(scope)
+        if record is None or record.get("state") == b"done":
+            return record
+    return None
+
+
+def idempotent(action: str, response_model: Any = None, status_code: int = 200):
+    """
+    Декоратор для мутирующих эндпоинтов (по аналогии с rate_limit).
+    Без заголовка Idempotency-Key обработчик выполняется как обычно.
+    """
+    adapter = adapter_for(response_model) if response_model is not None else None
+
+    def serialize(result: Any) -> Response:
+        if isinstance(result, Response):
+            return result
+        if adapter is not None:
+            body = adapter.dump_json(adapter.validate_python(result, from_attributes=True))
+        else:
+            body = dump_json(jsonable_encoder(result))
+        return Response(content=body, status_code=status_code, media_type="application/json")
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            request = kwargs.get("request")
+            if not request:
+                for arg in args:
+                    if isinstance(arg, Request):
+                        request = arg
+                        break
+            if not request:
+                raise ValueError("Request object not found in arguments")
+
+            key = request.headers.get(IDEMPOTENCY_HEADER)
+            if not key:
+                return await func(*args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} is too long")
+
+            store = get_idempotency_store()
+            scope = _scope(action, request, key)
+            fingerprint = await request_fingerprint(request)
+
+            while True:
+                if await store.claim(scope, fingerprint, IDEMPOTENCY_LOCK_TTL):
+                    break
+                record = await store.get(scope)
+                if record is not None and record.get("state") != b"done":
+                    # Первый запрос еще выполняется - ждем его результат
+                    record = await _wait_for_result(store, scope)
+                    if record is None:
+                        # Метка "в работе" истекла (первый запрос упал) - пробуем занять ключ снова
+                        if await store.get(scope) is None:
+                            continue
+                        raise HTTPException(status_code=409, detail="Запрос с этим Idempotency-Key еще выполняется")
+                if record is None:
+                    continue
+                if record.get("fp", b"").decode() != fingerprint:
+                    raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} уже использован с другим содержимым запроса")
+                logger.info(f"Replaying stored response for {action} (idempotency key {key})")
+                return _replay(record)
+
+            try:
+                response = serialize(await func(*args, **kwargs))
+            except HTTPException as e:
+                if e.status_code >= 500 or e.status_code in TRANSIENT_STATUS_CODES:
+                    await store.release(scope)
+                    raise
+                # Ошибки клиента детерминированы - повтор должен получить тот же ответ
+                response = Response(
+                    content=dump_json({"detail": jsonable_encoder(e.detail)}),
+                    status_code=e.status_code,
+                    media_type="application/json",
+                    headers=e.headers,
+                )
+            except BaseException:
+                await store.release(scope)
+                raise
+
+            if response.status_code >= 500 or response.status_code in TRANSIENT_STATUS_CODES:
+                await store.release(scope)
+                return response
+            await store.complete(scope, {
+                "state": "done",
+                "fp": fingerprint,
+                "status": str(response.status_code),
+                "media_type": response.media_type or "application/json",
+                "body": bytes(response.body),
+            }, IDEMPOTENCY_TTL)
+            return response
+
+        return wrapper
+
+    return decorator
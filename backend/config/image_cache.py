@@ -0,0 +1,179 @@
+# backend/config/image_cache.py
+"""
+Дисковый LRU-кэш сгенерированных версий изображений с ограничением по размеру.
+
+Индекс (ключ -> размер) хранится в памяти и восстанавливается при старте по времени
+последнего доступа файлов; при превышении лимита удаляются давно не запрошенные версии.
+Индекс свой у каждого процесса сервера, поэтому лимит делится на WEB_CONCURRENCY процессов.
+"""
+import asyncio
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from backend.config.logging_config import logger
+
+# --- Загрузка конфигурации из .env ---
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Число процессов сервера (uvicorn --workers читает ту же переменную). Индекс и счетчик размера
+# у каждого процесса свои, поэтому IMAGE_CACHE_MAX_MB делится между ними - общий объем каталога
+# остается в пределах лимита
+WEB_CONCURRENCY = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)
+# --- Конец загрузки конфигурации ---
+
+# Результат single-flight, означающий "генерация отменена, повторите ее сами"
+_CREATE_CANCELLED = object()
+
+
+class DiskLRUCache:
+    """
+    Операции с файловой системой (сканирование каталога, stat/utime при попадании,
+    запись и удаление) выполняются в потоках, индекс меняется только в event loop.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def _scan(self) -> List[Tuple[float, str, int]]:
+        """Файлы кэша на диске (время доступа, имя, размер) от давно использованных к недавним."""
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_atime, entry.name, stat.st_size))
+        return sorted(entries)
+
+    async def _ensure_loaded(self) -> None:
+        """Восстанавливает индекс с диска при первом обращении."""
+        if self._loaded:
+            return
+        async with self._load_lock:
+            if self._loaded:
+                return
+            for _, name, size in await asyncio.to_thread(self._scan):
+                self._index[name] = size
+                self._total += size
+            self._loaded = True
+        logger.info(f"Image cache loaded: {len(self._index)} files, {self._total / 1024 / 1024:.1f} MB")
+
+    @staticmethod
+    def _touch(path: str) -> bool:
+        """Обновляет время доступа (порядок вытеснения после перезапуска; noatime на диске)."""
+        try:
+            os.utime(path, (time.time(), os.stat(path).st_mtime))
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError:
+            return True
+
+    async def get(self, key: str) -> Optional[str]:
+        """Путь к закэшированному файлу или None."""
+        await self._ensure_loaded()
+        if key not in self._index:
+            return None
+        path = self._path(key)
+        if not await asyncio.to_thread(self._touch, path):
+            # Файл удалил другой процесс сервера при вытеснении
+            if key in self._index:
+                self._total -= self._index.pop(key)
+            return None
+        if key in self._index:
+            self._index.move_to_end(key)
+        return path
+
+    def _write(self, key: str, content: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        # Запись во временный файл и атомарная замена: читатели не увидят недописанный файл
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        return path
+
+    def _remove_files(self, keys: List[str]) -> None:
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    async def _register(self, key: str, size: int) -> None:
+        if key in self._index:
+            self._total -= self._index.pop(key)
+        self._index[key] = size
+        self._total += size
+        await self._evict()
+
+    async def put(self, key: str, content: bytes) -> str:
+        await self._ensure_loaded()
+        path = await asyncio.to_thread(self._write, key, content)
+        await self._register(key, len(content))
+        return path
+
+    async def _evict(self) -> None:
+        evicted = []
+        while self._total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            evicted.append(key)
+        if evicted:
+            await asyncio.to_thread(self._remove_files, evicted)
+
+    async def get_or_create(self, key: str, factory: Callable[[], Awaitable[bytes]]) -> str:
+        """
+        Возвращает путь к версии, создавая ее один раз: одновременные запросы
+        одной версии ждут одну генерацию.
+        """
+        while True:
+            path = await self.get(key)
+            if path is not None:
+                return path
+            inflight = self._inflight.get(key)
+            if inflight is not None:
+                path = await asyncio.shield(inflight)
+                if path is _CREATE_CANCELLED:
+                    # Генерировавший запрос отменен (клиент отключился) - генерируем сами
+                    continue
+                return path
+
+            future = asyncio.get_running_loop().create_future()
+            self._inflight[key] = future
+            try:
+                content = await factory()
+                # Запись файла - в потоке, изменение индекса - в event loop
+                path = await asyncio.to_thread(self._write, key, content)
+                await self._register(key, len(content))
+                future.set_result(path)
+                return path
+            except Exception as e:
+                future.set_exception(e)
+                # Исключение уже передано ожидающим; гасим "never retrieved" для future без ожидающих
+                future.exception()
+                raise
+            except BaseException:
+                # Отмену не передаем ожидающим: они повторят генерацию без этого запроса
+                future.set_result(_CREATE_CANCELLED)
+                raise
+            finally:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        return {"files": len(self._index), "bytes": self._total, "max_bytes": self.max_bytes}
+
+
+image_cache = DiskLRUCache(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES // WEB_CONCURRENCY)
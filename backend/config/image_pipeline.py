@@ -0,0 +1,200 @@
+# backend/config/image_pipeline.py
+"""
+Фоновая обработка изображений мероприятий вне event loop.
+
+Обработчик сохраняет оригинал и мероприятие сразу (variants_ready=False, image_url указывает
+на оригинал), а WebP-версии строятся в пуле процессов. Когда версии готовы, image_url
+переключается на среднюю версию и variants_ready становится True.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Set
+
+from sqlalchemy import select, update
+
+from backend.config.event_cache import invalidate_event
+from backend.config.image_variants import VARIANT_SIZES, render_variants
+from backend.config.logging_config import logger
+from backend.config.media_store import media_id_from_url, media_relpath, media_url, purge_unreferenced, record_variants
+from backend.config.storage import storage
+from backend.database.user_db import AsyncSessionLocal, Event
+
+# --- Загрузка конфигурации из .env ---
+IMAGE_PIPELINE_WORKERS = max(int(os.getenv("IMAGE_PIPELINE_WORKERS", "2")), 1)
+# Сколько изображений обрабатывается одновременно (остальные ждут в очереди)
+IMAGE_PIPELINE_MAX_CONCURRENT = max(int(os.getenv("IMAGE_PIPELINE_MAX_CONCURRENT", str(IMAGE_PIPELINE_WORKERS))), 1)
+IMAGE_PIPELINE_TIMEOUT = float(os.getenv("IMAGE_PIPELINE_TIMEOUT", "60"))
+# --- Конец загрузки конфигурации ---
+
+class ImagePipeline:
+    def __init__(self, workers: int, max_concurrent: int, timeout: float):
+        self.workers = workers
+        self.max_concurrent = max_concurrent
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._stats = {
+            "queued": 0, "running": 0, "completed": 0, "failed": 0,
+            "wait_ms_total": 0.0, "process_ms_total": 0.0, "process_ms_max": 0.0,
+            "decode_ms_total": 0.0, "encode_ms_total": 0.0, "variants_built": 0,
+        }
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: дочерние процессы не наследуют состояние event loop и пулов соединений
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        return self._semaphore
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        """Выполняет CPU-задачу в пуле процессов с ограничением параллелизма и таймаутом."""
+        queued_at = time.perf_counter()
+        self._stats["queued"] += 1
+        acquired = False
+        try:
+            async with self._get_semaphore():
+                acquired = True
+                self._stats["queued"] -= 1
+                self._stats["running"] += 1
+                started = time.perf_counter()
+                self._stats["wait_ms_total"] += (started - queued_at) * 1000
+                try:
+                    loop = asyncio.get_running_loop()
+                    result = await asyncio.wait_for(
+                        loop.run_in_executor(self._get_executor(), func, *args), timeout=self.timeout
+                    )
+                finally:
+                    self._stats["running"] -= 1
+        except BaseException:
+            if not acquired:
+                self._stats["queued"] -= 1
+            self._stats["failed"] += 1
+            raise
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats["completed"] += 1
+        self._stats["process_ms_total"] += elapsed_ms
+        self._stats["process_ms_max"] = max(self._stats["process_ms_max"], elapsed_ms)
+        return result
+
+    async def render(self, original_filename: str, base_name: str) -> Dict:
+        """Строит WebP-версии изображения мероприятия и помещает их в хранилище."""
+        started = time.perf_counter()
+        # Pillow работает с локальными файлами: оригинал берется из хранилища, версии собираются в staging
+        async with storage.fetch(media_relpath(original_filename)) as source_path, storage.staging() as work_dir:
+            result = await self.run(render_variants, source_path, base_name, work_dir)
+            await asyncio.gather(*(
+                storage.put_file(media_relpath(filename), os.path.join(work_dir, filename))
+                for filename in result["files"].values()
+            ))
+        self._stats["decode_ms_total"] += result["decode_ms"]
+        self._stats["encode_ms_total"] += result["encode_ms"]
+        self._stats["variants_built"] += 1
+        logger.info(
+            f"Image {base_name} processed in {(time.perf_counter() - started) * 1000:.0f} ms "
+            f"(decode {result['decode_ms']:.0f} ms, encode {result['encode_ms']:.0f} ms)"
+        )
+        return result
+
+    def schedule(self, event_id: int, original_filename: str) -> None:
+        """Ставит построение версий в очередь; обработчик запроса не ждет результата."""
+        task = asyncio.create_task(self._process_event(event_id, original_filename))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process_event(self, event_id: int, original_filename: str) -> None:
+        base_name = original_filename.rsplit("_original", 1)[0]
+        media_id = media_id_from_url(original_filename)
+        files = {size_name: f"{base_name}_{size_name}.webp" for size_name in VARIANT_SIZES}
+        # Версии объекта хранилища зависят только от содержимого: для повторной загрузки они уже есть
+        exists = await asyncio.gather(*(storage.exists(media_relpath(filename)) for filename in files.values()))
+        if not all(exists):
+            try:
+                files = (await self.render(original_filename, base_name))["files"]
+            except Exception as e:
+                # Мероприятие остается с оригиналом; повторная попытка - при следующем запуске сервера
+                logger.error(f"Failed to build image variants for event {event_id}: {e!r}")
+                return
+
+        async with AsyncSessionLocal() as db:
+            if media_id is not None:
+                # Версии попадают в манифест независимо от судьбы мероприятия - по нему их удалит очистка
+                await record_variants(db, media_id, files)
+            updated = await db.execute(
+                update(Event)
+                .where(Event.id == event_id, Event.image_url == media_url(original_filename))
+                .values(image_url=media_url(files["medium"]), variants_ready=True)
+                .returning(Event.id)
+            )
+            applied = updated.scalar_one_or_none() is not None
+            await db.commit()
+
+        if not applied:
+            # Изображение заменили или удалили, пока строились версии. Файлы объекта хранилища
+            # могут использоваться другими записями - удаляются, только если ссылок не осталось
+            if media_id is not None:
+                await purge_unreferenced(media_id)
+            else:
+                await storage.delete(media_relpath(filename) for filename in files.values())
+            logger.info(f"Image of event {event_id} changed during processing, variants discarded")
+            return
+        await invalidate_event(event_id)
+        logger.info(f"Image variants ready for event {event_id}")
+
+    async def resume_pending(self) -> int:
+        """Ставит в очередь изображения, обработка которых не завершилась до перезапуска."""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Event.id, Event.image_url).where(Event.variants_ready.is_(False), Event.image_url.isnot(None))
+            )
+            pending = result.all()
+        scheduled = 0
+        for event_id, image_url in pending:
+            original_filename = os.path.basename(image_url)
+            if "_original." in original_filename and await storage.exists(media_relpath(original_filename)):
+                self.schedule(event_id, original_filename)
+                scheduled += 1
+        if scheduled:
+            logger.info(f"Resumed image processing for {scheduled} events")
+        return scheduled
+
+    def metrics(self) -> Dict:
+        completed = self._stats["completed"]
+        started = completed + self._stats["failed"]
+        built = self._stats["variants_built"]
+        return {
+            "workers": self.workers,
+            "max_concurrent": self.max_concurrent,
+            "queued": self._stats["queued"],
+            "running": self._stats["running"],
+            "completed": completed,
+            "failed": self._stats["failed"],
+            "avg_wait_ms": round(self._stats["wait_ms_total"] / started, 1) if started else 0.0,
+            "avg_process_ms": round(self._stats["process_ms_total"] / completed, 1) if completed else 0.0,
+            "max_process_ms": round(self._stats["process_ms_max"], 1),
+            "variants_built": built,
+            "avg_decode_ms": round(self._stats["decode_ms_total"] / built, 1) if built else 0.0,
+            "avg_encode_ms": round(self._stats["encode_ms_total"] / built, 1) if built else 0.0,
+        }
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+image_pipeline = ImagePipeline(IMAGE_PIPELINE_WORKERS, IMAGE_PIPELINE_MAX_CONCURRENT, IMAGE_PIPELINE_TIMEOUT)
@@ -0,0 +1,86 @@
+# backend/config/image_variants.py
+"""
+CPU-часть обработки изображений мероприятий.
+
+Модуль намеренно не импортирует FastAPI и БД: функции выполняются в процессах пула
+(image_pipeline), которые запускаются через spawn и импортируют только этот модуль.
+"""
+import io
+import os
+import time
+from typing import Dict
+
+from PIL import Image as PillowImage, ImageOps, features
+
+# Форматы ответа эндпоинта /images/{id}: имя -> (формат Pillow, MIME-тип)
+OUTPUT_FORMATS = {
+    "avif": ("AVIF", "image/avif"),
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+}
+# AVIF доступен, только если Pillow собран с libavif
+AVIF_SUPPORTED = bool(features.check("avif")) if "avif" in features.modules else False
+
+# Оптимизированные WebP-версии: имя -> ширина
+VARIANT_SIZES = {
+    "medium": 600,  # Ширина для карточек
+    "large": 1200,  # Ширина для детального просмотра
+}
+
+
+def render_variants(original_path: str, base_name: str, media_dir: str) -> Dict:
+    """
+    Декодирует оригинал и сохраняет WebP-версии {base_name}_{size}.webp.
+    Возвращает имена файлов версий и время этапов в миллисекундах.
+    """
+    started = time.perf_counter()
+    with PillowImage.open(original_path) as source:
+        img = source.convert("RGB")  # Конвертируем в RGB для совместимости с WebP/JPEG
+    decoded = time.perf_counter()
+
+    files = {}
+    for size_name, width in VARIANT_SIZES.items():
+        img_copy = img.copy()
+        # Рассчитываем высоту, сохраняя пропорции
+        aspect_ratio = img_copy.height / img_copy.width
+        img_copy.thumbnail((width, int(width * aspect_ratio)))  # thumbnail не увеличивает изображение
+
+        webp_filename = f"{base_name}_{size_name}.webp"
+        img_copy.save(os.path.join(media_dir, webp_filename), format="WEBP", quality=80, optimize=True)
+        files[size_name] = webp_filename
+    finished = time.perf_counter()
+
+    return {
+        "files": files,
+        "decode_ms": (decoded - started) * 1000,
+        "encode_ms": (finished - decoded) * 1000,
+    }
+
+
+def render_resized(source_path: str, width: int, fmt: str, quality: int) -> bytes:
+    """Масштабирует изображение до ширины width (без увеличения) и кодирует в формат fmt."""
+    pillow_format = OUTPUT_FORMATS[fmt][0]
+    with PillowImage.open(source_path) as source:
+        img = ImageOps.exif_transpose(source)
+        # JPEG не поддерживает прозрачность, остальные форматы сохраняют альфа-канал
+        img = img.convert("RGB" if fmt == "jpeg" or img.mode not in ("RGBA", "LA") else "RGBA")
+    if img.width > width:
+        img.thumbnail((width, round(img.height * width / img.width)), PillowImage.LANCZOS)
+
+    buffer = io.BytesIO()
+    options = {"quality": quality}
+    if fmt == "jpeg":
+        options.update(optimize=True, progressive=True)
+    elif fmt == "webp":
+        options["method"] = 4
+    img.save(buffer, format=pillow_format, **options)
+    return buffer.getvalue()
+
+
+def render_avatar(source_path: str, dest_path: str, size: int) -> None:
+    """Квадратная WebP-миниатюра аватара size x size (центральная обрезка)."""
+    with PillowImage.open(source_path) as source:
+        img = ImageOps.exif_transpose(source)
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+    thumb = ImageOps.fit(img, (size, size), PillowImage.LANCZOS)
+    thumb.save(dest_path, format="WEBP", quality=80, method=4)
@@ -0,0 +1,568 @@
+# backend/config/inventory.py
+"""
+Атомарные операции с остатком билетов.
+
+Остаток меняется только условными UPDATE ... RETURNING: проверка "есть ли места"
+и инкремент выполняются одной командой в БД, поэтому параллельные регистрации
+не могут продать больше available_quantity и не требуют чтения строки в Python.
+
+Для популярных мероприятий емкость типа билета можно разделить на N строк
+ticket_inventory_shards (configure_shards): регистрации занимают места в случайной
+строке, а сумма периодически сводится в ticket_types.sold_quantity (InventoryRollupScheduler).
+Точный остаток в любом режиме - представление ticket_inventory.
+"""
+import asyncio
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import (
+    Integer, String, TIMESTAMP, bindparam, case, cast, delete, exists, false, func, insert, literal, select, text, true, union_all,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from constants import MAX_REGISTRATION_CANCELLATIONS
+from backend.config.logging_config import logger
+from backend.config.response_cache import invalidate_event_caches
+from backend.database.user_db import AsyncSessionLocal, Event, Registration, TicketInventoryShard, TicketType, ticket_inventory
+from backend.schemas_enums.enums import EventStatus, Status
+
+# --- Загрузка конфигурации из .env ---
+# Период сведения шардированных счетчиков в ticket_types.sold_quantity (0 - выключено)
+INVENTORY_ROLLUP_SECONDS = int(os.getenv("INVENTORY_ROLLUP_SECONDS", "10"))
+MAX_INVENTORY_SHARDS = int(os.getenv("MAX_INVENTORY_SHARDS", "256"))
+# --- Конец загрузки конфигурации ---
+
+
+async def current_sold(db: AsyncSession, tickets: Iterable[TicketType]) -> Dict[int, int]:
+    """
+    Проданные места по типам билетов (ticket_type_id -> sold). Для шардированных типов
+    sold_quantity сводится периодически, поэтому их значение читается из ticket_inventory
+    одним запросом; остальные берутся из уже загруженных строк.
+    """
+    tickets = list(tickets)
+    sold = {ticket.id: ticket.sold_quantity or 0 for ticket in tickets}
+    sharded = [ticket.id for ticket in tickets if ticket.shard_count]
+    if sharded:
+        result = await db.execute(
+            select(ticket_inventory.c.ticket_type_id, ticket_inventory.c.sold_quantity)
+            .where(ticket_inventory.c.ticket_type_id.in_(sharded))
+        )
+        sold.update({ticket_type_id: value or 0 for ticket_type_id, value in result.all()})
+    return sold
+
+
+def first_ticket_id(event_id: int):
+    """Основной (первый) тип билета мероприятия."""
+    return (
+        select(TicketType.id)
+        .where(TicketType.event_id == event_id)
+        .order_by(TicketType.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def _event_open(event_id: int):
+    return exists().where(
+        Event.id == event_id, Event.status == EventStatus.registration_open, Event.deleted_at.is_(None)
+    )
+
+
+def reserved_cte(event_id: int, quantity: int = 1, skip_locked: bool = True):
+    """
+    CTE "reserved", занимающий места только если они есть и регистрация открыта.
+
+    Обычный тип билета - условный UPDATE строки ticket_types. Шардированный (shard_count > 0) -
+    UPDATE одной строки ticket_inventory_shards: строки перебираются в случайном порядке,
+    заблокированные параллельными регистрациями пропускаются (SKIP LOCKED), исчерпанные
+    отсеиваются условием, поэтому занятая или пустая строка не останавливает регистрацию.
+    Колонки: id, name, price, free_registration, sold_quantity, available_quantity.
+    """
+    ticket_id = first_ticket_id(event_id)
+    sold = func.coalesce(TicketType.sold_quantity, 0)
+    plain = (
+        update(TicketType)
+        .where(TicketType.id == ticket_id)
+        .where(TicketType.shard_count == 0)
+        .where(sold + quantity <= TicketType.available_quantity)
+        .where(_event_open(event_id))
+        .values(sold_quantity=sold + quantity)
+        .returning(
+            TicketType.id,
+            TicketType.name,
+            TicketType.price,
+            TicketType.free_registration,
+            TicketType.sold_quantity,
+            TicketType.available_quantity,
+        )
+        .cte("plain_reserved")
+    )
+
+    # Строка-шард выбирается и блокируется в отдельном материализованном CTE. Подзапрос с
+    # FOR UPDATE в WHERE самого UPDATE при перепроверке измененной строки (EvalPlanQual)
+    # выполнялся заново и блокировал второй шард - параллельные регистрации попадали в deadlock
+    picked = (
+        select(TicketInventoryShard.ticket_type_id, TicketInventoryShard.shard_no)
+        .where(TicketInventoryShard.ticket_type_id == ticket_id)
+        .where(TicketInventoryShard.sold + quantity <= TicketInventoryShard.capacity)
+        # Без SKIP LOCKED шарды ждут в общем порядке: ожидание не может замкнуться в цикл
+        .order_by(func.random() if skip_locked else TicketInventoryShard.shard_no)
+        .limit(1)
+        .with_for_update(skip_locked=skip_locked)
+        .cte("picked_shard")
+        .prefix_with("MATERIALIZED")
+    )
+    shard = (
+        update(TicketInventoryShard)
+        .where(TicketInventoryShard.ticket_type_id == picked.c.ticket_type_id)
+        .where(TicketInventoryShard.shard_no == picked.c.shard_no)
+        .where(TicketInventoryShard.sold + quantity <= TicketInventoryShard.capacity)
+        .where(_event_open(event_id))
+        .values(sold=TicketInventoryShard.sold + quantity)
+        .returning(TicketInventoryShard.ticket_type_id)
+        .cte("shard_reserved")
+    )
+    # Сумма по шардам читается из снимка до изменения, поэтому добавляем занятые места
+    shards_sold = (
+        select(func.coalesce(func.sum(TicketInventoryShard.sold), 0))
+        .where(TicketInventoryShard.ticket_type_id == TicketType.id)
+        .scalar_subquery()
+    )
+    sharded = (
+        select(
+            TicketType.id,
+            TicketType.name,
+            TicketType.price,
+            TicketType.free_registration,
+            (shards_sold + quantity).label("sold_quantity"),
+            TicketType.available_quantity,
+        )
+        .where(TicketType.id == shard.c.ticket_type_id)
+    )
+    return union_all(select(plain), sharded).cte("reserved")
+
+
+def released_cte(ticket_type_id, quantity: int = 1):
+    """
+    CTE "released", возвращающий места в остаток (строку ticket_types или одну из строк-шардов).
+    Для шардированного билета sold_quantity/available_quantity относятся к шарду -
+    их достаточно, чтобы понять, что места снова есть.
+    """
+    plain = (
+        update(TicketType)
+        .where(TicketType.id == ticket_type_id)
+        .where(TicketType.shard_count == 0)
+        .values(sold_quantity=func.greatest(func.coalesce(TicketType.sold_quantity, 0) - quantity, 0))
+        .returning(TicketType.id, TicketType.sold_quantity, TicketType.available_quantity)
+        .cte("plain_released")
+    )
+    # Как в reserved_cte: блокировка одной строки в материализованном CTE, шарды - по порядку
+    picked = (
+        select(TicketInventoryShard.ticket_type_id, TicketInventoryShard.shard_no)
+        .where(TicketInventoryShard.ticket_type_id == ticket_type_id)
+        .where(TicketInventoryShard.sold >= quantity)
+        .order_by(TicketInventoryShard.shard_no)
+        .limit(1)
+        .with_for_update()
+        .cte("picked_release_shard")
+        .prefix_with("MATERIALIZED")
+    )
+    shard = (
+        update(TicketInventoryShard)
+        .where(TicketInventoryShard.ticket_type_id == picked.c.ticket_type_id)
+        .where(TicketInventoryShard.shard_no == picked.c.shard_no)
+        .values(sold=TicketInventoryShard.sold - quantity)
+        .returning(
+            TicketInventoryShard.ticket_type_id.label("id"),
+            TicketInventoryShard.sold.label("sold_quantity"),
+            TicketInventoryShard.capacity.label("available_quantity"),
+        )
+        .cte("shard_released")
+    )
+    return union_all(select(plain), select(shard)).cte("released")
+
+
+# Команды резервирования строятся один раз, значения передаются параметрами: сборка CTE
+# и ключа кэша компиляции SQLAlchemy стоили больше самого запроса к БД
+@lru_cache(maxsize=None)
+def _reserve_statement(quantity: int, skip_locked: bool):
+    return select(reserved_cte(bindparam("reserve_event_id", type_=Integer), quantity, skip_locked))
+
+
+async def reserve_ticket(db: AsyncSession, event_id: int, quantity: int = 1) -> Optional[Row]:
+    """Занимает места; None - мест нет или регистрация закрыта."""
+    for skip_locked in (True, False):
+        result = await db.execute(
+            _reserve_statement(quantity, skip_locked), {"reserve_event_id": event_id},
+            execution_options={"synchronize_session": False},
+        )
+        row = result.first()
+        if row is not None:
+            return row
+    return None
+
+
+async def release_ticket(db: AsyncSession, ticket_type_id: int, quantity: int = 1) -> Optional[Row]:
+    released = released_cte(literal(ticket_type_id, Integer), quantity)
+    result = await db.execute(select(released), execution_options={"synchronize_session": False})
+    return result.first()
+
+
+ACTIVE_REGISTRATION_WHERE = text("status <> 'cancelled'")
+
+
+async def reserve_and_register(
+    db: AsyncSession,
+    *,
+    user_id: int,
+    event_id: int,
+    ticket_number: str,
+    status: Status = Status.approved,
+    hold_expires_at: Optional[datetime] = None,
+) -> Optional[Row]:
+    """
+    Одной командой занимает место и создает регистрацию (или реактивирует последнюю отмененную).
+    Для временной брони передается status=pending и hold_expires_at.
+
+    Повторную регистрацию отсекает частичный уникальный индекс активных регистраций:
+    INSERT ... ON CONFLICT DO NOTHING ничего не вставляет, а реактивация параллельно
+    с активной регистрацией завершается IntegrityError. Лимит отмен проверяется
+    условием реактивации, поэтому предварительные SELECT не нужны.
+
+    Возвращает строку (registration_id, ticket_type_id, name, price, free_registration,
+    sold_quantity, available_quantity)
+    или None, если мест нет / регистрация закрыта. registration_id равен None, если место
+    занято, но регистрацию записать нельзя (уже есть активная или исчерпан лимит отмен) -
+    в этом случае вызывающий код должен откатить транзакцию.
+    """
+    # Первая попытка пропускает заблокированные шарды; если все свободные шарды были заняты
+    # параллельными регистрациями, вторая ждет блокировку, чтобы не отказать при наличии мест
+    for skip_locked in (True, False):
+        row = await _reserve_and_register(
+            db, user_id, event_id, ticket_number, status, hold_expires_at, skip_locked
+        )
+        if row is not None:
+            return row
+    return None
+
+
+async def _reserve_and_register(
+    db: AsyncSession,
+    user_id: int,
+    event_id: int,
+    ticket_number: str,
+    status: Status,
+    hold_expires_at: Optional[datetime],
+    skip_locked: bool,
+) -> Optional[Row]:
+    result = await db.execute(
+        _register_statement(status, skip_locked),
+        {
+            "reg_user_id": user_id,
+            "reg_event_id": event_id,
+            "reg_ticket_number": ticket_number,
+            "reg_now": datetime.utcnow(),
+            "reg_hold_expires_at": hold_expires_at,
+        },
+    )
+    return result.first()
+
+
+@lru_cache(maxsize=None)
+def _register_statement(status: Status, skip_locked: bool):
+    """Команда reserve_and_register для статуса; значения подставляются параметрами reg_*."""
+    user_id = bindparam("reg_user_id", type_=Integer)
+    event_id = bindparam("reg_event_id", type_=Integer)
+    ticket_number = bindparam("reg_ticket_number", type_=String)
+    now = bindparam("reg_now", type_=TIMESTAMP)
+    hold_expires_at = bindparam("reg_hold_expires_at", type_=TIMESTAMP)
+    reserved = reserved_cte(event_id, skip_locked=skip_locked)
+    amount_paid = case((reserved.c.free_registration == true(), 0), else_=reserved.c.price)
+    status_type = Registration.__table__.c.status.type
+    # Бесплатный билет считается оплаченным сразу; бронь - нет (оплату отмечает администратор)
+    if status == Status.approved:
+        payment_status = func.coalesce(reserved.c.free_registration, false())
+    else:
+        payment_status = false()
+
+    cancelled_regs = (
+        select(Registration.id)
+        .where(
+            Registration.user_id == user_id,
+            Registration.event_id == event_id,
+            Registration.status == Status.cancelled.name,
+        )
+    )
+    # Отмененная регистрация переиспользуется, чтобы счетчик отмен сохранялся
+    reactivated = (
+        update(Registration)
+        .where(Registration.id == cancelled_regs.order_by(Registration.submission_time.desc()).limit(1).scalar_subquery())
+        .where(Registration.status == Status.cancelled.name)
+        .where(Registration.cancellation_count < MAX_REGISTRATION_CANCELLATIONS)
+        .values(
+            status=status.name,
+            ticket_type_id=reserved.c.id,
+            ticket_number=ticket_number,
+            payment_status=payment_status,
+            amount_paid=amount_paid,
+            submission_time=now,
+            hold_expires_at=hold_expires_at,
+        )
+        .returning(Registration.id)
+        .cte("reactivated")
+    )
+    inserted = (
+        pg_insert(Registration)
+        .from_select(
+            [
+                "user_id", "event_id", "ticket_type_id", "ticket_number", "payment_status",
+                "status", "amount_paid", "cancellation_count", "submission_time", "hold_expires_at",
+            ],
+            select(
+                user_id,
+                event_id,
+                reserved.c.id,
+                ticket_number,
+                payment_status,
+                cast(literal(status.name), status_type),
+                amount_paid,
+                literal(0, Integer),
+                now,
+                hold_expires_at,
+            ).where(~exists(cancelled_regs)),
+        )
+        .on_conflict_do_nothing(index_elements=["user_id", "event_id"], index_where=ACTIVE_REGISTRATION_WHERE)
+        .returning(Registration.id)
+        .cte("inserted")
+    )
+
+    return select(
+        func.coalesce(
+            select(reactivated.c.id).scalar_subquery(),
+            select(inserted.c.id).scalar_subquery(),
+        ).label("registration_id"),
+        reserved.c.id.label("ticket_type_id"),
+        reserved.c.name,
+        reserved.c.price,
+        reserved.c.free_registration,
+        reserved.c.sold_quantity,
+        reserved.c.available_quantity,
+    )
+
+
+async def _cancel_and_release(db: AsyncSession, conditions: list, count_cancellation: bool) -> Optional[Row]:
+    values = {"status": Status.cancelled.name, "hold_expires_at": None}
+    if count_cancellation:
+        values["cancellation_count"] = Registration.cancellation_count + 1
+    cancelled = (
+        update(Registration)
+        .where(*conditions)
+        .values(**values)
+        .returning(Registration.id, Registration.event_id, Registration.ticket_type_id)
+        .cte("cancelled")
+    )
+    released = released_cte(select(cancelled.c.ticket_type_id).limit(1).scalar_subquery())
+    stmt = (
+        select(
+            cancelled.c.id.label("registration_id"),
+            cancelled.c.event_id,
+            released.c.sold_quantity,
+            released.c.available_quantity,
+        )
+        .select_from(cancelled.outerjoin(released, released.c.id == cancelled.c.ticket_type_id))
+        .limit(1)
+    )
+    result = await db.execute(stmt)
+    return result.first()
+
+
+async def cancel_and_release(db: AsyncSession, *, user_id: int, event_id: int) -> Optional[Row]:
+    """
+    Одной командой отменяет активную регистрацию и возвращает место в остаток.
+    Параллельная повторная отмена не найдет активной регистрации и не уменьшит счетчик дважды.
+    """
+    return await _cancel_and_release(
+        db,
+        [
+            Registration.user_id == user_id,
+            Registration.event_id == event_id,
+            Registration.status != Status.cancelled.name,
+        ],
+        count_cancellation=True,
+    )
+
+
+async def release_hold(
+    db: AsyncSession, hold_id: int, user_id: Optional[int] = None, expired_only: bool = False
+) -> Optional[Row]:
+    """
+    Снимает временную бронь (истекшую или отмененную пользователем) и возвращает место.
+    Срабатывает только для брони в статусе pending, поэтому подтвержденная или уже
+    снятая бронь не будет освобождена повторно. Лимит отмен не расходуется.
+    """
+    conditions = [
+        Registration.id == hold_id,
+        Registration.status == Status.pending.name,
+        Registration.hold_expires_at.isnot(None),
+    ]
+    if user_id is not None:
+        conditions.append(Registration.user_id == user_id)
+    if expired_only:
+        conditions.append(Registration.hold_expires_at <= datetime.utcnow())
+    return await _cancel_and_release(db, conditions, count_cancellation=False)
+
+
+async def confirm_hold(db: AsyncSession, hold_id: int, user_id: int, mark_paid: bool = False) -> Optional[Row]:
+    """
+    Подтверждает действующую бронь: место уже учтено в остатке, строку билета не трогаем.
+    payment_status не меняется (как при обычной регистрации); mark_paid=True - только для
+    бесплатного билета, оплата которого не требуется.
+    """
+    values = {"status": Status.approved.name, "hold_expires_at": None}
+    if mark_paid:
+        values["payment_status"] = True
+    result = await db.execute(
+        update(Registration)
+        .where(
+            Registration.id == hold_id,
+            Registration.user_id == user_id,
+            Registration.status == Status.pending.name,
+            Registration.hold_expires_at > datetime.utcnow(),
+        )
+        .values(**values)
+        .returning(Registration.id, Registration.event_id, Registration.ticket_number, Registration.amount_paid),
+        execution_options={"synchronize_session": False},
+    )
+    return result.first()
+
+
+async def close_registration(db: AsyncSession, event_id: int) -> None:
+    """Закрывает регистрацию, если она еще открыта (распроданы билеты)."""
+    await db.execute(
+        update(Event)
+        .where(Event.id == event_id, Event.status == EventStatus.registration_open)
+        .values(status=EventStatus.registration_closed),
+        execution_options={"synchronize_session": False},
+    )
+
+
+async def reopen_registration(db: AsyncSession, event_id: int) -> None:
+    """Открывает регистрацию, закрытую из-за отсутствия мест."""
+    await db.execute(
+        update(Event)
+        .where(Event.id == event_id, Event.status == EventStatus.registration_closed)
+        .values(status=EventStatus.registration_open),
+        execution_options={"synchronize_session": False},
+    )
+
+
+def split_evenly(total: int, parts: int) -> List[int]:
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+async def configure_shards(db: AsyncSession, ticket_type_id: int, shard_count: int) -> Optional[TicketType]:
+    """
+    Включает (shard_count > 0), перестраивает или выключает (0) шардирование остатка.
+    Проданные места переносятся без потерь: строки билета и шардов блокируются на время
+    перестройки, емкость и продажи распределяются по шардам равномерно.
+    Транзакцию фиксирует вызывающий код.
+    """
+    if not 0 <= shard_count <= MAX_INVENTORY_SHARDS:
+        raise ValueError(f"shard_count must be between 0 and {MAX_INVENTORY_SHARDS}")
+    ticket = (
+        await db.execute(select(TicketType).where(TicketType.id == ticket_type_id).with_for_update())
+    ).scalar_one_or_none()
+    if ticket is None:
+        return None
+
+    shard_sold = (
+        await db.execute(
+            select(TicketInventoryShard.sold)
+            .where(TicketInventoryShard.ticket_type_id == ticket_type_id)
+            .with_for_update()
+        )
+    ).scalars().all()
+    sold = sum(shard_sold) if ticket.shard_count > 0 else (ticket.sold_quantity or 0)
+
+    await db.execute(delete(TicketInventoryShard).where(TicketInventoryShard.ticket_type_id == ticket_type_id))
+    if shard_count > 0:
+        # Если емкость уменьшили ниже проданного, свободных мест в шардах просто не остается
+        capacities = split_evenly(max(ticket.available_quantity, sold), shard_count)
+        await db.execute(
+            insert(TicketInventoryShard),
+            [
+                {"ticket_type_id": ticket_type_id, "shard_no": no, "capacity": capacity, "sold": shard_sold_part}
+                for no, (capacity, shard_sold_part) in enumerate(zip(capacities, split_evenly(sold, shard_count)))
+            ],
+        )
+    ticket.shard_count = shard_count
+    ticket.sold_quantity = sold
+    logger.info(f"Ticket type {ticket_type_id} inventory configured with {shard_count} shards (sold={sold})")
+    return ticket
+
+
+async def rollup_sharded_counters(db: AsyncSession) -> List[int]:
+    """Сводит суммы шардов в ticket_types.sold_quantity; возвращает мероприятия с изменениями."""
+    totals = (
+        select(
+            TicketInventoryShard.ticket_type_id,
+            func.sum(TicketInventoryShard.sold).label("sold"),
+        )
+        .group_by(TicketInventoryShard.ticket_type_id)
+        .subquery()
+    )
+    result = await db.execute(
+        update(TicketType)
+        .where(TicketType.id == totals.c.ticket_type_id)
+        .where(TicketType.shard_count > 0)
+        .where(TicketType.sold_quantity.is_distinct_from(totals.c.sold))
+        .values(sold_quantity=totals.c.sold)
+        .returning(TicketType.event_id),
+        execution_options={"synchronize_session": False},
+    )
+    return sorted(set(result.scalars().all()))
+
+
+class InventoryRollupScheduler:
+    """Периодическое сведение шардированных счетчиков внутри процесса сервера."""
+
+    def __init__(self, interval_seconds: int):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                async with AsyncSessionLocal() as db:
+                    event_ids = await rollup_sharded_counters(db)
+                    await db.commit()
+                for event_id in event_ids:
+                    await invalidate_event_caches(event_id)
+            except Exception as e:
+                logger.error(f"Error during inventory rollup: {str(e)}", exc_info=True)
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0:
+            logger.info("Inventory rollup scheduler is disabled")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Inventory rollup scheduled every {self.interval_seconds} seconds")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+inventory_rollup_scheduler = InventoryRollupScheduler(INVENTORY_ROLLUP_SECONDS)
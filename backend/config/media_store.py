@@ -0,0 +1,219 @@
+# backend/config/media_store.py
+"""
+Контентно-адресуемое хранилище медиафайлов.
+
+Загрузка хранится под sha256 содержимого ({hash}_original.ext, производные версии -
+{hash}_{variant}.webp), поэтому одинаковые загрузки дедуплицируются, а URL неизменны и
+отдаются с Cache-Control: immutable. Файлы раскладываются по двухуровневым каталогам
+по префиксу хэша (ab/cd/{hash}_...), чтобы каталоги не разрастались.
+
+Таблица media_objects считает ссылки из Event.image_url, User.avatar_url и Media.url:
+счетчик меняется в той же транзакции, что и столбец с URL, а файлы объектов без ссылок
+удаляются после коммита (discard_media) по манифесту версий, без сканирования каталогов.
+
+Файлы лежат в хранилище backend/config/storage.py (локальный каталог или S3); ключ объекта -
+путь относительно корня хранилища (media_relpath).
+"""
+import os
+import re
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import cast, select, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+
+from backend.config.logging_config import logger
+from backend.config.storage import MEDIA_DIR, LocalStorage, storage
+from backend.config.uploads import receive_upload
+from backend.database.user_db import AsyncSession, AsyncSessionLocal, MediaObject
+from constants import CACHE_CONTROL
+
+# Имя файла хранилища: {sha256}_{версия}.{расширение}
+MEDIA_FILENAME_RE = re.compile(r"^([0-9a-f]{64})_([a-z]+)\.[a-z0-9]+$")
+# Префикс URL, под которым смонтирован MEDIA_DIR
+MEDIA_URL_PREFIX = "/images/"
+
+
+def media_id_from_url(url: Optional[str]) -> Optional[str]:
+    """sha256 объекта по URL или имени файла; None для файлов со старыми uuid-именами."""
+    if not url:
+        return None
+    match = MEDIA_FILENAME_RE.match(os.path.basename(url))
+    return match.group(1) if match else None
+
+
+def media_relpath(filename: str) -> str:
+    """Путь файла относительно MEDIA_DIR: ab/cd/{hash}_... для хранилища, как есть для старых имен."""
+    media_id = media_id_from_url(filename)
+    if media_id is None:
+        return filename
+    return f"{media_id[:2]}/{media_id[2:4]}/{filename}"
+
+
+def media_path(filename: str) -> str:
+    """Путь файла в локальном хранилище (для скриптов обслуживания каталога)."""
+    return os.path.join(MEDIA_DIR, media_relpath(filename))
+
+
+def media_url(filename: str) -> str:
+    return f"{MEDIA_URL_PREFIX}{media_relpath(filename)}"
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles, отдающий файлы хранилища с Cache-Control: immutable (содержимое по имени не меняется)."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if media_id_from_url(str(full_path)) is not None:
+            response.headers["Cache-Control"] = CACHE_CONTROL["images"]
+        return response
+
+
+async def serve_media(key: str):
+    """Отдача файла из хранилища без локального каталога (MEDIA_STORAGE_BACKEND=s3)."""
+    if ".." in key.split("/"):
+        raise HTTPException(status_code=404, detail="Not Found")
+    headers = {"Cache-Control": CACHE_CONTROL["images"]} if media_id_from_url(key) is not None else None
+    response = await storage.response(key, headers)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
+
+
+def mount_media(app: FastAPI) -> None:
+    """Подключает раздачу хранилища по MEDIA_URL_PREFIX: StaticFiles для каталога, потоковый маршрут для S3."""
+    if isinstance(storage, LocalStorage):
+        app.mount(MEDIA_URL_PREFIX.rstrip("/"), ImmutableStaticFiles(directory=storage.root), name="images")
+    else:
+        app.add_api_route(f"{MEDIA_URL_PREFIX}{{key:path}}", serve_media, methods=["GET"], include_in_schema=False)
+
+
+async def acquire(db: AsyncSession, media_id: str, extension: str, size: int) -> None:
+    """Добавляет ссылку на объект (создает его при первой загрузке). Строка блокируется до коммита."""
+    original = f"{media_id}_original.{extension}"
+    await db.execute(
+        pg_insert(MediaObject)
+        .values(id=media_id, extension=extension, size=size, ref_count=1, variants={"original": original})
+        .on_conflict_do_update(
+            index_elements=[MediaObject.id],
+            # После очистки манифест пуст - оригинал возвращается в него при повторной загрузке
+            set_={
+                "ref_count": MediaObject.ref_count + 1,
+                "variants": MediaObject.variants.op("||")(cast({"original": original}, JSONB)),
+                "updated_at": datetime.utcnow(),
+            },
+        )
+    )
+
+
+async def release(db: AsyncSession, url: Optional[str]) -> None:
+    """Снимает ссылку столбца с URL; файлы удаляет discard_media после коммита."""
+    media_id = media_id_from_url(url)
+    if media_id is None:
+        return
+    await db.execute(
+        update(MediaObject)
+        .where(MediaObject.id == media_id, MediaObject.ref_count > 0)
+        .values(ref_count=MediaObject.ref_count - 1, updated_at=datetime.utcnow())
+    )
+
+
+async def record_variants(db: AsyncSession, media_id: str, files: Dict[str, str]) -> None:
+    """Добавляет созданные файлы версий в манифест объекта."""
+    await db.execute(
+        update(MediaObject)
+        .where(MediaObject.id == media_id)
+        .values(variants=MediaObject.variants.op("||")(cast(files, JSONB)))
+    )
+
+
+async def media_files(media_id: str) -> Optional[Dict[str, str]]:
+    """Манифест объекта (версия -> имя файла) или None, если объекта нет."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(MediaObject.variants).where(MediaObject.id == media_id))
+        return result.scalar_one_or_none()
+
+
+async def place_upload(tmp_key: str, filename: str) -> None:
+    """Переносит принятую загрузку под постоянное имя; вызывать, удерживая ссылку или в период ожидания сборщика."""
+    key = media_relpath(filename)
+    if await storage.exists(key):
+        # Содержимое совпадает по хэшу - повторная загрузка не копируется
+        await storage.delete([tmp_key])
+    else:
+        await storage.move(tmp_key, key)
+
+
+async def store_upload(
+    db: AsyncSession, upload: UploadFile, *, max_bytes: int, allowed_types: Iterable[str]
+) -> str:
+    """
+    Принимает загрузку в хранилище и добавляет на нее ссылку в транзакции db.
+    Возвращает имя оригинала {hash}_original.{ext}; повторная загрузка того же файла
+    дает то же имя и не занимает место на диске.
+    """
+    tmp_key, media_id, extension, size = await receive_upload(
+        upload, max_bytes=max_bytes, allowed_types=allowed_types
+    )
+    filename = f"{media_id}_original.{extension}"
+    try:
+        await acquire(db, media_id, extension, size)
+        # Файл занимает постоянное имя после acquire: строка объекта заблокирована до коммита,
+        # и параллельный discard_media не удалит файл, на который появляется ссылка
+        await place_upload(tmp_key, filename)
+    except BaseException:
+        await storage.delete([tmp_key])
+        raise
+    logger.info(f"Stored media object {media_id} ({size} bytes)")
+    return filename
+
+
+async def purge_unreferenced(media_id: str) -> bool:
+    """Удаляет файлы объекта, если на него не осталось ссылок. Строка с ref_count = 0 сохраняется."""
+    async with AsyncSessionLocal() as db:
+        locked = await db.execute(
+            select(MediaObject.variants)
+            .where(MediaObject.id == media_id, MediaObject.ref_count == 0)
+            .with_for_update()
+        )
+        variants = locked.scalar_one_or_none()
+        if variants is None:
+            return False
+        # Файлы удаляются под блокировкой строки: новая ссылка на объект дождется коммита
+        removed = await storage.delete(media_relpath(name) for name in variants.values())
+        await db.execute(update(MediaObject).where(MediaObject.id == media_id).values(variants={}))
+        await db.commit()
+    logger.info(f"Purged unreferenced media object {media_id} ({removed} files)")
+    return True
+
+
+async def _remove_legacy_files(url: str) -> None:
+    # Старые файлы с uuid-именами: /images/{uuid}_medium.webp, /images/users_avatars/{uuid}.jpg.
+    # Внешние ссылки (Media.url) и пути вне MEDIA_DIR не трогаем
+    if not url.startswith(MEDIA_URL_PREFIX):
+        return
+    directory, filename = os.path.split(url[len(MEDIA_URL_PREFIX):])
+    legacy_id = filename.split(".")[0].split("_")[0]
+    if legacy_id and ".." not in directory.split("/"):
+        prefix = f"{directory}/{legacy_id}" if directory else legacy_id
+        await storage.delete([stored.key async for stored in storage.iter_objects(prefix)])
+
+
+async def discard_media(urls: Iterable[Optional[str]]) -> None:
+    """
+    Вызывается после коммита для URL, ссылки на которые сняты release: удаляет файлы
+    объектов без ссылок и старые файлы с uuid-именами. Ошибки только логируются.
+    """
+    for url in urls:
+        if not url:
+            continue
+        try:
+            media_id = media_id_from_url(url)
+            if media_id is not None:
+                await purge_unreferenced(media_id)
+            else:
+                await _remove_legacy_files(url)
+        except Exception as e:
+            logger.error(f"Failed to discard media {url}: {e!r}")
@@ -0,0 +1,166 @@
+# backend/config/notification_buffer.py
+import asyncio
+import os
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import Integer, String, TIMESTAMP, column, update, values
+
+from backend.config.logging_config import logger
+from backend.database.user_db import AsyncSessionLocal, NotificationView
+
+# --- Загрузка конфигурации из .env ---
+# Предполагается, что load_dotenv() вызывается где-то при старте приложения
+NOTIFICATION_VIEW_FLUSH_MS_STR = os.getenv("NOTIFICATION_VIEW_FLUSH_MS", "250")
+try:
+    NOTIFICATION_VIEW_FLUSH_MS = int(NOTIFICATION_VIEW_FLUSH_MS_STR)
+except ValueError:
+    logger.error(f"Неверное значение для NOTIFICATION_VIEW_FLUSH_MS: {NOTIFICATION_VIEW_FLUSH_MS_STR}. Используется значение по умолчанию 250.")
+    NOTIFICATION_VIEW_FLUSH_MS = 250
+# --- Конец загрузки конфигурации ---
+
+# Ключ получателя: (user_id, None) для пользователя или (None, fingerprint) для устройства
+RecipientKey = Tuple[Optional[int], Optional[str]]
+
+
+def _recipient_key(user_id: Optional[int], fingerprint: Optional[str]) -> RecipientKey:
+    return (user_id, None) if user_id is not None else (None, fingerprint)
+
+
+class NotificationViewBuffer:
+    """
+    Write-behind буфер отметок о просмотре уведомлений.
+
+    Отметки копятся в памяти процесса (схлопываясь по получателю и template_id)
+    и сбрасываются в БД пачкой раз в `flush_interval` секунд. Пока отметка не
+    записана, `pending_for` позволяет отдавать клиенту актуальное состояние.
+
+    Буфер свой у каждого процесса (воркера uvicorn): запрос, попавший в другой воркер,
+    видит отметку только после сброса, то есть с задержкой до `flush_interval`.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[RecipientKey, Dict[int, datetime]] = {}
+        self._inflight: Dict[RecipientKey, Dict[int, datetime]] = {}
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def mark(self, user_id: Optional[int], fingerprint: Optional[str], template_ids: Iterable[int]) -> datetime:
+        """Ставит отметки в очередь и возвращает время просмотра."""
+        now = datetime.utcnow()
+        marks = self._pending.setdefault(_recipient_key(user_id, fingerprint), {})
+        for template_id in template_ids:
+            # Сохраняем время первого клика, повторные клики ничего не меняют
+            marks.setdefault(template_id, now)
+        return now
+
+    def pending_for(self, user_id: Optional[int], fingerprint: Optional[str]) -> Dict[int, datetime]:
+        """Отметки получателя, которые еще не записаны в БД."""
+        key = _recipient_key(user_id, fingerprint)
+        merged = dict(self._inflight.get(key, {}))
+        merged.update(self._pending.get(key, {}))
+        return merged
+
+    def rebind(self, fingerprint: str, user_id: int) -> None:
+        """Переносит несохраненные отметки устройства на пользователя (логин/регистрация)."""
+        # Отметки, взятые в текущий сброс, пишутся по fingerprint и могут не попасть в строки,
+        # уже перепривязанные к пользователю, - повторяем их для пользователя (повтор безвреден:
+        # UPDATE не трогает просмотренные строки)
+        marks = dict(self._inflight.get((None, fingerprint), {}))
+        marks.update(self._pending.pop((None, fingerprint), {}))
+        if marks:
+            user_marks = self._pending.setdefault((user_id, None), {})
+            for template_id, viewed_at in marks.items():
+                user_marks.setdefault(template_id, viewed_at)
+
+    def discard(self, user_id: Optional[int], fingerprint: Optional[str]) -> None:
+        """Отбрасывает несохраненные отметки (например, после очистки уведомлений)."""
+        self._pending.pop(_recipient_key(user_id, fingerprint), None)
+
+    async def flush(self) -> int:
+        """Записывает накопленные отметки одним UPDATE ... FROM (VALUES ...) на тип получателя."""
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            self._inflight, self._pending = self._pending, {}
+
+            user_rows = []
+            device_rows = []
+            for (user_id, fingerprint), marks in self._inflight.items():
+                for template_id, viewed_at in marks.items():
+                    if user_id is not None:
+                        user_rows.append((template_id, user_id, viewed_at))
+                    elif fingerprint:
+                        device_rows.append((template_id, fingerprint, viewed_at))
+
+            try:
+                updated = 0
+                async with AsyncSessionLocal() as session:
+                    if user_rows:
+                        marks = values(
+                            column("template_id", Integer),
+                            column("user_id", Integer),
+                            column("viewed_at", TIMESTAMP),
+                            name="user_marks",
+                        ).data(user_rows)
+                        stmt = (
+                            update(NotificationView)
+                            .where(NotificationView.template_id == marks.c.template_id)
+                            .where(NotificationView.user_id == marks.c.user_id)
+                            .where(NotificationView.is_viewed.isnot(True))
+                            .values(is_viewed=True, viewed_at=marks.c.viewed_at)
+                        )
+                        updated += (await session.execute(stmt)).rowcount
+                    if device_rows:
+                        marks = values(
+                            column("template_id", Integer),
+                            column("fingerprint", String),
+                            column("viewed_at", TIMESTAMP),
+                            name="device_marks",
+                        ).data(device_rows)
+                        stmt = (
+                            update(NotificationView)
+                            .where(NotificationView.template_id == marks.c.template_id)
+                            .where(NotificationView.fingerprint == marks.c.fingerprint)
+                            .where(NotificationView.is_viewed.isnot(True))
+                            .values(is_viewed=True, viewed_at=marks.c.viewed_at)
+                        )
+                        updated += (await session.execute(stmt)).rowcount
+                    await session.commit()
+                logger.debug(f"Flushed {len(user_rows) + len(device_rows)} notification view marks, {updated} rows updated")
+                return updated
+            except Exception as e:
+                logger.error(f"Error flushing notification view marks: {str(e)}")
+                # Возвращаем отметки в буфер, чтобы повторить попытку при следующем сбросе
+                for key, marks in self._inflight.items():
+                    pending = self._pending.setdefault(key, {})
+                    for template_id, viewed_at in marks.items():
+                        pending.setdefault(template_id, viewed_at)
+                return 0
+            finally:
+                self._inflight = {}
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Notification view buffer started (flush every {self.flush_interval:.3f}s)")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Дописываем всё, что осталось в буфере
+        await self.flush()
+
+
+notification_view_buffer = NotificationViewBuffer(NOTIFICATION_VIEW_FLUSH_MS / 1000)
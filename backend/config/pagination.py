@@ -0,0 +1,84 @@
+# backend/config/pagination.py
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+# Колонка сортировки и направление (True - по убыванию)
+SortKey = Tuple[ColumnElement, bool]
+
+
+def _encode_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(values: Sequence[Any], signature: str) -> str:
+    """
+    Непрозрачный курсор: значения ключей сортировки последней записи страницы
+    и подпись сортировки, чтобы курсор нельзя было применить к другому порядку.
+    """
+    payload = {"s": signature, "v": [_encode_value(v) for v in values]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, signature: str, size: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = [_decode_value(v) for v in payload["v"]]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+    if payload.get("s") != signature or len(values) != size:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Pagination cursor does not match sort order")
+    return values
+
+
+def sort_signature(name: str, sort_keys: Sequence[SortKey]) -> str:
+    return name + ":" + ",".join(f"{'d' if is_desc else 'a'}" for _, is_desc in sort_keys)
+
+
+def order_by_clauses(sort_keys: Sequence[SortKey]) -> list:
+    return [column.desc() if is_desc else column.asc() for column, is_desc in sort_keys]
+
+
+def keyset_condition(sort_keys: Sequence[SortKey], values: Sequence[Any]) -> ColumnElement:
+    """
+    Условие "строго после курсора" для составного ключа с произвольными направлениями:
+    (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ... (для DESC сравнение меняется на "<").
+    Ключи сортировки не должны содержать NULL (nullable-колонки оборачиваются в coalesce).
+    """
+    branches = []
+    for i, (column, is_desc) in enumerate(sort_keys):
+        equals = [sort_keys[j][0] == values[j] for j in range(i)]
+        after = column < values[i] if is_desc else column > values[i]
+        branches.append(and_(*equals, after))
+    return or_(*branches)
+
+
+def apply_keyset(query, name: str, sort_keys: Sequence[SortKey], cursor: Optional[str]):
+    """Добавляет к запросу сортировку и (если передан курсор) условие продолжения."""
+    signature = sort_signature(name, sort_keys)
+    if cursor:
+        values = decode_cursor(cursor, signature, len(sort_keys))
+        query = query.where(keyset_condition(sort_keys, values))
+    return query.order_by(*order_by_clauses(sort_keys))
+
+
+def next_cursor(name: str, sort_keys: Sequence[SortKey], last_values: Optional[Sequence[Any]]) -> Optional[str]:
+    if last_values is None:
+        return None
+    return encode_cursor(last_values, sort_signature(name, sort_keys))
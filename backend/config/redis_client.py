@@ -0,0 +1,30 @@
+# backend/config/redis_client.py
+import os
+from backend.config.logging_config import logger
+
+# Получаем хост и порт Redis из переменных окружения (те же, что и у rate limiter)
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = os.getenv("REDIS_PORT", 6379)
+REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
+
+_redis = None
+
+
+def get_redis():
+    """
+    Возвращает общий асинхронный клиент Redis (создается лениво).
+    Импорт redis делается здесь, чтобы in-memory бэкенды работали без него.
+    """
+    global _redis
+    if _redis is None:
+        import redis.asyncio as aioredis
+        _redis = aioredis.from_url(REDIS_URL, decode_responses=False)
+        logger.info(f"Redis client created for {REDIS_HOST}:{REDIS_PORT}")
+    return _redis
+
+
+async def close_redis() -> None:
+    global _redis
+    if _redis is not None:
+        await _redis.aclose()
+        _redis = None
@@ -0,0 +1,209 @@
+# backend/config/response_cache.py
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Set, Tuple, Union
+
+from backend.config.logging_config import logger
+from backend.config.redis_client import get_redis
+
+# --- Загрузка конфигурации из .env ---
+# "memory" - кэш внутри процесса (один сервер), "redis" - общий кэш для user и admin серверов
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+RESPONSE_CACHE_TTL_STR = os.getenv("RESPONSE_CACHE_TTL", "60")
+try:
+    RESPONSE_CACHE_TTL = int(RESPONSE_CACHE_TTL_STR)
+except ValueError:
+    logger.error(f"Неверное значение для RESPONSE_CACHE_TTL: {RESPONSE_CACHE_TTL_STR}. Используется значение по умолчанию 60.")
+    RESPONSE_CACHE_TTL = 60
+# --- Конец загрузки конфигурации ---
+
+# Теги инвалидации
+EVENTS_LIST_TAG = "events:list"
+
+def event_tag(event_id: int) -> str:
+    return f"event:{event_id}"
+
+CacheEntry = Dict[str, bytes]
+# Версия набора данных: (случайный токен, время изменения); токен меняется при каждой инвалидации
+Version = Tuple[str, datetime]
+
+
+def encode_entry(entry: Dict[str, Union[bytes, str]]) -> CacheEntry:
+    """Запись в том виде, в каком ее возвращает кэш: строковые поля - в bytes."""
+    return {k: v.encode() if isinstance(v, str) else v for k, v in entry.items()}
+
+
+def _new_version() -> Version:
+    return uuid.uuid4().hex, datetime.utcnow()
+
+
+class InMemoryCacheBackend:
+    """
+    LRU-кэш ответов внутри процесса с TTL и тегами. Инвалидация и версии видны только
+    своему процессу: изменения через другой сервер (админку) проявятся не позже чем через TTL.
+    """
+
+    # Версии общие для всех серверов (см. data_version)
+    shared = False
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._versions: Dict[str, Version] = {}
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: Dict[str, Union[bytes, str]], ttl: int, tags: Iterable[str] = ()) -> None:
+        self._entries[key] = (time.monotonic() + ttl, encode_entry(entry))
+        self._entries.move_to_end(key)
+        for tag in tags:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        removed = 0
+        for tag in tags:
+            for key in self._tags.pop(tag, set()):
+                if self._entries.pop(key, None) is not None:
+                    removed += 1
+        return removed
+
+    async def get_version(self, name: str) -> Version:
+        return self._versions.setdefault(name, _new_version())
+
+    async def bump_version(self, name: str) -> None:
+        self._versions[name] = _new_version()
+
+
+class RedisCacheBackend:
+    """
+    Кэш ответов в Redis: запись хранится в hash (тело + метаданные),
+    для каждого тега ведется set ключей, которые нужно удалить при инвалидации.
+    """
+
+    prefix = "rc:"
+    shared = True
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = await get_redis().hgetall(self.prefix + key)
+        if not entry:
+            return None
+        return {k.decode(): v for k, v in entry.items()}
+
+    async def set(self, key: str, entry: Dict[str, Union[bytes, str]], ttl: int, tags: Iterable[str] = ()) -> None:
+        redis_key = self.prefix + key
+        async with get_redis().pipeline(transaction=True) as pipe:
+            pipe.delete(redis_key)
+            pipe.hset(redis_key, mapping=entry)
+            pipe.expire(redis_key, ttl)
+            for tag in tags:
+                tag_key = f"{self.prefix}tag:{tag}"
+                pipe.sadd(tag_key, redis_key)
+                pipe.expire(tag_key, ttl * 2)
+            await pipe.execute()
+
+    async def invalidate_tags(self, tags: Iterable[str]) -> int:
+        redis = get_redis()
+        removed = 0
+        for tag in tags:
+            tag_key = f"{self.prefix}tag:{tag}"
+            keys = await redis.smembers(tag_key)
+            if keys:
+                removed += await redis.delete(*keys)
+            await redis.delete(tag_key)
+        return removed
+
+    async def get_version(self, name: str) -> Version:
+        version_key = f"{self.prefix}version:{name}"
+        redis = get_redis()
+        entry = await redis.hgetall(version_key)
+        if not entry:
+            # Новый случайный токен после потери ключа: старые ETag не совпадут случайно
+            token, changed_at = _new_version()
+            if await redis.hsetnx(version_key, "token", token):
+                await redis.hset(version_key, "at", changed_at.isoformat())
+            entry = await redis.hgetall(version_key)
+        if b"at" not in entry:
+            return entry[b"token"].decode(), datetime.utcnow()
+        return entry[b"token"].decode(), datetime.fromisoformat(entry[b"at"].decode())
+
+    async def bump_version(self, name: str) -> None:
+        token, changed_at = _new_version()
+        await get_redis().hset(f"{self.prefix}version:{name}", mapping={"token": token, "at": changed_at.isoformat()})
+
+
+_cache = None
+
+
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        _cache = RedisCacheBackend() if RESPONSE_CACHE_BACKEND == "redis" else InMemoryCacheBackend()
+        logger.info(f"Response cache backend: {type(_cache).__name__}")
+    return _cache
+
+
+async def cache_get(key: str) -> Optional[CacheEntry]:
+    """Чтение из кэша; недоступность кэша не должна ломать запрос."""
+    try:
+        return await get_response_cache().get(key)
+    except Exception as e:
+        logger.warning(f"Response cache read failed for {key}: {str(e)}")
+        return None
+
+
+async def cache_set(key: str, entry: Dict[str, Union[bytes, str]], tags: Iterable[str], ttl: int = RESPONSE_CACHE_TTL) -> None:
+    try:
+        await get_response_cache().set(key, entry, ttl, tags)
+    except Exception as e:
+        logger.warning(f"Response cache write failed for {key}: {str(e)}")
+
+
+async def data_version(name: str) -> Optional[Version]:
+    """
+    Версия набора данных для дешевых валидаторов (ETag/Last-Modified); None - кэш недоступен.
+
+    Версия кэша в памяти своя у каждого процесса и не меняется от правок через другой сервер,
+    поэтому к ней добавляется номер интервала RESPONSE_CACHE_TTL: устаревший ответ 304
+    возможен не дольше TTL - столько же живут и записи этого кэша.
+    """
+    cache = get_response_cache()
+    try:
+        token, changed_at = await cache.get_version(name)
+    except Exception as e:
+        logger.warning(f"Response cache version read failed for {name}: {str(e)}")
+        return None
+    if cache.shared:
+        return token, changed_at
+    interval = max(RESPONSE_CACHE_TTL, 1)
+    bucket = int(time.time() // interval)
+    bucket_start = datetime.utcfromtimestamp(bucket * interval)
+    return f"{token}.{bucket}", max(changed_at, bucket_start)
+
+
+async def invalidate_event_caches(event_id: Optional[int] = None) -> None:
+    """Сбрасывает кэш списка мероприятий и (если указан) кэш конкретного мероприятия."""
+    tags = [EVENTS_LIST_TAG]
+    if event_id is not None:
+        tags.append(event_tag(event_id))
+    try:
+        # Версия каталога меняется при любом изменении мероприятий и остатков билетов
+        await get_response_cache().bump_version(EVENTS_LIST_TAG)
+        removed = await get_response_cache().invalidate_tags(tags)
+        logger.info(f"Invalidated {removed} cached responses for tags {tags}")
+    except Exception as e:
+        logger.error(f"Response cache invalidation failed for tags {tags}: {str(e)}")
@@ -0,0 +1,52 @@
+# backend/config/serialization.py
+"""
+Сериализация JSON-ответов.
+
+ORJSONResponse - класс ответа по умолчанию обоих серверов: тело кодирует orjson вместо json
+из stdlib. Ответ по response_model по-прежнему проверяется и приводится FastAPI.
+
+TrustedJSONResponse - доверенный путь для обработчиков, которые сами строят модели ответа
+из строк ORM: модели уже проверены при создании, поэтому тело сериализуется за один проход
+кэшированным TypeAdapter (pydantic-core), а повторная проверка через response_model
+пропускается - готовый Response FastAPI отдает как есть. response_model в декораторе
+маршрута остается для схемы OpenAPI и должен описывать ту же структуру.
+"""
+from functools import lru_cache
+from typing import Any, Mapping, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+@lru_cache(maxsize=None)
+def adapter_for(annotation: Any) -> TypeAdapter:
+    """TypeAdapter для типа; строится один раз - построение схемы дороже самой сериализации."""
+    return TypeAdapter(annotation)
+
+
+def dump_json(content: Any, annotation: Any = Any) -> bytes:
+    """
+    Сериализует content без проверки. С annotation=Any тип определяется по значению:
+    модели pydantic сериализуются по своим схемам, datetime и Enum - как в response_model.
+    """
+    return adapter_for(annotation).dump_json(content)
+
+
+class TrustedJSONResponse(Response):
+    """JSON-ответ из уже проверенных моделей (без повторной проверки через response_model)."""
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: Any,
+        annotation: Any = Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        # render вызывается из Response.__init__, поэтому тип задается до него
+        self.annotation = annotation
+        super().__init__(content, status_code=status_code, headers=headers)
+
+    def render(self, content: Any) -> bytes:
+        return dump_json(content, self.annotation)
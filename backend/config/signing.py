@@ -0,0 +1,61 @@
+# backend/config/signing.py
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Optional
+
+# --- Загрузка конфигурации из .env ---
+# Отдельный секрет для подписанных токенов; по умолчанию используется SECRET_KEY (JWT)
+SIGNING_SECRET = os.getenv("SIGNING_SECRET") or os.getenv("SECRET_KEY")
+
+# Проверка критических переменных: с пустым ключом любой токен можно подделать
+if not SIGNING_SECRET:
+    raise ValueError("Переменная окружения SIGNING_SECRET (или SECRET_KEY) не установлена!")
+# --- Конец загрузки конфигурации ---
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _signature(purpose: str, body: str) -> str:
+    digest = hmac.new(SIGNING_SECRET.encode(), f"{purpose}.{body}".encode(), hashlib.sha256).digest()
+    return _b64encode(digest)
+
+
+def sign_payload(payload: dict, purpose: str, ttl: Optional[int] = None) -> str:
+    """
+    Подписывает payload HMAC-SHA256. purpose разделяет токены разного назначения,
+    чтобы токен одного типа нельзя было предъявить вместо другого.
+    """
+    data = dict(payload)
+    data["iat"] = int(time.time())
+    if ttl is not None:
+        data["exp"] = data["iat"] + ttl
+    body = _b64encode(json.dumps(data, separators=(",", ":")).encode())
+    return f"{body}.{_signature(purpose, body)}"
+
+
+def verify_payload(token: str, purpose: str) -> Optional[dict]:
+    """Возвращает payload, если подпись верна и срок действия не истек, иначе None."""
+    if not token or "." not in token:
+        return None
+    body, signature = token.rsplit(".", 1)
+    if not hmac.compare_digest(signature, _signature(purpose, body)):
+        return None
+    try:
+        payload = json.loads(_b64decode(body))
+    except ValueError:
+        return None
+    if not isinstance(payload, dict):
+        return None
+    if "exp" in payload and payload["exp"] < time.time():
+        return None
+    return payload
@@ -0,0 +1,513 @@
+# backend/config/storage.py
+"""
+Хранилище медиафайлов за единым асинхронным интерфейсом.
+
+Ключ объекта - путь относительно корня хранилища ("ab/cd/{hash}_original.jpg",
+"users_avatars/{uuid}.jpg"). Бэкенд выбирается MEDIA_STORAGE_BACKEND:
+
+- "local" - каталог на диске; блокирующие операции выполняются в потоках;
+- "s3" - S3-совместимое хранилище (AWS S3, MinIO) через aioboto3. Серверы не делят
+  общий том и масштабируются горизонтально.
+
+Оба бэкенда принимают запись частями (open_writer): локальный пишет во временный файл и
+атомарно переименовывает его, S3 отправляет multipart upload частями по S3_PART_SIZE_MB.
+Обработка изображений в Pillow требует локальных файлов: fetch дает локальный путь к объекту
+(для S3 - скачанную копию), а результаты собираются в staging и переносятся через put_file.
+
+presign_upload выдает подписанный URL, по которому клиент загружает объект в S3 напрямую,
+минуя серверы приложения; локальный бэкенд такой возможности не имеет и возвращает None.
+"""
+import asyncio
+import base64
+import contextlib
+import mimetypes
+import os
+import shutil
+import tempfile
+import uuid
+from typing import AsyncIterator, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from fastapi.responses import FileResponse, StreamingResponse
+from starlette.responses import Response
+
+from backend.config.logging_config import logger
+
+# --- Загрузка конфигурации из .env ---
+# "local" - каталог на диске, "s3" - S3-совместимое хранилище
+MEDIA_STORAGE_BACKEND = os.getenv("MEDIA_STORAGE_BACKEND", "local").lower()
+# Каталог локального хранилища; для S3 - префикс ключей в бакете
+MEDIA_DIR = os.getenv("MEDIA_DIR", "private_media")
+S3_BUCKET = os.getenv("S3_BUCKET", "media")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None  # для MinIO: http://minio:9000
+# Адрес S3, доступный клиентам, для подписанных URL загрузки (по умолчанию S3_ENDPOINT_URL)
+S3_PUBLIC_ENDPOINT_URL = os.getenv("S3_PUBLIC_ENDPOINT_URL") or S3_ENDPOINT_URL
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY_ID = os.getenv("S3_ACCESS_KEY_ID") or None
+S3_SECRET_ACCESS_KEY = os.getenv("S3_SECRET_ACCESS_KEY") or None
+# Размер части multipart upload (минимум S3 - 5 МБ для всех частей, кроме последней)
+S3_PART_SIZE = max(int(os.getenv("S3_PART_SIZE_MB", "8")), 5) * 1024 * 1024
+# --- Конец загрузки конфигурации ---
+
+# Размер блока при чтении объекта для ответа
+STREAM_CHUNK_SIZE = 256 * 1024
+# Каталог временных файлов обработки внутри локального хранилища (та же файловая система - атомарный перенос)
+STAGING_DIR = ".staging"
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    mtime: float  # время изменения, unix time
+
+
+def content_type_for(key: str) -> str:
+    return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class LocalWriter:
+    """Запись объекта частями во временный файл; под ключом файл появляется только целиком."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+        self._file = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        return open(self._tmp_path, "wb")
+
+    async def write(self, chunk: bytes) -> None:
+        if self._file is None:
+            self._file = await asyncio.to_thread(self._open)
+        await asyncio.to_thread(self._file.write, chunk)
+
+    async def commit(self) -> None:
+        if self._file is None:
+            self._file = await asyncio.to_thread(self._open)
+        await asyncio.to_thread(self._file.close)
+        await asyncio.to_thread(os.replace, self._tmp_path, self.path)
+
+    async def abort(self) -> None:
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+        await asyncio.to_thread(_remove_quietly, self._tmp_path)
+
+
+class LocalStorage:
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def open_writer(self, key: str) -> LocalWriter:
+        return LocalWriter(self.path(key))
+
+    def _put_file(self, key: str, source_path: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.replace(source_path, path)
+        except OSError:
+            # Источник на другой файловой системе: копия и атомарная замена
+            tmp_path = f"{path}.{uuid.uuid4().hex}.part"
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, path)
+
+    async def put_file(self, key: str, source_path: str) -> None:
+        """Помещает локальный файл под ключ (файл-источник может быть перенесен)."""
+        await asyncio.to_thread(self._put_file, key, source_path)
+
+    async def exists(self, key: str) -> bool:
+        return await asyncio.to_thread(os.path.isfile, self.path(key))
+
+    def _stat(self, key: str) -> Optional[StoredObject]:
+        try:
+            stat = os.stat(self.path(key))
+        except FileNotFoundError:
+            return None
+        return StoredObject(key, stat.st_size, stat.st_mtime)
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        return await asyncio.to_thread(self._stat, key)
+
+    def _read_head(self, key: str, length: int) -> bytes:
+        with open(self.path(key), "rb") as f:
+            return f.read(length)
+
+    async def read_head(self, key: str, length: int) -> bytes:
+        """Первые length байт объекта (для определения типа по сигнатуре)."""
+        return await asyncio.to_thread(self._read_head, key, length)
+
+    async def presign_upload(self, key: str, content_type: str, size: int, sha256: str, expires_in: int) -> None:
+        # Прямой загрузки в каталог сервера нет - загрузку принимает эндпоинт приложения
+        return None
+
+    def _delete(self, keys: List[str]) -> int:
+        removed = 0
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Failed to delete media file {key}: {e}")
+        return removed
+
+    async def delete(self, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        return await asyncio.to_thread(self._delete, keys) if keys else 0
+
+    def _move(self, key: str, target: "LocalStorage", target_key: str) -> None:
+        target_path = target.path(target_key)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(self.path(key), target_path)
+
+    async def move(self, key: str, target_key: str, target: Optional["LocalStorage"] = None) -> None:
+        """Переносит объект под другой ключ (в этом или другом локальном хранилище)."""
+        await asyncio.to_thread(self._move, key, target or self, target_key)
+
+    def _scan(self, directory: str) -> Tuple[List[str], List[StoredObject]]:
+        subdirs, objects = [], []
+        try:
+            entries = list(os.scandir(self.path(directory) if directory else self.root))
+        except FileNotFoundError:
+            return subdirs, objects
+        for entry in entries:
+            key = f"{directory}/{entry.name}" if directory else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(key)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat()
+                objects.append(StoredObject(key, stat.st_size, stat.st_mtime))
+        return subdirs, objects
+
+    async def iter_objects(self, prefix: str = "") -> AsyncIterator[StoredObject]:
+        """Объекты с ключом, начинающимся с prefix; каталоги читаются по одному в потоке."""
+        stack = [prefix.rsplit("/", 1)[0] if "/" in prefix else ""]
+        while stack:
+            subdirs, objects = await asyncio.to_thread(self._scan, stack.pop())
+            stack.extend(subdir for subdir in subdirs if subdir.startswith(prefix) or prefix.startswith(f"{subdir}/"))
+            for stored in objects:
+                if stored.key.startswith(prefix):
+                    yield stored
+
+    @contextlib.asynccontextmanager
+    async def fetch(self, key: str) -> AsyncIterator[str]:
+        """Локальный путь к объекту; FileNotFoundError, если объекта нет."""
+        path = self.path(key)
+        if not await asyncio.to_thread(os.path.isfile, path):
+            raise FileNotFoundError(key)
+        yield path
+
+    @contextlib.asynccontextmanager
+    async def staging(self) -> AsyncIterator[str]:
+        """Временный каталог для результатов обработки; удаляется при выходе."""
+        work_dir = os.path.join(self.root, STAGING_DIR, uuid.uuid4().hex)
+        await asyncio.to_thread(os.makedirs, work_dir, exist_ok=True)
+        try:
+            yield work_dir
+        finally:
+            await asyncio.to_thread(shutil.rmtree, work_dir, True)
+
+    async def response(self, key: str, headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+        path = self.path(key)
+        if not await asyncio.to_thread(os.path.isfile, path):
+            return None
+        return FileResponse(path, media_type=content_type_for(key), headers=headers)
+
+    async def close(self) -> None:
+        pass
+
+
+class S3Writer:
+    """Multipart upload: части отправляются по мере накопления S3_PART_SIZE, малые объекты - одним PUT."""
+
+    def __init__(self, storage: "S3Storage", key: str):
+        self.storage = storage
+        self.key = key
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts: List[Dict] = []
+
+    async def _upload_part(self) -> None:
+        client = await self.storage.client()
+        object_key = self.storage.object_key(self.key)
+        if self._upload_id is None:
+            created = await client.create_multipart_upload(
+                Bucket=self.storage.bucket, Key=object_key, ContentType=content_type_for(self.key)
+            )
+            self._upload_id = created["UploadId"]
+        part_number = len(self._parts) + 1
+        uploaded = await client.upload_part(
+            Bucket=self.storage.bucket, Key=object_key, UploadId=self._upload_id,
+            PartNumber=part_number, Body=bytes(self._buffer),
+        )
+        self._parts.append({"ETag": uploaded["ETag"], "PartNumber": part_number})
+        self._buffer = bytearray()
+
+    async def write(self, chunk: bytes) -> None:
+        self._buffer += chunk
+        if len(self._buffer) >= self.storage.part_size:
+            await self._upload_part()
+
+    async def commit(self) -> None:
+        client = await self.storage.client()
+        object_key = self.storage.object_key(self.key)
+        if self._upload_id is None:
+            await client.put_object(
+                Bucket=self.storage.bucket, Key=object_key, Body=bytes(self._buffer),
+                ContentType=content_type_for(self.key),
+            )
+            return
+        if self._buffer:
+            await self._upload_part()
+        await client.complete_multipart_upload(
+            Bucket=self.storage.bucket, Key=object_key, UploadId=self._upload_id,
+            MultipartUpload={"Parts": self._parts},
+        )
+
+    async def abort(self) -> None:
+        self._buffer = bytearray()
+        if self._upload_id is None:
+            return
+        try:
+            client = await self.storage.client()
+            await client.abort_multipart_upload(
+                Bucket=self.storage.bucket, Key=self.storage.object_key(self.key), UploadId=self._upload_id
+            )
+        except Exception as e:
+            # Незавершенные загрузки удаляет правило жизненного цикла бакета
+            logger.warning(f"Failed to abort multipart upload of {self.key}: {e!r}")
+
+
+class S3Storage:
+    def __init__(
+        self, bucket: str, prefix: str, *, endpoint_url: Optional[str], public_endpoint_url: Optional[str],
+        region: str, access_key_id: Optional[str], secret_access_key: Optional[str], part_size: int,
+    ):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.endpoint_url = endpoint_url
+        self.public_endpoint_url = public_endpoint_url
+        self.region = region
+        self.access_key_id = access_key_id
+        self.secret_access_key = secret_access_key
+        self.part_size = part_size
+        self._client = None
+        self._presigner = None
+        self._exit_stack: Optional[contextlib.AsyncExitStack] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}{key}"
+
+    async def client(self):
+        """Клиент S3, общий для всех запросов процесса (пул соединений aiohttp)."""
+        if self._client is not None:
+            return self._client
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._client is None:
+                # Зависимость нужна только для MEDIA_STORAGE_BACKEND=s3
+                import aioboto3
+
+                exit_stack = contextlib.AsyncExitStack()
+                self._client = await exit_stack.enter_async_context(aioboto3.Session().client(
+                    "s3",
+                    endpoint_url=self.endpoint_url,
+                    region_name=self.region,
+                    aws_access_key_id=self.access_key_id,
+                    aws_secret_access_key=self.secret_access_key,
+                ))
+                self._exit_stack = exit_stack
+                logger.info(f"S3 storage client created (bucket={self.bucket}, endpoint={self.endpoint_url or 'aws'})")
+        return self._client
+
+    def open_writer(self, key: str) -> S3Writer:
+        return S3Writer(self, key)
+
+    async def put_file(self, key: str, source_path: str) -> None:
+        client = await self.client()
+        # upload_file сам делит большие файлы на части
+        await client.upload_file(
+            source_path, self.bucket, self.object_key(key), ExtraArgs={"ContentType": content_type_for(key)}
+        )
+
+    @staticmethod
+    def _is_not_found(error: Exception) -> bool:
+        code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    async def stat(self, key: str) -> Optional[StoredObject]:
+        client = await self.client()
+        try:
+            head = await client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        return StoredObject(key, head["ContentLength"], head["LastModified"].timestamp())
+
+    async def exists(self, key: str) -> bool:
+        return await self.stat(key) is not None
+
+    async def read_head(self, key: str, length: int) -> bytes:
+        client = await self.client()
+        result = await client.get_object(Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes=0-{length - 1}")
+        async with result["Body"] as body:
+            return await body.read()
+
+    def _presign_client(self):
+        if self._presigner is None:
+            # Подпись URL не обращается к сети - достаточно синхронного клиента boto3 (зависимость aioboto3)
+            import boto3
+            from botocore.config import Config
+
+            self._presigner = boto3.client(
+                "s3",
+                endpoint_url=self.public_endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key_id,
+                aws_secret_access_key=self.secret_access_key,
+                # Без явной s3v4 boto3 подписывает URL по SigV2: контрольная сумма уходит
+                # в query-параметр и не проверяется; в SigV4 она и Content-Length - подписанные заголовки
+                config=Config(signature_version="s3v4"),
+            )
+        return self._presigner
+
+    async def presign_upload(
+        self, key: str, content_type: str, size: int, sha256: str, expires_in: int
+    ) -> Tuple[str, Dict[str, str]]:
+        """
+        Подписанный URL для PUT объекта клиентом. Размер, тип и sha256 входят в подпись:
+        S3 отклонит загрузку другого размера или содержимого. Возвращает (URL, обязательные заголовки).
+        """
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        url = self._presign_client().generate_presigned_url(
+            "put_object",
+            Params={
+                "Bucket": self.bucket, "Key": self.object_key(key), "ContentType": content_type,
+                "ContentLength": size, "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=expires_in,
+        )
+        return url, {"Content-Type": content_type, "x-amz-checksum-sha256": checksum}
+
+    async def delete(self, keys: Iterable[str]) -> int:
+        keys = list(keys)
+        client = await self.client()
+        removed = 0
+        # DeleteObjects принимает до 1000 ключей
+        for start in range(0, len(keys), 1000):
+            batch = keys[start:start + 1000]
+            result = await client.delete_objects(
+                Bucket=self.bucket,
+                Delete={"Objects": [{"Key": self.object_key(key)} for key in batch], "Quiet": True},
+            )
+            for error in result.get("Errors", []):
+                logger.warning(f"Failed to delete media object {error.get('Key')}: {error.get('Message')}")
+            removed += len(batch) - len(result.get("Errors", []))
+        return removed
+
+    async def move(self, key: str, target_key: str, target: Optional["S3Storage"] = None) -> None:
+        """Копирование на стороне S3 и удаление источника."""
+        target = target or self
+        client = await self.client()
+        await client.copy_object(
+            Bucket=target.bucket, Key=target.object_key(target_key),
+            CopySource={"Bucket": self.bucket, "Key": self.object_key(key)},
+        )
+        await client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+
+    async def iter_objects(self, prefix: str = "") -> AsyncIterator[StoredObject]:
+        client = await self.client()
+        paginator = client.get_paginator("list_objects_v2")
+        async for page in paginator.paginate(Bucket=self.bucket, Prefix=self.object_key(prefix)):
+            for item in page.get("Contents", []):
+                yield StoredObject(item["Key"][len(self.prefix):], item["Size"], item["LastModified"].timestamp())
+
+    @contextlib.asynccontextmanager
+    async def fetch(self, key: str) -> AsyncIterator[str]:
+        """Скачивает объект во временный файл; FileNotFoundError, если объекта нет."""
+        client = await self.client()
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            try:
+                await client.download_file(self.bucket, self.object_key(key), path)
+            except Exception as e:
+                if self._is_not_found(e):
+                    raise FileNotFoundError(key) from e
+                raise
+            yield path
+        finally:
+            await asyncio.to_thread(_remove_quietly, path)
+
+    @contextlib.asynccontextmanager
+    async def staging(self) -> AsyncIterator[str]:
+        work_dir = await asyncio.to_thread(tempfile.mkdtemp, prefix="media-")
+        try:
+            yield work_dir
+        finally:
+            await asyncio.to_thread(shutil.rmtree, work_dir, True)
+
+    async def response(self, key: str, headers: Optional[Dict[str, str]] = None) -> Optional[Response]:
+        """Потоковая отдача объекта без буферизации в памяти."""
+        client = await self.client()
+        try:
+            result = await client.get_object(Bucket=self.bucket, Key=self.object_key(key))
+        except Exception as e:
+            if self._is_not_found(e):
+                return None
+            raise
+        body = result["Body"]
+
+        async def stream():
+            try:
+                async for chunk in body.iter_chunks(STREAM_CHUNK_SIZE):
+                    yield chunk
+            finally:
+                body.close()
+
+        response_headers = {"Content-Length": str(result["ContentLength"]), "ETag": result["ETag"], **(headers or {})}
+        return StreamingResponse(
+            stream(), media_type=result.get("ContentType") or content_type_for(key), headers=response_headers
+        )
+
+    async def close(self) -> None:
+        if self._exit_stack is not None:
+            await self._exit_stack.aclose()
+            self._exit_stack = None
+            self._client = None
+
+
+def create_storage(location: str):
+    """Хранилище для location: каталог для local, префикс ключей в бакете для s3."""
+    if MEDIA_STORAGE_BACKEND == "s3":
+        return S3Storage(
+            S3_BUCKET, f"{location.strip('/')}/",
+            endpoint_url=S3_ENDPOINT_URL,
+            public_endpoint_url=S3_PUBLIC_ENDPOINT_URL,
+            region=S3_REGION,
+            access_key_id=S3_ACCESS_KEY_ID,
+            secret_access_key=S3_SECRET_ACCESS_KEY,
+            part_size=S3_PART_SIZE,
+        )
+    return LocalStorage(location)
+
+
+storage = create_storage(MEDIA_DIR)
+logger.info(f"Media storage backend: {type(storage).__name__} ({MEDIA_DIR})")
@@ -0,0 +1,48 @@
+# backend/config/telegram_link.py
+"""
+Привязка чата Telegram к пользователю.
+
+Bot API не может начать личный чат по @username (он работает только для публичных
+каналов и групп), поэтому рассылка в Telegram отправляется только на числовой chat_id.
+chat_id узнается, когда пользователь сам пишет боту: профиль выдает ссылку
+https://t.me/<бот>?start=<токен>, Telegram передает "/start <токен>" в webhook,
+и chat_id из этого сообщения сохраняется в users.telegram_chat_id.
+
+Токен одноразовый и хранится в Redis с TTL. Webhook регистрируется один раз:
+setWebhook(url=<сервер>/telegram/webhook, secret_token=TELEGRAM_WEBHOOK_SECRET).
+"""
+import os
+import secrets
+from typing import Optional
+
+from backend.config.redis_client import get_redis
+
+# --- Загрузка конфигурации из .env ---
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "").lstrip("@")
+# Telegram передает его в заголовке X-Telegram-Bot-Api-Secret-Token каждого запроса webhook
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET") or None
+TELEGRAM_LINK_TTL = int(os.getenv("TELEGRAM_LINK_TTL", "900"))
+# --- Конец загрузки конфигурации ---
+
+_LINK_PREFIX = "tg:link:"
+
+
+async def create_link(user_id: int) -> Optional[str]:
+    """Ссылка на бота с одноразовым токеном; None, если имя бота не настроено."""
+    if not TELEGRAM_BOT_USERNAME:
+        return None
+    # Параметр start - до 64 символов [A-Za-z0-9_-]; token_urlsafe(24) дает 32
+    token = secrets.token_urlsafe(24)
+    await get_redis().set(f"{_LINK_PREFIX}{token}", user_id, ex=TELEGRAM_LINK_TTL)
+    return f"https://t.me/{TELEGRAM_BOT_USERNAME}?start={token}"
+
+
+async def consume_link(token: str) -> Optional[int]:
+    """id пользователя по токену из /start; токен удаляется при первом использовании."""
+    value = await get_redis().getdel(f"{_LINK_PREFIX}{token}")
+    return int(value) if value is not None else None
+
+
+def is_chat_id(recipient: str) -> bool:
+    """Числовой chat_id (у групп и каналов - отрицательный)."""
+    return recipient.lstrip("-").isdigit()
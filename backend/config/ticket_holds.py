@@ -0,0 +1,189 @@
+# backend/config/ticket_holds.py
+"""
+Временные брони платных билетов.
+
+Бронь занимает место короткой атомарной командой (reserve_and_register со статусом pending),
+после чего строка билета больше не блокируется на время оплаты. Сроки броней хранятся
+в быстром хранилище (ZSET по времени истечения); фоновый процесс снимает истекшие брони
+и возвращает места в TicketType.sold_quantity. Колонка Registration.hold_expires_at -
+источник истины: периодическая сверка с БД подбирает брони, потерянные хранилищем.
+
+Сами брони в быстром хранилище не держатся и в sold_quantity позже не сворачиваются:
+место списывается сразу тем же условным UPDATE, что и при обычной регистрации (и при
+шардированном остатке). Иначе остаток пришлось бы считать по двум хранилищам
+(sold_quantity минус брони в Redis) без общей атомарной проверки, и потеря Redis
+означала бы продажу мест сверх емкости. Строка pending-регистрации делает бронь
+долговечной и подпадает под уникальный индекс активных регистраций.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from backend.config.inventory import release_hold, reopen_registration
+from backend.config.logging_config import logger
+from backend.config.redis_client import get_redis
+from backend.config.response_cache import invalidate_event_caches
+from backend.database.user_db import AsyncSessionLocal, Registration
+from backend.schemas_enums.enums import Status
+
+# --- Загрузка конфигурации из .env ---
+TICKET_HOLD_TTL_SECONDS = int(os.getenv("TICKET_HOLD_TTL_SECONDS", "600"))         # окно на оплату
+# "memory" - сроки броней внутри процесса, "redis" - общие для всех экземпляров сервера
+TICKET_HOLD_BACKEND = os.getenv("TICKET_HOLD_BACKEND", "memory").lower()
+TICKET_HOLD_SWEEP_SECONDS = int(os.getenv("TICKET_HOLD_SWEEP_SECONDS", "5"))        # 0 отключает снятие
+TICKET_HOLD_RECONCILE_SECONDS = int(os.getenv("TICKET_HOLD_RECONCILE_SECONDS", "60"))
+TICKET_HOLD_SWEEP_BATCH = int(os.getenv("TICKET_HOLD_SWEEP_BATCH", "200"))
+# --- Конец загрузки конфигурации ---
+
+
+class InMemoryHoldStore:
+    def __init__(self):
+        self._expires: Dict[int, float] = {}
+
+    async def add(self, hold_id: int, expires_at: float) -> None:
+        self._expires[hold_id] = expires_at
+
+    async def remove(self, hold_id: int) -> None:
+        self._expires.pop(hold_id, None)
+
+    async def claim_due(self, now: float, limit: int) -> List[int]:
+        due = sorted((e, h) for h, e in self._expires.items() if e <= now)[:limit]
+        for _, hold_id in due:
+            self._expires.pop(hold_id, None)
+        return [hold_id for _, hold_id in due]
+
+
+class RedisHoldStore:
+    key = "holds:expiry"
+
+    async def add(self, hold_id: int, expires_at: float) -> None:
+        await get_redis().zadd(self.key, {str(hold_id): expires_at})
+
+    async def remove(self, hold_id: int) -> None:
+        await get_redis().zrem(self.key, str(hold_id))
+
+    async def claim_due(self, now: float, limit: int) -> List[int]:
+        redis = get_redis()
+        members = await redis.zrangebyscore(self.key, "-inf", now, start=0, num=limit)
+        claimed = []
+        for member in members:
+            # ZREM успешен только у одного экземпляра - он и снимает бронь
+            if await redis.zrem(self.key, member):
+                claimed.append(int(member))
+        return claimed
+
+
+_store = None
+
+
+def get_hold_store():
+    global _store
+    if _store is None:
+        _store = RedisHoldStore() if TICKET_HOLD_BACKEND == "redis" else InMemoryHoldStore()
+        logger.info(f"Ticket hold store backend: {type(_store).__name__}")
+    return _store
+
+
+async def track_hold(hold_id: int, ttl_seconds: int = TICKET_HOLD_TTL_SECONDS) -> None:
+    """Регистрирует срок брони в хранилище. Ошибка не критична: бронь подберет сверка с БД."""
+    try:
+        await get_hold_store().add(hold_id, time.time() + ttl_seconds)
+    except Exception as e:
+        logger.error(f"Failed to track ticket hold {hold_id}: {str(e)}")
+
+
+async def untrack_hold(hold_id: int) -> None:
+    try:
+        await get_hold_store().remove(hold_id)
+    except Exception as e:
+        logger.error(f"Failed to untrack ticket hold {hold_id}: {str(e)}")
+
+
+async def expire_hold(hold_id: int) -> bool:
+    """Снимает истекшую бронь в отдельной транзакции и возвращает место в остаток."""
+    async with AsyncSessionLocal() as db:
+        released = await release_hold(db, hold_id, expired_only=True)
+        if released is None:
+            await db.rollback()
+            return False
+        if released.available_quantity is not None and released.available_quantity > released.sold_quantity:
+            await reopen_registration(db, released.event_id)
+        await db.commit()
+    await invalidate_event_caches(released.event_id)
+    logger.info(f"Ticket hold {hold_id} expired, seat returned for event {released.event_id}")
+    return True
+
+
+async def expired_hold_ids(limit: int) -> List[int]:
+    """Истекшие брони по данным БД (сверка на случай потери хранилища)."""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Registration.id)
+            .where(
+                Registration.status == Status.pending,
+                Registration.hold_expires_at < datetime.utcnow(),
+            )
+            .order_by(Registration.hold_expires_at)
+            .limit(limit)
+        )
+        return list(result.scalars().all())
+
+
+async def sweep_expired_holds(reconcile: bool = False) -> int:
+    hold_ids = await get_hold_store().claim_due(time.time(), TICKET_HOLD_SWEEP_BATCH)
+    if reconcile:
+        hold_ids = list(dict.fromkeys(hold_ids + await expired_hold_ids(TICKET_HOLD_SWEEP_BATCH)))
+    released = 0
+    for hold_id in hold_ids:
+        try:
+            released += await expire_hold(hold_id)
+        except Exception as e:
+            logger.error(f"Failed to release ticket hold {hold_id}: {str(e)}", exc_info=True)
+    return released
+
+
+class TicketHoldSweeper:
+    """Периодическое снятие истекших броней внутри процесса сервера."""
+
+    def __init__(self, interval_seconds: int, reconcile_seconds: int):
+        self.interval_seconds = interval_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        last_reconcile = 0.0
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            reconcile = time.monotonic() - last_reconcile >= self.reconcile_seconds
+            try:
+                released = await sweep_expired_holds(reconcile=reconcile)
+                if released:
+                    logger.info(f"Released {released} expired ticket holds")
+            except Exception as e:
+                logger.error(f"Error during ticket hold sweep: {str(e)}", exc_info=True)
+            if reconcile:
+                last_reconcile = time.monotonic()
+
+    def start(self) -> None:
+        if self.interval_seconds <= 0:
+            logger.info("Ticket hold sweeper is disabled")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Ticket hold sweeper runs every {self.interval_seconds} seconds")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+ticket_hold_sweeper = TicketHoldSweeper(TICKET_HOLD_SWEEP_SECONDS, TICKET_HOLD_RECONCILE_SECONDS)
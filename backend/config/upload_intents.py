@@ -0,0 +1,136 @@
+# backend/config/upload_intents.py
+"""
+Прямая загрузка медиафайлов в хранилище по подписанным URL.
+
+Клиент заявляет загрузку (назначение, тип, размер и sha256 содержимого) и получает токен
+заявки и URL для PUT. С S3 это подписанный URL бакета: размер и sha256 входят в подпись,
+и байты файла идут мимо серверов приложения. Локальное хранилище такой возможности не имеет,
+и URL указывает на эндпоинт /uploads/{token}, который проверяет размер и хэш сам.
+
+Объект загружается сразу под именем хранилища ({sha256}_original.{ext}), поэтому повторная
+загрузка того же файла не нужна. Ссылка на объект появляется при завершении загрузки;
+до этого объект без ссылок защищен периодом ожидания сборщика (MEDIA_GC_GRACE_HOURS),
+который больше срока жизни заявки.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict
+
+from fastapi import HTTPException
+
+from backend.config.logging_config import logger
+from backend.config.media_store import media_relpath, place_upload
+from backend.config.signing import sign_payload, verify_payload
+from backend.config.storage import storage
+from backend.config.uploads import (
+    MAX_EVENT_IMAGE_UPLOAD_BYTES, MAX_VIDEO_UPLOAD_BYTES, SNIFF_BYTES, sniff_image_type, sniff_video_type
+)
+
+# --- Загрузка конфигурации из .env ---
+UPLOAD_INTENT_TTL_SECONDS = int(os.getenv("UPLOAD_INTENT_TTL_SECONDS", "900"))
+# --- Конец загрузки конфигурации ---
+
+UPLOAD_INTENT_PURPOSE = "upload_intent"
+
+IMAGE_CONTENT_TYPES = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+VIDEO_CONTENT_TYPES = {"video/mp4": "mp4", "video/webm": "webm"}
+
+# Назначение загрузки -> (MIME-тип -> расширение, максимальный размер)
+UPLOAD_TARGETS = {
+    "event_image": (IMAGE_CONTENT_TYPES, MAX_EVENT_IMAGE_UPLOAD_BYTES),  # обложка мероприятия
+    "event_photo": (IMAGE_CONTENT_TYPES, MAX_EVENT_IMAGE_UPLOAD_BYTES),  # фото в галерее (Media)
+    "event_video": (VIDEO_CONTENT_TYPES, MAX_VIDEO_UPLOAD_BYTES),        # видео в галерее (Media)
+}
+
+
+async def create_intent(target: str, event_id: int, content_type: str, size: int, sha256: str, admin_id: int) -> Dict:
+    """Проверяет заявку и выдает токен и URL загрузки. 415 - тип не разрешен, 413 - файл слишком большой."""
+    content_types, max_bytes = UPLOAD_TARGETS[target]
+    extension = content_types.get(content_type)
+    if extension is None:
+        raise HTTPException(status_code=415, detail=f"Неподдерживаемый тип файла. Разрешены: {', '.join(content_types)}")
+    if size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Файл слишком большой (максимум {max_bytes // (1024 * 1024)} МБ)")
+
+    filename = f"{sha256}_original.{extension}"
+    key = media_relpath(filename)
+    token = sign_payload(
+        {
+            "target": target, "event_id": event_id, "admin_id": admin_id, "filename": filename,
+            "content_type": content_type, "size": size, "sha256": sha256,
+        },
+        UPLOAD_INTENT_PURPOSE,
+        ttl=UPLOAD_INTENT_TTL_SECONDS,
+    )
+    intent = {"token": token, "expires_at": datetime.utcnow() + timedelta(seconds=UPLOAD_INTENT_TTL_SECONDS)}
+
+    stored = await storage.stat(key)
+    if stored is not None and stored.size == size:
+        # Файл с тем же содержимым уже в хранилище - загружать не нужно
+        return {**intent, "upload_url": None, "headers": {}}
+    presigned = await storage.presign_upload(key, content_type, size, sha256, UPLOAD_INTENT_TTL_SECONDS)
+    if presigned is None:
+        return {**intent, "upload_url": f"/uploads/{token}", "headers": {"Content-Type": content_type}}
+    upload_url, headers = presigned
+    return {**intent, "upload_url": upload_url, "headers": headers}
+
+
+def read_intent(token: str) -> Dict:
+    intent = verify_payload(token, UPLOAD_INTENT_PURPOSE)
+    if intent is None:
+        raise HTTPException(status_code=403, detail="Заявка на загрузку недействительна или истекла")
+    return intent
+
+
+async def receive_direct_upload(intent: Dict, chunks: AsyncIterator[bytes]) -> None:
+    """
+    Принимает тело PUT для локального хранилища: пишет его частями во временный объект
+    и переносит под имя хранилища, только если размер и sha256 совпали с заявкой.
+    """
+    if await storage.exists(media_relpath(intent["filename"])):
+        # Объект уже загружен (повтор запроса) - тело не нужно
+        async for _ in chunks:
+            pass
+        return
+    tmp_key = f"{uuid.uuid4().hex}.part"
+    writer = storage.open_writer(tmp_key)
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        async for chunk in chunks:
+            written += len(chunk)
+            if written > intent["size"]:
+                raise HTTPException(status_code=413, detail="Размер файла больше заявленного")
+            await asyncio.to_thread(digest.update, chunk)
+            await writer.write(chunk)
+        if written != intent["size"] or digest.hexdigest() != intent["sha256"]:
+            raise HTTPException(status_code=400, detail="Размер или sha256 файла не совпадают с заявкой")
+        await writer.commit()
+    except BaseException:
+        await writer.abort()
+        raise
+    try:
+        await place_upload(tmp_key, intent["filename"])
+    except BaseException:
+        await storage.delete([tmp_key])
+        raise
+    logger.info(f"Received direct upload {intent['filename']} ({written} bytes)")
+
+
+async def verify_uploaded(intent: Dict) -> None:
+    """Проверяет, что объект заявки загружен и его сигнатура соответствует заявленному типу."""
+    key = media_relpath(intent["filename"])
+    stored = await storage.stat(key)
+    if stored is None:
+        raise HTTPException(status_code=409, detail="Файл еще не загружен")
+    if stored.size != intent["size"]:
+        raise HTTPException(status_code=400, detail="Размер загруженного файла не совпадает с заявкой")
+    header = await storage.read_head(key, SNIFF_BYTES)
+    extension = intent["filename"].rsplit(".", 1)[1]
+    sniff = sniff_video_type if intent["target"] == "event_video" else sniff_image_type
+    if sniff(header) != extension:
+        # Объект без ссылок удалит сборщик мусора
+        raise HTTPException(status_code=415, detail="Содержимое файла не соответствует заявленному типу")
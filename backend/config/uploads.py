@@ -0,0 +1,104 @@
+# backend/config/uploads.py
+"""
+Потоковое сохранение загруженных файлов.
+
+Файл читается из UploadFile частями фиксированного размера и пишется во временный объект
+хранилища (backend/config/storage.py) - на диск в потоке или в S3 через multipart upload,
+поэтому память на загрузку ограничена размером части независимо от размера файла.
+Тип определяется по сигнатуре (magic bytes), а не по имени файла и заголовку Content-Type;
+попутно считается sha256 содержимого - имя файла в хранилище (backend/config/media_store.py).
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from typing import Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from backend.config.logging_config import logger
+from backend.config.storage import storage
+
+# --- Загрузка конфигурации из .env ---
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(256 * 1024)))
+MAX_AVATAR_UPLOAD_BYTES = int(os.getenv("MAX_AVATAR_UPLOAD_MB", "5")) * 1024 * 1024
+MAX_EVENT_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_EVENT_IMAGE_UPLOAD_MB", "20")) * 1024 * 1024
+# Видео загружаются только напрямую в хранилище (backend/config/upload_intents.py)
+MAX_VIDEO_UPLOAD_BYTES = int(os.getenv("MAX_VIDEO_UPLOAD_MB", "500")) * 1024 * 1024
+# --- Конец загрузки конфигурации ---
+
+# Сигнатуры поддерживаемых форматов: расширение -> (смещение, байты)
+IMAGE_SIGNATURES = {
+    "jpg": [(0, b"\xff\xd8\xff")],
+    "png": [(0, b"\x89PNG\r\n\x1a\n")],
+    "webp": [(0, b"RIFF"), (8, b"WEBP")],
+    "gif": [(0, b"GIF87a")],
+}
+GIF89A_SIGNATURE = b"GIF89a"
+VIDEO_SIGNATURES = {
+    "mp4": [(4, b"ftyp")],
+    "webm": [(0, b"\x1a\x45\xdf\xa3")],
+}
+# Байт, которых достаточно для определения любого формата из списка
+SNIFF_BYTES = 16
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Расширение изображения по первым байтам файла или None."""
+    if header.startswith(GIF89A_SIGNATURE):
+        return "gif"
+    for extension, parts in IMAGE_SIGNATURES.items():
+        if all(header[offset:offset + len(magic)] == magic for offset, magic in parts):
+            return extension
+    return None
+
+
+def sniff_video_type(header: bytes) -> Optional[str]:
+    for extension, parts in VIDEO_SIGNATURES.items():
+        if all(header[offset:offset + len(magic)] == magic for offset, magic in parts):
+            return extension
+    return None
+
+
+async def receive_upload(
+    upload: UploadFile,
+    *,
+    max_bytes: int,
+    allowed_types: Iterable[str],
+) -> Tuple[str, str, str, int]:
+    """
+    Сохраняет загрузку во временный объект хранилища.
+    Возвращает (ключ временного объекта, sha256, расширение, размер); перенести или удалить
+    временный объект должен вызывающий. 415 - если сигнатура не из allowed_types, 413 - если файл больше max_bytes.
+    """
+    # Starlette знает размер разобранной части - слишком большой файл отклоняем, не читая
+    if upload.size is not None and upload.size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"Файл слишком большой (максимум {max_bytes // (1024 * 1024)} МБ)")
+
+    chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+    extension = sniff_image_type(chunk[:SNIFF_BYTES])
+    allowed = list(allowed_types)
+    if extension not in allowed:
+        raise HTTPException(status_code=415, detail=f"Неподдерживаемый формат файла. Разрешены: {', '.join(allowed)}")
+
+    # Временный ключ не совпадает с именами хранилища: под постоянным именем объект появляется только целиком
+    tmp_key = f"{uuid.uuid4().hex}.part"
+    writer = storage.open_writer(tmp_key)
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        while chunk:
+            written += len(chunk)
+            if written > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Файл слишком большой (максимум {max_bytes // (1024 * 1024)} МБ)")
+            # hashlib отпускает GIL на больших блоках - хэш считается в потоке
+            await asyncio.to_thread(digest.update, chunk)
+            await writer.write(chunk)
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+        await writer.commit()
+    except BaseException:
+        await writer.abort()
+        raise
+
+    logger.info(f"Received upload {upload.filename!r} ({written} bytes)")
+    return tmp_key, digest.hexdigest(), extension, written
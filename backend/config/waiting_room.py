@@ -0,0 +1,177 @@
+# backend/config/waiting_room.py
+"""
+Виртуальная очередь на регистрацию для мероприятий с высоким спросом.
+
+Каждый пользователь получает номер в FIFO-очереди мероприятия и подписанный токен очереди.
+Указатель допуска продвигается лениво (при запросах статуса) со скоростью
+WAITING_ROOM_ADMIT_PER_SECOND, поэтому фоновый процесс не нужен, а БД получает
+равномерный поток регистраций вместо одновременного наплыва.
+"""
+import math
+import os
+import time
+from typing import Dict, Optional
+
+from backend.config.logging_config import logger
+from backend.config.redis_client import get_redis
+from backend.config.signing import sign_payload, verify_payload
+
+# --- Загрузка конфигурации из .env ---
+WAITING_ROOM_ENABLED = os.getenv("WAITING_ROOM_ENABLED", "False").lower() in ("true", "1", "yes")
+# "memory" - очередь внутри процесса (один сервер), "redis" - общая очередь
+WAITING_ROOM_BACKEND = os.getenv("WAITING_ROOM_BACKEND", "memory").lower()
+WAITING_ROOM_ADMIT_PER_SECOND_STR = os.getenv("WAITING_ROOM_ADMIT_PER_SECOND", "20")
+try:
+    WAITING_ROOM_ADMIT_PER_SECOND = max(float(WAITING_ROOM_ADMIT_PER_SECOND_STR), 0.1)
+except ValueError:
+    logger.error(f"Неверное значение для WAITING_ROOM_ADMIT_PER_SECOND: {WAITING_ROOM_ADMIT_PER_SECOND_STR}. Используется значение по умолчанию 20.")
+    WAITING_ROOM_ADMIT_PER_SECOND = 20.0
+# Сколько секунд действует допуск к регистрации
+WAITING_ROOM_ADMISSION_TTL = int(os.getenv("WAITING_ROOM_ADMISSION_TTL", "300"))
+# Время жизни очереди мероприятия в хранилище
+WAITING_ROOM_QUEUE_TTL = int(os.getenv("WAITING_ROOM_QUEUE_TTL", "21600"))
+# --- Конец загрузки конфигурации ---
+
+QUEUE_TOKEN_PURPOSE = "waiting_room_queue"
+ADMISSION_TOKEN_PURPOSE = "waiting_room_admission"
+
+
+class InMemoryWaitingRoom:
+    """Очередь внутри процесса (локальная разработка и один сервер)."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._queues: Dict[int, dict] = {}
+
+    def _queue(self, event_id: int) -> dict:
+        return self._queues.setdefault(
+            event_id, {"tail": 0, "pointer": 0.0, "updated": time.time(), "users": {}}
+        )
+
+    async def join(self, event_id: int, user_id: int) -> int:
+        queue = self._queue(event_id)
+        position = queue["users"].get(user_id)
+        if position is None:
+            queue["tail"] += 1
+            position = queue["users"][user_id] = queue["tail"]
+        return position
+
+    async def admitted_up_to(self, event_id: int) -> float:
+        queue = self._queue(event_id)
+        now = time.time()
+        # Пустая очередь не накапливает "кредит": указатель не обгоняет хвост
+        queue["pointer"] = min(queue["tail"], queue["pointer"] + (now - queue["updated"]) * self.rate)
+        queue["updated"] = now
+        return queue["pointer"]
+
+    async def reset(self, event_id: int) -> None:
+        self._queues.pop(event_id, None)
+
+
+class RedisWaitingRoom:
+    """Очередь в Redis: номер выдается атомарно, указатель продвигается Lua-скриптом."""
+
+    prefix = "wr:"
+
+    JOIN_SCRIPT = """
+    local position = redis.call('HGET', KEYS[1], ARGV[1])
+    if position then
+        return tonumber(position)
+    end
+    position = redis.call('HINCRBY', KEYS[2], 'tail', 1)
+    redis.call('HSET', KEYS[1], ARGV[1], position)
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    redis.call('EXPIRE', KEYS[2], ARGV[2])
+    return position
+    """
+
+    ADVANCE_SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local tail = tonumber(redis.call('HGET', KEYS[1], 'tail') or '0')
+    local pointer = tonumber(redis.call('HGET', KEYS[1], 'pointer') or '0')
+    local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or ARGV[1])
+    pointer = math.min(tail, pointer + math.max(now - updated, 0) * tonumber(ARGV[2]))
+    redis.call('HSET', KEYS[1], 'pointer', tostring(pointer), 'updated', ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return tostring(pointer)
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._join = None
+        self._advance = None
+
+    def _keys(self, event_id: int):
+        return f"{self.prefix}{event_id}:users", f"{self.prefix}{event_id}:state"
+
+    async def join(self, event_id: int, user_id: int) -> int:
+        if self._join is None:
+            self._join = get_redis().register_script(self.JOIN_SCRIPT)
+        users_key, state_key = self._keys(event_id)
+        return int(await self._join(keys=[users_key, state_key], args=[user_id, WAITING_ROOM_QUEUE_TTL]))
+
+    async def admitted_up_to(self, event_id: int) -> float:
+        if self._advance is None:
+            self._advance = get_redis().register_script(self.ADVANCE_SCRIPT)
+        _, state_key = self._keys(event_id)
+        pointer = await self._advance(keys=[state_key], args=[time.time(), self.rate, WAITING_ROOM_QUEUE_TTL])
+        return float(pointer)
+
+    async def reset(self, event_id: int) -> None:
+        await get_redis().delete(*self._keys(event_id))
+
+
+_room = None
+
+
+def get_waiting_room():
+    global _room
+    if _room is None:
+        if WAITING_ROOM_BACKEND == "redis":
+            _room = RedisWaitingRoom(WAITING_ROOM_ADMIT_PER_SECOND)
+        else:
+            _room = InMemoryWaitingRoom(WAITING_ROOM_ADMIT_PER_SECOND)
+        logger.info(f"Waiting room backend: {type(_room).__name__}, rate={WAITING_ROOM_ADMIT_PER_SECOND}/s")
+    return _room
+
+
+async def _queue_status(event_id: int, user_id: int, position: int, queue_token: str) -> dict:
+    pointer = await get_waiting_room().admitted_up_to(event_id)
+    ahead = max(0, math.ceil(position - pointer))
+    status = {
+        "event_id": event_id,
+        "position": position,
+        "ahead": ahead,
+        "admitted": ahead == 0,
+        "queue_token": queue_token,
+        "admission_token": None,
+        # Подсказка клиенту, когда опрашивать статус в следующий раз
+        "retry_after": min(max(math.ceil(ahead / WAITING_ROOM_ADMIT_PER_SECOND), 1), 30),
+    }
+    if status["admitted"]:
+        status["admission_token"] = sign_payload(
+            {"e": event_id, "u": user_id}, ADMISSION_TOKEN_PURPOSE, ttl=WAITING_ROOM_ADMISSION_TTL
+        )
+    return status
+
+
+async def join_queue(event_id: int, user_id: int) -> dict:
+    """Ставит пользователя в очередь (повторный вызов возвращает тот же номер)."""
+    position = await get_waiting_room().join(event_id, user_id)
+    queue_token = sign_payload({"e": event_id, "u": user_id, "p": position}, QUEUE_TOKEN_PURPOSE, ttl=WAITING_ROOM_QUEUE_TTL)
+    logger.info(f"User {user_id} joined waiting room for event {event_id} at position {position}")
+    return await _queue_status(event_id, user_id, position, queue_token)
+
+
+async def queue_status(queue_token: str) -> Optional[dict]:
+    """Статус по токену очереди; None - токен недействителен."""
+    payload = verify_payload(queue_token, QUEUE_TOKEN_PURPOSE)
+    if payload is None:
+        return None
+    return await _queue_status(payload["e"], payload["u"], payload["p"], queue_token)
+
+
+def is_admitted(admission_token: Optional[str], event_id: int, user_id: int) -> bool:
+    """Проверяет допуск к регистрации без обращения к хранилищу очереди."""
+    payload = verify_payload(admission_token or "", ADMISSION_TOKEN_PURPOSE)
+    return payload is not None and payload.get("e") == event_id and payload.get("u") == user_id
@@ -0,0 +1,72 @@
+# backend/database/add_active_registration_index.py
+# Создает частичный уникальный индекс активных регистраций в существующей БД.
+# Если в данных уже есть дубли (несколько активных регистраций пользователя на одно мероприятие),
+# скрипт выводит их и останавливается; с --cancel-duplicates оставляет самую раннюю регистрацию,
+# а остальные отменяет с возвратом мест в остаток.
+# Запуск: python backend/database/add_active_registration_index.py [--cancel-duplicates]
+import argparse
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.config.inventory import release_ticket
+from backend.database.user_db import engine, AsyncSessionLocal
+
+DUPLICATES_SQL = """
+SELECT id, user_id, event_id, ticket_type_id
+FROM (
+    SELECT id, user_id, event_id, ticket_type_id,
+           row_number() OVER (PARTITION BY user_id, event_id ORDER BY submission_time, id) AS rn
+    FROM registrations
+    WHERE status <> 'cancelled'
+) ranked
+WHERE rn > 1
+ORDER BY user_id, event_id, id
+"""
+
+
+async def cancel_duplicates(duplicates) -> None:
+    async with AsyncSessionLocal() as db:
+        for dup in duplicates:
+            await db.execute(text("UPDATE registrations SET status = 'cancelled' WHERE id = :id"), {"id": dup.id})
+            if dup.ticket_type_id is not None:
+                await release_ticket(db, dup.ticket_type_id)
+        await db.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Partial unique index for active registrations")
+    parser.add_argument("--cancel-duplicates", action="store_true", help="отменить лишние активные регистрации")
+    args = parser.parse_args()
+    try:
+        async with engine.connect() as conn:
+            duplicates = (await conn.execute(text(DUPLICATES_SQL))).all()
+        if duplicates:
+            for dup in duplicates:
+                print(f"Дубль: registration_id={dup.id}, user_id={dup.user_id}, event_id={dup.event_id}")
+            if not args.cancel_duplicates:
+                print("Индекс не создан. Запустите с --cancel-duplicates, чтобы отменить лишние регистрации.")
+                return
+            await cancel_duplicates(duplicates)
+            print(f"Отменено регистраций: {len(duplicates)}")
+        async with engine.begin() as conn:
+            await conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_registrations_user_event_active "
+                "ON registrations (user_id, event_id) WHERE status <> 'cancelled'"
+            ))
+        print("Индекс uq_registrations_user_event_active создан")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,55 @@
+# backend/database/add_deletion_jobs.py
+# Готовит существующую БД к фоновому удалению (backend/config/deletion_jobs.py): добавляет
+# events.deleted_at и users.deleted_at, создает таблицу deletion_jobs и индексы по внешним ключам,
+# по которым удаление выбирает пакеты. Индексы строятся CONCURRENTLY - без блокировки записи.
+# Запуск: python backend/database/add_deletion_jobs.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine, DeletionJob
+
+# Индекс -> (таблица, столбец)
+FOREIGN_KEY_INDEXES = {
+    "ix_notification_views_template_id": ("notification_views", "template_id"),
+    "ix_notification_templates_event_id": ("notification_templates", "event_id"),
+    "ix_medias_event_id": ("medias", "event_id"),
+    "ix_medias_user_uploaded_by_id": ("medias", "user_uploaded_by_id"),
+    "ix_user_activities_user_id": ("user_activities", "user_id"),
+    "ix_users_params_user_id": ("users_params", "user_id"),
+}
+
+
+async def ensure_deletion_schema():
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE events ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP"))
+        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP"))
+        await conn.run_sync(lambda sync_conn: DeletionJob.__table__.create(sync_conn, checkfirst=True))
+
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index_name, (table, column) in FOREIGN_KEY_INDEXES.items():
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table} ({column})"))
+            print(f"Индекс {index_name} готов")
+
+
+async def main():
+    try:
+        await ensure_deletion_schema()
+        print("Схема фонового удаления готова")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,36 @@
+# backend/database/add_image_variants_column.py
+# Добавляет events.variants_ready в существующую БД (create_all не меняет созданные таблицы).
+# Запуск: python backend/database/add_image_variants_column.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine
+
+
+async def ensure_variants_ready_column():
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "ALTER TABLE events ADD COLUMN IF NOT EXISTS variants_ready BOOLEAN NOT NULL DEFAULT true"
+        ))
+
+
+async def main():
+    try:
+        await ensure_variants_ready_column()
+        print("Колонка events.variants_ready готова")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
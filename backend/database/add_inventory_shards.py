@@ -0,0 +1,39 @@
+# backend/database/add_inventory_shards.py
+# Готовит существующую БД к шардированному остатку билетов (create_all не меняет созданные таблицы):
+# колонка ticket_types.shard_count, таблица ticket_inventory_shards и представление ticket_inventory.
+# Запуск: python backend/database/add_inventory_shards.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine, TICKET_INVENTORY_VIEW_SQL, TicketInventoryShard
+
+
+async def ensure_inventory_shards():
+    async with engine.begin() as conn:
+        await conn.execute(text(
+            "ALTER TABLE ticket_types ADD COLUMN IF NOT EXISTS shard_count INTEGER NOT NULL DEFAULT 0"
+        ))
+        await conn.run_sync(lambda sync_conn: TicketInventoryShard.__table__.create(sync_conn, checkfirst=True))
+        await conn.execute(text(TICKET_INVENTORY_VIEW_SQL))
+
+
+async def main():
+    try:
+        await ensure_inventory_shards()
+        print("Шардированный остаток билетов готов к использованию")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
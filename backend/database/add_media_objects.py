@@ -0,0 +1,59 @@
+# backend/database/add_media_objects.py
+# Создает таблицу media_objects в существующей БД и пересчитывает счетчики ссылок по столбцам
+# events.image_url, users.avatar_url и medias.url. Повторный запуск безопасен - скрипт можно
+# использовать для сверки счетчиков. Файлы со старыми uuid-именами в хранилище не учитываются.
+# Запуск: python backend/database/add_media_objects.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine, MediaObject
+
+# sha256 объекта из URL вида /images/{sha256}_{версия}.{расширение}
+REFERENCES_SQL = """
+SELECT substring(url from '([0-9a-f]{64})_[a-z]+\\.[a-z0-9]+$') AS id, count(*) AS refs
+FROM (
+    SELECT image_url AS url FROM events
+    UNION ALL SELECT avatar_url FROM users
+    UNION ALL SELECT url FROM medias
+) urls
+WHERE url ~ '[0-9a-f]{64}_[a-z]+\\.[a-z0-9]+$'
+GROUP BY 1
+"""
+
+
+async def recount_references() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: MediaObject.__table__.create(sync_conn, checkfirst=True))
+        await conn.execute(text("LOCK TABLE media_objects IN SHARE ROW EXCLUSIVE MODE"))
+        references = {row.id: row.refs for row in await conn.execute(text(REFERENCES_SQL))}
+        await conn.execute(text("UPDATE media_objects SET ref_count = 0 WHERE ref_count <> 0"))
+        missing = 0
+        for media_id, refs in references.items():
+            updated = await conn.execute(
+                text("UPDATE media_objects SET ref_count = :refs WHERE id = :id"), {"id": media_id, "refs": refs}
+            )
+            if updated.rowcount == 0:
+                missing += 1
+                print(f"Нет записи для объекта {media_id} ({refs} ссылок)")
+    print(f"Счетчики пересчитаны: объектов со ссылками {len(references) - missing}, без записи {missing}")
+
+
+async def main():
+    try:
+        await recount_references()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,46 @@
+# backend/database/add_notification_view_indexes.py
+# Создает в существующей БД индексы notification_views, которые новые базы получают из модели
+# (__table_args__): под пакетные отметки о просмотре (получатель + шаблон) и под политику
+# хранения просмотренных уведомлений. Индексы строятся CONCURRENTLY - без блокировки записи.
+# Запуск: python backend/database/add_notification_view_indexes.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine
+
+# Индекс -> определение (должно совпадать с NotificationView.__table_args__)
+NOTIFICATION_VIEW_INDEXES = {
+    "ix_notification_views_user_template": "notification_views (user_id, template_id)",
+    "ix_notification_views_fingerprint_template": "notification_views (fingerprint, template_id)",
+    "ix_notification_views_viewed_at": "notification_views (viewed_at) WHERE is_viewed",
+}
+
+
+async def ensure_indexes():
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index_name, definition in NOTIFICATION_VIEW_INDEXES.items():
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {definition}"))
+            print(f"Индекс {index_name} готов")
+
+
+async def main():
+    try:
+        await ensure_indexes()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
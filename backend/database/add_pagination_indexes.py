@@ -0,0 +1,46 @@
+# backend/database/add_pagination_indexes.py
+# Создает в существующей БД индексы ключей keyset-пагинации (курсоров), которые новые базы
+# получают из моделей (__table_args__): публичный список мероприятий, билеты пользователя
+# и список пользователей в админке. Индексы строятся CONCURRENTLY - без блокировки записи.
+# Запуск: python backend/database/add_pagination_indexes.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine
+
+# Индекс -> определение (должно совпадать с __table_args__ моделей Event, Registration, User)
+PAGINATION_INDEXES = {
+    "ix_events_start_date_id": "events (start_date, id)",
+    "ix_registrations_user_submission_id": "registrations (user_id, submission_time, id)",
+    "ix_users_created_at_id": "users (created_at, id)",
+}
+
+
+async def ensure_indexes():
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        for index_name, definition in PAGINATION_INDEXES.items():
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {definition}"))
+            print(f"Индекс {index_name} готов")
+
+
+async def main():
+    try:
+        await ensure_indexes()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+# backend/database/add_search_indexes.py
+# Готовит существующую БД к поиску в админке по триграммам: создает расширение pg_trgm
+# и GIN-индексы gin_trgm_ops, которые новые базы получают из моделей (__table_args__).
+# Индексы строятся CONCURRENTLY - без блокировки записи. Создание расширения требует
+# прав владельца БД (или суперпользователя).
+# Запуск: python backend/database/add_search_indexes.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine
+
+# Индекс -> определение (должно совпадать с __table_args__ моделей Event и User)
+SEARCH_INDEXES = {
+    "ix_events_title_trgm": "events USING gin (title gin_trgm_ops)",
+    "ix_users_fio_trgm": "users USING gin (fio gin_trgm_ops)",
+    "ix_users_email_trgm": "users USING gin (email gin_trgm_ops)",
+    "ix_users_telegram_trgm": "users USING gin (telegram gin_trgm_ops)",
+    "ix_users_whatsapp_trgm": "users USING gin (whatsapp gin_trgm_ops)",
+}
+
+
+async def ensure_indexes():
+    # CREATE INDEX CONCURRENTLY не выполняется внутри транзакции
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for index_name, definition in SEARCH_INDEXES.items():
+            await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {definition}"))
+            print(f"Индекс {index_name} готов")
+
+
+async def main():
+    try:
+        await ensure_indexes()
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,37 @@
+# backend/database/add_telegram_chat_id.py
+# Добавляет users.telegram_chat_id в существующую БД (create_all не меняет созданные таблицы).
+# Запуск: python backend/database/add_telegram_chat_id.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine
+
+
+async def ensure_telegram_chat_id_column():
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS telegram_chat_id BIGINT"))
+        await conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS users_telegram_chat_id_key ON users (telegram_chat_id)"
+        ))
+
+
+async def main():
+    try:
+        await ensure_telegram_chat_id_column()
+        print("Колонка users.telegram_chat_id готова")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,38 @@
+# backend/database/add_ticket_hold_column.py
+# Добавляет registrations.hold_expires_at в существующую БД (create_all не меняет созданные таблицы).
+# Запуск: python backend/database/add_ticket_hold_column.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine
+
+
+async def ensure_hold_expires_at_column():
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE registrations ADD COLUMN IF NOT EXISTS hold_expires_at TIMESTAMP"))
+        await conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_registrations_hold_expires_at ON registrations (hold_expires_at) "
+            "WHERE hold_expires_at IS NOT NULL"
+        ))
+
+
+async def main():
+    try:
+        await ensure_hold_expires_at_column()
+        print("Колонка registrations.hold_expires_at готова")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
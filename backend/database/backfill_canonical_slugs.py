@@ -0,0 +1,66 @@
+# backend/database/backfill_canonical_slugs.py
+import asyncio
+import os
+import sys
+
+from sqlalchemy import select, text
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine, AsyncSessionLocal, Event
+from backend.config.event_cache import build_canonical_slug
+from backend.config.logging_config import logger
+
+BATCH_SIZE = 500
+
+
+async def ensure_canonical_slug_column():
+    """Добавляет колонку и индекс в существующую БД (create_all не меняет созданные таблицы)."""
+    async with engine.begin() as conn:
+        await conn.execute(text("ALTER TABLE events ADD COLUMN IF NOT EXISTS canonical_slug VARCHAR(300)"))
+        await conn.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS ix_events_canonical_slug ON events (canonical_slug)"
+        ))
+
+
+async def backfill_canonical_slugs() -> int:
+    """Заполняет canonical_slug для мероприятий, у которых он еще не вычислен."""
+    updated = 0
+    last_id = 0
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Event)
+                .where(Event.id > last_id)
+                .where(Event.canonical_slug.is_(None))
+                .order_by(Event.id)
+                .limit(BATCH_SIZE)
+            )
+            events = result.scalars().all()
+            if not events:
+                break
+            for event in events:
+                event.canonical_slug = build_canonical_slug(event.url_slug, event.title, event.start_date, event.id)
+            await session.commit()
+            updated += len(events)
+            last_id = events[-1].id
+            logger.info(f"Canonical slugs backfilled for {updated} events")
+    return updated
+
+
+async def main():
+    try:
+        await ensure_canonical_slug_column()
+        updated = await backfill_canonical_slugs()
+        print(f"Обновлено мероприятий: {updated}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
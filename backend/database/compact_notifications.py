@@ -0,0 +1,201 @@
+# backend/database/compact_notifications.py
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import delete, exists, func, select, and_
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.database.user_db import engine, AsyncSessionLocal, NotificationView, UserActivity
+from backend.config.logging_config import logger
+
+
+def _int_env(name: str, default: int) -> int:
+    value = os.getenv(name, str(default))
+    try:
+        return int(value)
+    except ValueError:
+        logger.error(f"Неверное значение для {name}: {value}. Используется значение по умолчанию {default}.")
+        return default
+
+# --- Загрузка конфигурации из .env ---
+# Политики хранения (значение <= 0 отключает политику)
+VIEWED_RETENTION_DAYS = _int_env("NOTIFICATION_VIEWED_RETENTION_DAYS", 30)
+MAX_NOTIFICATIONS_PER_RECIPIENT = _int_env("NOTIFICATION_MAX_PER_RECIPIENT", 200)
+FINGERPRINT_INACTIVE_DAYS = _int_env("NOTIFICATION_FINGERPRINT_INACTIVE_DAYS", 90)
+# Параметры пакетного удаления и расписания
+COMPACTION_BATCH_SIZE = max(_int_env("NOTIFICATION_COMPACTION_BATCH_SIZE", 1000), 1)
+COMPACTION_PAUSE_MS = _int_env("NOTIFICATION_COMPACTION_PAUSE_MS", 50)
+COMPACTION_INTERVAL_MINUTES = _int_env("NOTIFICATION_COMPACTION_INTERVAL_MINUTES", 60)
+# --- Конец загрузки конфигурации ---
+
+# Ключ advisory lock, чтобы задачу выполнял только один процесс
+COMPACTION_LOCK_KEY = 726001
+
+
+async def _delete_chunk(id_query) -> int:
+    """Удаляет одну пачку строк в отдельной короткой транзакции."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            delete(NotificationView).where(NotificationView.id.in_(id_query))
+        )
+        await session.commit()
+        return result.rowcount or 0
+
+
+async def _delete_in_chunks(id_query_factory) -> int:
+    total = 0
+    while True:
+        deleted = await _delete_chunk(id_query_factory().limit(COMPACTION_BATCH_SIZE))
+        total += deleted
+        if deleted < COMPACTION_BATCH_SIZE:
+            return total
+        # Даем другим транзакциям поработать между пачками
+        await asyncio.sleep(COMPACTION_PAUSE_MS / 1000)
+
+
+async def purge_expired_viewed(now: datetime) -> int:
+    """Удаляет просмотренные уведомления старше VIEWED_RETENTION_DAYS."""
+    if VIEWED_RETENTION_DAYS <= 0:
+        return 0
+    cutoff = now - timedelta(days=VIEWED_RETENTION_DAYS)
+    return await _delete_in_chunks(
+        lambda: select(NotificationView.id)
+        .where(NotificationView.is_viewed == True)
+        .where(NotificationView.viewed_at < cutoff)
+        .with_for_update(skip_locked=True)
+    )
+
+
+async def cap_recipient_history() -> int:
+    """Оставляет не более MAX_NOTIFICATIONS_PER_RECIPIENT последних уведомлений на получателя."""
+    if MAX_NOTIFICATIONS_PER_RECIPIENT <= 0:
+        return 0
+    async with AsyncSessionLocal() as session:
+        overflow = await session.execute(
+            select(NotificationView.user_id, NotificationView.fingerprint)
+            .group_by(NotificationView.user_id, NotificationView.fingerprint)
+            .having(func.count() > MAX_NOTIFICATIONS_PER_RECIPIENT)
+        )
+        recipients = overflow.all()
+
+    total = 0
+    for user_id, fingerprint in recipients:
+        if user_id is not None:
+            recipient_filter = NotificationView.user_id == user_id
+        elif fingerprint is not None:
+            recipient_filter = and_(NotificationView.user_id.is_(None), NotificationView.fingerprint == fingerprint)
+        else:
+            continue
+        total += await _delete_in_chunks(
+            lambda: select(NotificationView.id)
+            .where(recipient_filter)
+            .order_by(NotificationView.created_at.desc(), NotificationView.id.desc())
+            .offset(MAX_NOTIFICATIONS_PER_RECIPIENT)
+        )
+    return total
+
+
+async def purge_inactive_fingerprints(now: datetime) -> int:
+    """Удаляет уведомления устройств, не проявлявших активности FINGERPRINT_INACTIVE_DAYS дней."""
+    if FINGERPRINT_INACTIVE_DAYS <= 0:
+        return 0
+    cutoff = now - timedelta(days=FINGERPRINT_INACTIVE_DAYS)
+    recent_activity = exists().where(
+        UserActivity.device_fingerprint == NotificationView.fingerprint,
+        UserActivity.created_at >= cutoff,
+    )
+    return await _delete_in_chunks(
+        lambda: select(NotificationView.id)
+        .where(NotificationView.user_id.is_(None))
+        .where(NotificationView.fingerprint.isnot(None))
+        .where(NotificationView.created_at < cutoff)
+        .where(~recent_activity)
+        .with_for_update(skip_locked=True)
+    )
+
+
+async def compact_notification_views() -> Dict[str, int]:
+    """Запускает все политики хранения и возвращает количество удаленных строк."""
+    started = time.monotonic()
+    now = datetime.utcnow()
+    report = {
+        "viewed_expired": await purge_expired_viewed(now),
+        "recipient_cap": await cap_recipient_history(),
+        "inactive_fingerprints": await purge_inactive_fingerprints(now),
+    }
+    report["total"] = sum(report.values())
+    report["duration_ms"] = int((time.monotonic() - started) * 1000)
+    logger.info(f"Notification compaction finished: {report}")
+    return report
+
+
+async def run_compaction_locked() -> Optional[Dict[str, int]]:
+    """Выполняет компактизацию, если ее не выполняет другой процесс."""
+    async with engine.connect() as conn:
+        acquired = (await conn.execute(select(func.pg_try_advisory_lock(COMPACTION_LOCK_KEY)))).scalar()
+        if not acquired:
+            logger.info("Notification compaction is already running in another process, skipping")
+            return None
+        try:
+            return await compact_notification_views()
+        finally:
+            await conn.execute(select(func.pg_advisory_unlock(COMPACTION_LOCK_KEY)))
+
+
+class NotificationCompactionScheduler:
+    """Периодический запуск компактизации внутри процесса сервера."""
+
+    def __init__(self, interval_minutes: int):
+        self.interval_minutes = interval_minutes
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_minutes * 60)
+            try:
+                await run_compaction_locked()
+            except Exception as e:
+                logger.error(f"Error during notification compaction: {str(e)}", exc_info=True)
+
+    def start(self) -> None:
+        if self.interval_minutes <= 0:
+            logger.info("Notification compaction scheduler is disabled")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Notification compaction scheduled every {self.interval_minutes} minutes")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+notification_compaction_scheduler = NotificationCompactionScheduler(COMPACTION_INTERVAL_MINUTES)
+
+
+async def main():
+    try:
+        report = await run_compaction_locked()
+        if report is not None:
+            print(f"Удалено строк: {report['total']} ({report})")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
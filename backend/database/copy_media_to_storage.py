@@ -0,0 +1,63 @@
+# backend/database/copy_media_to_storage.py
+# Копирует файлы локального каталога private_media в хранилище, заданное MEDIA_STORAGE_BACKEND
+# (обычно s3), сохраняя ключи. Уже существующие объекты пропускаются, поэтому повторный запуск
+# докопирует только новые файлы. Временные файлы загрузок и обработки не копируются.
+# Запуск: MEDIA_STORAGE_BACKEND=s3 python backend/database/copy_media_to_storage.py [--concurrency 8]
+import argparse
+import asyncio
+import os
+import sys
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.config.storage import MEDIA_DIR, STAGING_DIR, LocalStorage, storage
+
+
+async def copy_media(source: LocalStorage, concurrency: int) -> dict:
+    report = {"copied": 0, "skipped": 0, "bytes": 0}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def copy(key: str, size: int) -> None:
+        async with semaphore:
+            if await storage.exists(key):
+                report["skipped"] += 1
+                return
+            await storage.put_file(key, source.path(key))
+            report["copied"] += 1
+            report["bytes"] += size
+
+    tasks = []
+    async for stored in source.iter_objects():
+        if stored.key.startswith(f"{STAGING_DIR}/") or stored.key.endswith(".part"):
+            continue
+        tasks.append(asyncio.create_task(copy(stored.key, stored.size)))
+        if len(tasks) >= concurrency * 10:
+            await asyncio.gather(*tasks)
+            tasks = []
+    await asyncio.gather(*tasks)
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Copy the local media directory into the configured storage")
+    parser.add_argument("--concurrency", type=int, default=8, help="одновременных загрузок")
+    args = parser.parse_args()
+    if isinstance(storage, LocalStorage):
+        print("MEDIA_STORAGE_BACKEND=local: копировать некуда")
+        return
+    # Пути хранилища заданы относительно корня проекта (как у серверов)
+    os.chdir(root_dir)
+    try:
+        report = await copy_media(LocalStorage(MEDIA_DIR), max(args.concurrency, 1))
+        print(f"Скопировано: {report['copied']} файлов ({report['bytes'] / 1024 / 1024:.1f} МБ), уже были: {report['skipped']}")
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
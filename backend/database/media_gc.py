@@ -0,0 +1,288 @@
+# backend/database/media_gc.py
+# Сборщик осиротевших медиафайлов: перечисляет хранилище потоком, сверяет файлы пакетами
+# со столбцами events.image_url, users.avatar_url и medias.url и удаляет (или переносит в карантин)
+# файлы без ссылок старше периода ожидания. Период ожидания защищает загрузки, транзакция которых
+# еще не закоммичена.
+# Запуск: python backend/database/media_gc.py [--dry-run] [--delete] [--grace-hours 24]
+import argparse
+import asyncio
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.types import String
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.config.logging_config import logger
+from backend.config.media_store import MEDIA_URL_PREFIX, media_id_from_url
+from backend.config.storage import STAGING_DIR, create_storage, storage
+from backend.database.user_db import engine, AsyncSessionLocal, MediaObject
+
+
+def _int_env(name: str, default: int) -> int:
+    value = os.getenv(name, str(default))
+    try:
+        return int(value)
+    except ValueError:
+        logger.error(f"Неверное значение для {name}: {value}. Используется значение по умолчанию {default}.")
+        return default
+
+# --- Загрузка конфигурации из .env ---
+MEDIA_GC_GRACE_HOURS = _int_env("MEDIA_GC_GRACE_HOURS", 24)
+MEDIA_GC_BATCH_SIZE = max(_int_env("MEDIA_GC_BATCH_SIZE", 500), 1)
+# Каталог карантина вне хранилища (для S3 - префикс в том же бакете); пустое значение - файлы удаляются сразу
+MEDIA_GC_QUARANTINE_DIR = os.getenv("MEDIA_GC_QUARANTINE_DIR", "media_quarantine")
+MEDIA_GC_INTERVAL_MINUTES = _int_env("MEDIA_GC_INTERVAL_MINUTES", 360)
+# --- Конец загрузки конфигурации ---
+
+# Ключ advisory lock, чтобы сборку выполнял только один процесс
+MEDIA_GC_LOCK_KEY = 726002
+
+LEGACY_ID_RE = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})")
+
+# Ссылки на файлы пакета: по id объекта хранилища (любая версия держит весь объект),
+# по uuid старой группы файлов или по точному URL для прочих имен
+REFERENCES_SQL = text("""
+SELECT url
+FROM (
+    SELECT image_url AS url FROM events
+    UNION ALL SELECT avatar_url FROM users
+    UNION ALL SELECT url FROM medias
+) urls
+WHERE url IS NOT NULL AND (
+    substring(url from '([0-9a-f]{64})_[a-z]+\\.[a-z0-9]+$') = ANY(:media_ids)
+    OR substring(url from '([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})[^/]*$') = ANY(:legacy_ids)
+    OR url = ANY(:urls)
+)
+""").bindparams(
+    bindparam("media_ids", type_=ARRAY(String)),
+    bindparam("legacy_ids", type_=ARRAY(String)),
+    bindparam("urls", type_=ARRAY(String)),
+)
+
+
+def file_key(relpath: str) -> Tuple[str, str]:
+    """Ключ, по которому файл считается используемым: ("media", sha256), ("legacy", uuid) или ("url", URL)."""
+    if relpath.startswith(f"{STAGING_DIR}/"):
+        # Остатки прерванной обработки: на них не ссылаются по определению
+        return "url", relpath
+    filename = os.path.basename(relpath)
+    media_id = media_id_from_url(filename)
+    if media_id is not None:
+        return "media", media_id
+    legacy = LEGACY_ID_RE.match(filename)
+    if legacy:
+        return "legacy", legacy.group(1)
+    return "url", f"{MEDIA_URL_PREFIX}{relpath}"
+
+
+async def iter_media_files(cutoff: float, report: Dict[str, int]) -> AsyncIterator[Tuple[str, int]]:
+    """Перечисляет хранилище без построения полного списка; возвращает (ключ объекта, размер)."""
+    async for stored in storage.iter_objects():
+        report["scanned_files"] += 1
+        report["scanned_bytes"] += stored.size
+        if stored.mtime > cutoff:
+            report["skipped_recent"] += 1
+            continue
+        yield stored.key, stored.size
+
+
+async def _batches(files: AsyncIterator[Tuple[str, int]], size: int) -> AsyncIterator[List[Tuple[str, int]]]:
+    batch = []
+    async for item in files:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def _dispose_file(key: str, quarantine) -> bool:
+    try:
+        if quarantine is not None:
+            # Раскладка сохраняется: восстановление - перенос файла обратно
+            await storage.move(key, key, target=quarantine)
+            return True
+        return await storage.delete([key]) > 0
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.warning(f"Failed to collect media file {key}: {e!r}")
+        return False
+
+
+async def collect_batch(batch: List[Tuple[str, int]], report: Dict[str, int], dry_run: bool, quarantine) -> None:
+    keys = {relpath: file_key(relpath) for relpath, _ in batch}
+    by_kind = {"media": set(), "legacy": set(), "url": set()}
+    for kind, value in keys.values():
+        by_kind[kind].add(value)
+
+    async with AsyncSessionLocal() as db:
+        rows = await db.execute(REFERENCES_SQL, {
+            "media_ids": list(by_kind["media"]),
+            "legacy_ids": list(by_kind["legacy"]),
+            "urls": list(by_kind["url"]),
+        })
+        referenced = {file_key(url[len(MEDIA_URL_PREFIX):]) for (url,) in rows if url.startswith(MEDIA_URL_PREFIX)}
+
+        orphans = [(relpath, size) for relpath, size in batch if keys[relpath] not in referenced]
+        orphan_ids = list({keys[relpath][1] for relpath, _ in orphans if keys[relpath][0] == "media"})
+        held = set()
+        if orphan_ids:
+            # Строки объектов блокируются до конца пакета: параллельная загрузка того же файла дождется коммита
+            counters = await db.execute(
+                select(MediaObject.id, MediaObject.ref_count)
+                .where(MediaObject.id.in_(orphan_ids))
+                .with_for_update()
+            )
+            held = {media_id for media_id, ref_count in counters if ref_count > 0}
+            if held:
+                # Счетчик есть, а ссылок в столбцах нет: расхождение исправляет add_media_objects.py
+                report["refcount_drift"] += len(held)
+                logger.warning(f"Media GC: reference counters disagree with URL columns for {len(held)} objects")
+
+        for relpath, size in orphans:
+            if keys[relpath][0] == "media" and keys[relpath][1] in held:
+                continue
+            if dry_run or await _dispose_file(relpath, quarantine):
+                report["orphan_files"] += 1
+                report["reclaimed_bytes"] += size
+                logger.info(f"Media GC: {'would collect' if dry_run else 'collected'} {relpath} ({size} bytes)")
+
+        collectable_ids = [media_id for media_id in orphan_ids if media_id not in held]
+        if collectable_ids and not dry_run:
+            await db.execute(
+                delete(MediaObject).where(MediaObject.id.in_(collectable_ids), MediaObject.ref_count == 0)
+            )
+        await db.commit()
+
+
+async def purge_stale_objects(cutoff: datetime) -> int:
+    """Удаляет строки объектов без ссылок, не менявшиеся дольше периода ожидания (их файлы уже удалены или соберутся)."""
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(MediaObject).where(MediaObject.id.in_(
+                    select(MediaObject.id)
+                    .where(MediaObject.ref_count == 0, MediaObject.updated_at < cutoff)
+                    .limit(MEDIA_GC_BATCH_SIZE)
+                    .with_for_update(skip_locked=True)
+                ))
+            )
+            await db.commit()
+        deleted = result.rowcount or 0
+        total += deleted
+        if deleted < MEDIA_GC_BATCH_SIZE:
+            return total
+
+
+async def collect_orphaned_media(
+    dry_run: bool = False, grace_hours: int = MEDIA_GC_GRACE_HOURS, quarantine_dir: Optional[str] = MEDIA_GC_QUARANTINE_DIR
+) -> Dict[str, int]:
+    """Один проход сборщика; возвращает отчет с числом файлов и освобожденных байт."""
+    started = time.monotonic()
+    report = {
+        "scanned_files": 0, "scanned_bytes": 0, "skipped_recent": 0,
+        "orphan_files": 0, "reclaimed_bytes": 0, "refcount_drift": 0, "stale_objects": 0,
+    }
+    cutoff = time.time() - grace_hours * 3600
+    quarantine = create_storage(quarantine_dir) if quarantine_dir else None
+    try:
+        async for batch in _batches(iter_media_files(cutoff, report), MEDIA_GC_BATCH_SIZE):
+            await collect_batch(batch, report, dry_run, quarantine)
+    finally:
+        if quarantine is not None:
+            await quarantine.close()
+    if not dry_run:
+        report["stale_objects"] = await purge_stale_objects(datetime.utcfromtimestamp(cutoff))
+    report["duration_ms"] = int((time.monotonic() - started) * 1000)
+    logger.info(f"Media GC finished{' (dry run)' if dry_run else ''}: {report}")
+    return report
+
+
+async def run_gc_locked(**kwargs) -> Optional[Dict[str, int]]:
+    """Выполняет сборку, если ее не выполняет другой процесс."""
+    async with engine.connect() as conn:
+        acquired = (await conn.execute(select(func.pg_try_advisory_lock(MEDIA_GC_LOCK_KEY)))).scalar()
+        if not acquired:
+            logger.info("Media GC is already running in another process, skipping")
+            return None
+        try:
+            return await collect_orphaned_media(**kwargs)
+        finally:
+            await conn.execute(select(func.pg_advisory_unlock(MEDIA_GC_LOCK_KEY)))
+
+
+class MediaGCScheduler:
+    """Периодический запуск сборщика внутри процесса сервера."""
+
+    def __init__(self, interval_minutes: int):
+        self.interval_minutes = interval_minutes
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval_minutes * 60)
+            try:
+                await run_gc_locked()
+            except Exception as e:
+                logger.error(f"Error during media GC: {str(e)}", exc_info=True)
+
+    def start(self) -> None:
+        if self.interval_minutes <= 0:
+            logger.info("Media GC scheduler is disabled")
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Media GC scheduled every {self.interval_minutes} minutes")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+media_gc_scheduler = MediaGCScheduler(MEDIA_GC_INTERVAL_MINUTES)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Collect orphaned media files")
+    parser.add_argument("--dry-run", action="store_true", help="только показать, что будет собрано")
+    parser.add_argument("--delete", action="store_true", help="удалять файлы, а не переносить в карантин")
+    parser.add_argument("--grace-hours", type=int, default=MEDIA_GC_GRACE_HOURS, help="не трогать файлы моложе")
+    args = parser.parse_args()
+    # Пути хранилища заданы относительно корня проекта (как у серверов)
+    os.chdir(root_dir)
+    try:
+        report = await run_gc_locked(
+            dry_run=args.dry_run,
+            grace_hours=args.grace_hours,
+            quarantine_dir=None if args.delete else MEDIA_GC_QUARANTINE_DIR,
+        )
+        if report is not None:
+            action = "Будет освобождено" if args.dry_run else "Освобождено"
+            print(f"{action}: {report['reclaimed_bytes'] / 1024 / 1024:.1f} МБ в {report['orphan_files']} файлах ({report})")
+    finally:
+        await storage.close()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,225 @@
+# backend/database/migrate_media_layout.py
+# Переносит медиафайлы в двухуровневую раскладку хранилища (private_media/ab/cd/{hash}_{версия}.ext)
+# и переписывает URL в events.image_url, users.avatar_url и medias.url пакетами.
+#
+# Файлы со старыми uuid-именами (private_media/{uuid}_medium.webp, private_media/users_avatars/{uuid}.jpg)
+# получают имя по sha256 оригинала, файлы хранилища из корня каталога переносятся как есть.
+# Порядок безопасен для работающих серверов: сначала файлы появляются по новым путям (жесткие ссылки),
+# затем переписываются URL, и только потом удаляются старые файлы. Повторный запуск продолжает
+# прерванную миграцию. Работает с локальным каталогом; в S3 файлы переносятся после миграции
+# скриптом copy_media_to_storage.py.
+# Запуск: python backend/database/migrate_media_layout.py [--dry-run] [--batch-size 500] [--keep-old]
+import argparse
+import asyncio
+import hashlib
+import os
+import re
+import shutil
+import sys
+
+from sqlalchemy import cast, select, text, update
+from sqlalchemy.dialects.postgresql import JSONB, insert as pg_insert
+
+# Добавляем корневую директорию проекта в sys.path (для запуска как скрипта)
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.dirname(current_dir)
+root_dir = os.path.dirname(backend_dir)
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
+
+from backend.config.event_cache import invalidate_event
+from backend.config.media_store import (
+    MEDIA_DIR, MEDIA_FILENAME_RE, MEDIA_URL_PREFIX, media_id_from_url, media_path, media_url
+)
+from backend.database.add_media_objects import recount_references
+from backend.database.user_db import engine, AsyncSessionLocal, Event, Media, MediaObject, User
+
+# Каталоги со старой плоской раскладкой
+LEGACY_DIRS = ("", "users_avatars")
+LEGACY_NAME_RE = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(?:_([a-z]+))?\.([a-z0-9]+)$")
+# Файл группы, по содержимому которого вычисляется id объекта (по убыванию качества)
+PRIMARY_VARIANTS = ("original", "large", "medium", "thumb")
+# Столбцы со ссылками на медиа
+URL_COLUMNS = ((Event, Event.image_url), (User, User.avatar_url), (Media, Media.url))
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def plan_moves():
+    """
+    Сканирует плоские каталоги и строит план:
+    moves - [(старый путь, новое имя файла)], url_map - старый URL -> новый URL,
+    objects - id объекта -> (расширение, размер, манифест версий).
+    """
+    legacy_groups = {}
+    moves, url_map, objects = [], {}, {}
+
+    def add(path: str, old_relpath: str, filename: str, media_id: str, variant: str) -> None:
+        moves.append((path, filename))
+        url_map[f"{MEDIA_URL_PREFIX}{old_relpath}"] = media_url(filename)
+        media_object = objects.setdefault(media_id, [None, 0, {}])
+        media_object[2][variant] = filename
+        if variant == "original" or media_object[0] is None:
+            # Расширение и размер объекта - по оригиналу
+            media_object[0] = filename.rsplit(".", 1)[1]
+            media_object[1] = os.path.getsize(path)
+
+    for directory in LEGACY_DIRS:
+        full_dir = os.path.join(MEDIA_DIR, directory)
+        if not os.path.isdir(full_dir):
+            continue
+        for entry in os.scandir(full_dir):
+            if not entry.is_file():
+                continue
+            relpath = f"{directory}/{entry.name}" if directory else entry.name
+            stored = MEDIA_FILENAME_RE.match(entry.name)
+            if stored:
+                # Файл хранилища в корне каталога - меняется только путь
+                add(entry.path, relpath, entry.name, stored.group(1), stored.group(2))
+                continue
+            legacy = LEGACY_NAME_RE.match(entry.name)
+            if legacy:
+                legacy_id, variant, _ = legacy.groups()
+                # Старый аватар без суффикса - это загруженный оригинал
+                legacy_groups.setdefault((directory, legacy_id), {})[variant or "original"] = (entry.path, relpath)
+
+    for (_, legacy_id), files in legacy_groups.items():
+        primary = next(variant for variant in PRIMARY_VARIANTS + tuple(files) if variant in files)
+        media_id = file_sha256(files[primary][0])
+        if primary != "original":
+            # Оригинала нет - объект хранит лучшую версию как оригинал
+            files = {**files, "original": files[primary]}
+            files.pop(primary)
+        for variant, (path, relpath) in files.items():
+            extension = path.rsplit(".", 1)[1]
+            add(path, relpath, f"{media_id}_{variant}.{extension}", media_id, variant)
+    return moves, url_map, objects
+
+
+async def ensure_media_objects_table() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(lambda sync_conn: MediaObject.__table__.create(sync_conn, checkfirst=True))
+        await conn.execute(text(
+            "ALTER TABLE media_objects ADD COLUMN IF NOT EXISTS variants JSONB NOT NULL DEFAULT '{}'::jsonb"
+        ))
+
+
+def place_files(moves) -> int:
+    """Создает файлы по новым путям жесткими ссылками (копией на другой файловой системе)."""
+    placed = 0
+    for path, filename in moves:
+        target = media_path(filename)
+        if os.path.exists(target):
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except OSError:
+            shutil.copy2(path, target)
+        placed += 1
+    return placed
+
+
+async def register_objects(objects) -> None:
+    async with AsyncSessionLocal() as db:
+        for media_id, (extension, size, variants) in objects.items():
+            await db.execute(
+                pg_insert(MediaObject)
+                .values(id=media_id, extension=extension, size=size, ref_count=0, variants=variants)
+                .on_conflict_do_update(
+                    index_elements=[MediaObject.id],
+                    set_={"variants": MediaObject.variants.op("||")(cast(variants, JSONB))},
+                )
+            )
+        await db.commit()
+
+
+async def rewrite_urls(url_map, batch_size: int, dry_run: bool):
+    """Переписывает URL пакетами по id; возвращает (число измененных строк, URL без файла)."""
+    rewritten, unmapped = 0, set()
+    for model, column in URL_COLUMNS:
+        last_id = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                rows = (await db.execute(
+                    select(model.id, column)
+                    .where(model.id > last_id, column.startswith(MEDIA_URL_PREFIX))
+                    .order_by(model.id)
+                    .limit(batch_size)
+                )).all()
+                if not rows:
+                    break
+                last_id = rows[-1][0]
+                changed = []
+                for row_id, url in rows:
+                    if url in url_map:
+                        changed.append((row_id, url))
+                    elif media_id_from_url(url) is None or media_url(os.path.basename(url)) != url:
+                        # URL не в новой раскладке, а файла для него на диске нет
+                        unmapped.add(url)
+                if changed and not dry_run:
+                    for row_id, url in changed:
+                        # Условие на старый URL: строку могли изменить во время миграции
+                        await db.execute(
+                            update(model).where(model.id == row_id, column == url).values({column.key: url_map[url]})
+                        )
+                    await db.commit()
+                    if model is Event:
+                        for row_id, _ in changed:
+                            await invalidate_event(row_id)
+                rewritten += len(changed)
+            print(f"{model.__tablename__}.{column.key}: обработано до id={last_id}, переписано {rewritten}")
+    return rewritten, unmapped
+
+
+def remove_old_files(moves) -> int:
+    removed = 0
+    for path, filename in moves:
+        if os.path.abspath(path) != os.path.abspath(media_path(filename)) and os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrate media files to the sharded storage layout")
+    parser.add_argument("--dry-run", action="store_true", help="только показать план")
+    parser.add_argument("--batch-size", type=int, default=500, help="строк в одной транзакции")
+    parser.add_argument("--keep-old", action="store_true", help="не удалять файлы по старым путям")
+    args = parser.parse_args()
+    # Пути хранилища заданы относительно корня проекта (как у серверов)
+    os.chdir(root_dir)
+    try:
+        moves, url_map, objects = await asyncio.to_thread(plan_moves)
+        total_bytes = sum(os.path.getsize(path) for path, _ in moves)
+        print(f"Файлов к переносу: {len(moves)} ({total_bytes / 1024 / 1024:.1f} МБ), объектов: {len(objects)}")
+
+        if not args.dry_run:
+            await ensure_media_objects_table()
+            placed = await asyncio.to_thread(place_files, moves)
+            print(f"Файлов размещено по новым путям: {placed}")
+            await register_objects(objects)
+
+        rewritten, unmapped = await rewrite_urls(url_map, args.batch_size, args.dry_run)
+        print(f"URL {'к переписыванию' if args.dry_run else 'переписано'}: {rewritten}")
+        for url in sorted(unmapped):
+            print(f"Файл не найден для URL: {url}")
+        if args.dry_run:
+            return
+
+        await recount_references()
+        if not args.keep_old:
+            removed = await asyncio.to_thread(remove_old_files, moves)
+            print(f"Удалено файлов по старым путям: {removed}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
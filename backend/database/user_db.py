@@ -14,9 +14,11 @@ from sqlalchemy.orm import (
     selectinload
 )
 from contextlib import asynccontextmanager
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
     String,
     ForeignKey,
     Boolean,
@@ -25,7 +27,13 @@ from sqlalchemy import (
     TIMESTAMP,
     Enum,
     UniqueConstraint,
+    Index,
     text,
+    DDL,
+    event,
+    CheckConstraint,
+    MetaData,
+    Table,
 )
 import time
 from backend.config.logging_config import logger
@@ -121,6 +129,9 @@ engine = create_async_engine(
 # Базовый класс для моделей
 Base = declarative_base()
 
+# Триграммные индексы поиска требуют расширения pg_trgm до создания таблиц
+event.listen(Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
 # Создание асинхронной фабрики сессий
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -143,7 +154,7 @@ class UserParams(Base):
     __tablename__ = "users_params"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     max_card_amount = Column(DECIMAL(20, 8), nullable=False)
     max_photo_program_amount = Column(DECIMAL(20, 8), nullable=False)
     max_video_program_amount = Column(DECIMAL(20, 8), nullable=False)
@@ -152,6 +163,12 @@ class UserParams(Base):
 
 class Event(Base):
     __tablename__ = "events"
+    __table_args__ = (
+        # Ключ keyset-пагинации публичного списка (start_date DESC, id DESC)
+        Index('ix_events_start_date_id', 'start_date', 'id'),
+        # Триграммный индекс для поиска по названию в админке (ILIKE '%...%' и similarity)
+        Index('ix_events_title_trgm', 'title', postgresql_using='gin', postgresql_ops={'title': 'gin_trgm_ops'}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(255), nullable=False)
@@ -166,6 +183,12 @@ class Event(Base):
     updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
     status = Column(Enum(EventStatus), default=EventStatus.draft, nullable=False)
     url_slug = Column(String(255), unique=True)
+    # Предвычисленный публичный slug (base-year-id) для поиска мероприятия одним индексным запросом
+    canonical_slug = Column(String(300), unique=True, index=True)
+    # False, пока WebP-версии изображения строятся в фоне (image_url указывает на оригинал)
+    variants_ready = Column(Boolean, default=True, server_default=text('true'), nullable=False)
+    # Мягкое удаление: мероприятие скрыто, связанные данные удаляет фоновая задача (DeletionJob)
+    deleted_at = Column(TIMESTAMP, nullable=True)
     
     tickets = relationship("TicketType", back_populates="event")
     registrations = relationship("Registration", back_populates="event")
@@ -173,6 +196,10 @@ class Event(Base):
 
 class TicketType(Base):
     __tablename__ = "ticket_types"
+    __table_args__ = (
+        # Поиск первого типа билета мероприятия (LATERAL в списке админки)
+        Index('ix_ticket_types_event_id_id', 'event_id', 'id'),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     event_id = Column(Integer, ForeignKey("events.id"))
@@ -181,12 +208,70 @@ class TicketType(Base):
     available_quantity = Column(Integer, nullable=False)
     sold_quantity = Column(Integer, default=0)
     free_registration = Column(Boolean, default=False)
+    # Число строк-счетчиков остатка (0 - остаток в sold_quantity, шардирование выключено)
+    shard_count = Column(Integer, default=0, server_default=text('0'), nullable=False)
     
     event = relationship("Event", back_populates="tickets")
     registrations = relationship("Registration", back_populates="ticket_type")
 
+class TicketInventoryShard(Base):
+    """
+    Часть емкости типа билета для популярных мероприятий: регистрации распределяются
+    по случайным строкам, а не конкурируют за одну строку ticket_types.
+    В режиме шардирования ticket_types.sold_quantity - периодически сводимая сумма sold.
+    """
+    __tablename__ = "ticket_inventory_shards"
+    __table_args__ = (
+        CheckConstraint('sold >= 0 AND sold <= capacity', name='ck_ticket_inventory_shards_sold'),
+    )
+
+    ticket_type_id = Column(Integer, ForeignKey("ticket_types.id", ondelete="CASCADE"), primary_key=True)
+    shard_no = Column(Integer, primary_key=True)
+    capacity = Column(Integer, nullable=False)
+    sold = Column(Integer, default=0, nullable=False)
+
+# Сводный остаток по типам билетов независимо от режима хранения (дешевое чтение доступности)
+TICKET_INVENTORY_VIEW_SQL = """
+CREATE OR REPLACE VIEW ticket_inventory AS
+SELECT t.id AS ticket_type_id,
+       t.event_id,
+       t.available_quantity,
+       CASE WHEN t.shard_count > 0 THEN COALESCE(s.sold, 0) ELSE COALESCE(t.sold_quantity, 0) END AS sold_quantity
+FROM ticket_types t
+LEFT JOIN LATERAL (
+    SELECT SUM(sold)::integer AS sold FROM ticket_inventory_shards WHERE ticket_type_id = t.id
+) s ON t.shard_count > 0
+"""
+event.listen(Base.metadata, "after_create", DDL(TICKET_INVENTORY_VIEW_SQL))
+# Представление зависит от таблиц - удаляем его до drop_all
+event.listen(Base.metadata, "before_drop", DDL("DROP VIEW IF EXISTS ticket_inventory"))
+
+# Представление не создается через create_all, поэтому описано в отдельной MetaData
+ticket_inventory = Table(
+    "ticket_inventory",
+    MetaData(),
+    Column("ticket_type_id", Integer, primary_key=True),
+    Column("event_id", Integer),
+    Column("available_quantity", Integer),
+    Column("sold_quantity", Integer),
+)
+
 class Registration(Base):
     __tablename__ = "registrations"
+    __table_args__ = (
+        # Ключ keyset-пагинации билетов пользователя (submission_time DESC, id DESC)
+        Index('ix_registrations_user_submission_id', 'user_id', 'submission_time', 'id'),
+        # Подсчет регистраций мероприятия в списке админки
+        Index('ix_registrations_event_id', 'event_id'),
+        # Поиск просроченных броней при сверке
+        Index('ix_registrations_hold_expires_at', 'hold_expires_at', postgresql_where=text('hold_expires_at IS NOT NULL')),
+        # Не более одной активной регистрации (включая бронь) пользователя на мероприятие;
+        # на индекс опирается INSERT ... ON CONFLICT DO NOTHING при регистрации
+        Index(
+            'uq_registrations_user_event_active', 'user_id', 'event_id',
+            unique=True, postgresql_where=text("status <> 'cancelled'")
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -198,6 +283,8 @@ class Registration(Base):
     status = Column(Enum(Status), default=Status.pending.name)
     submission_time = Column(TIMESTAMP, default=datetime.utcnow)
     cancellation_count = Column(Integer, default=0, nullable=False)
+    # Срок временной брони (status=pending) до подтверждения оплаты; NULL - не бронь
+    hold_expires_at = Column(TIMESTAMP, nullable=True)
     
     user = relationship("User", back_populates="registrations")
     event = relationship("Event", back_populates="registrations")
@@ -207,8 +294,8 @@ class Media(Base):
     __tablename__ = "medias"
 
     id = Column(Integer, primary_key=True, index=True)
-    event_id = Column(Integer, ForeignKey("events.id"))
-    user_uploaded_by_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    event_id = Column(Integer, ForeignKey("events.id"), index=True)
+    user_uploaded_by_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)
     admin_uploaded_by_id = Column(Integer, ForeignKey("admins.id"), nullable=True)
     type = Column(Enum(MediaType), nullable=False)
     url = Column(String(255), nullable=False)
@@ -221,8 +308,37 @@ class Media(Base):
     user_uploaded_by = relationship("User", foreign_keys=[user_uploaded_by_id], back_populates="user_medias")
     admin_uploaded_by = relationship("Admin", foreign_keys=[admin_uploaded_by_id], back_populates="admin_medias")
 
+class MediaObject(Base):
+    """
+    Загруженный файл в контентно-адресуемом хранилище (backend/config/media_store.py).
+    id - sha256 содержимого; ref_count - число ссылок из Event.image_url, User.avatar_url и Media.url.
+    variants - манифест файлов объекта (версия -> имя файла): по нему файлы ищутся и удаляются без
+    сканирования каталога. Объекты без ссылок остаются строкой с ref_count = 0, их файлы удаляются после коммита.
+    """
+    __tablename__ = "media_objects"
+    __table_args__ = (
+        CheckConstraint('ref_count >= 0', name='ck_media_objects_ref_count'),
+    )
+
+    id = Column(String(64), primary_key=True)
+    extension = Column(String(10), nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0, server_default='0')
+    variants = Column(JSONB, nullable=False, default=dict, server_default=text("'{}'::jsonb"))
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Ключ keyset-пагинации списка пользователей в админке (created_at, id)
+        Index('ix_users_created_at_id', 'created_at', 'id'),
+        # Триграммные индексы для поиска пользователей в админке
+        Index('ix_users_fio_trgm', 'fio', postgresql_using='gin', postgresql_ops={'fio': 'gin_trgm_ops'}),
+        Index('ix_users_email_trgm', 'email', postgresql_using='gin', postgresql_ops={'email': 'gin_trgm_ops'}),
+        Index('ix_users_telegram_trgm', 'telegram', postgresql_using='gin', postgresql_ops={'telegram': 'gin_trgm_ops'}),
+        Index('ix_users_whatsapp_trgm', 'whatsapp', postgresql_using='gin', postgresql_ops={'whatsapp': 'gin_trgm_ops'}),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     fio = Column(String(255), nullable=False)
@@ -231,10 +347,14 @@ class User(Base):
     avatar_url = Column(String(255), nullable=True)
     telegram = Column(String(255), unique=True, nullable=False)
     whatsapp = Column(String(255), unique=True, nullable=False)
+    # Чат с ботом для рассылки (backend/config/telegram_link.py); по @username бот написать не может
+    telegram_chat_id = Column(BigInteger, unique=True, nullable=True)
     is_blocked = Column(Boolean, default=False)
     is_partner = Column(Boolean, default=False)
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
     updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Мягкое удаление: вход запрещен, связанные данные удаляет фоновая задача (DeletionJob)
+    deleted_at = Column(TIMESTAMP, nullable=True)
     
     params = relationship("UserParams", uselist=False, back_populates="user")
     registrations = relationship("Registration", back_populates="user")
@@ -246,7 +366,7 @@ class UserActivity(Base):
     __tablename__ = "user_activities"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     ip_address = Column(String(45), nullable=False)
     cookies = Column(Text, nullable=True)
     user_agent = Column(Text, nullable=True)
@@ -258,6 +378,7 @@ class UserActivity(Base):
     
     __table_args__ = (
         UniqueConstraint('user_id', 'ip_address', 'device_fingerprint', 'action', 'created_at', name='uq_user_activity'),
+        Index('ix_user_activities_fingerprint_created', 'device_fingerprint', 'created_at'),
     )
 
 class Admin(Base):
@@ -279,7 +400,7 @@ class NotificationTemplate(Base):
     id = Column(Integer, primary_key=True, index=True)
     message = Column(Text, nullable=False)
     type = Column(String(50), nullable=False)
-    event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False, index=True)
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
     is_public = Column(Boolean, default=False)
 
@@ -290,7 +411,7 @@ class NotificationView(Base):
     __tablename__ = "notification_views"
 
     id = Column(Integer, primary_key=True, index=True)
-    template_id = Column(Integer, ForeignKey("notification_templates.id"), nullable=False)
+    template_id = Column(Integer, ForeignKey("notification_templates.id"), nullable=False, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     fingerprint = Column(String(64), nullable=True)
     is_viewed = Column(Boolean, default=False)
@@ -300,6 +421,40 @@ class NotificationView(Base):
     template = relationship("NotificationTemplate", back_populates="views")
     user = relationship("User", back_populates="notification_views")
 
+    __table_args__ = (
+        # Индексы под пакетные отметки о просмотре (получатель + шаблон)
+        Index('ix_notification_views_user_template', 'user_id', 'template_id'),
+        Index('ix_notification_views_fingerprint_template', 'fingerprint', 'template_id'),
+        # Индекс для политики хранения просмотренных уведомлений
+        Index('ix_notification_views_viewed_at', 'viewed_at', postgresql_where=text('is_viewed')),
+    )
+
+class DeletionJob(Base):
+    """
+    Фоновое удаление мероприятия или пользователя (backend/config/deletion_jobs.py).
+    Зависимые строки удаляются пакетами по шагам; step и deleted_rows фиксируются в той же
+    транзакции, что и пакет, поэтому задача продолжается с места остановки после перезапуска.
+    """
+    __tablename__ = "deletion_jobs"
+    __table_args__ = (
+        UniqueConstraint('entity_type', 'entity_id', name='uq_deletion_jobs_entity'),
+        # Выборка незавершенных задач обработчиком
+        Index('ix_deletion_jobs_active', 'id', postgresql_where=text("status IN ('pending', 'running')")),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    entity_type = Column(String(20), nullable=False)  # "event" или "user"
+    entity_id = Column(Integer, nullable=False)
+    status = Column(String(20), nullable=False, default="pending", server_default="pending")  # pending/running/completed/failed
+    step = Column(String(50), nullable=True)  # текущий шаг; None - не начата
+    deleted_rows = Column(JSONB, nullable=False, default=dict, server_default=text("'{}'::jsonb"))  # шаг -> удалено строк
+    attempts = Column(Integer, nullable=False, default=0, server_default='0')  # число ошибок подряд
+    error = Column(Text, nullable=True)
+    requested_by_admin_id = Column(Integer, nullable=True)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
+    updated_at = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
+    completed_at = Column(TIMESTAMP, nullable=True)
+
 # Функция для инициализации базы данных
 async def init_db():
     try:
@@ -0,0 +1,176 @@
+# backend/dispatch/adapters.py
+import asyncio
+import os
+import random
+import re
+from typing import Dict, List, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from backend.config.logging_config import logger
+from backend.config.telegram_link import is_chat_id
+from constants import DISPATCH_CHANNEL_LIMITS
+
+# --- Загрузка конфигурации из .env ---
+# Предполагается, что load_dotenv() вызывается где-то при старте приложения
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+WHATSAPP_TOKEN = os.getenv("WHATSAPP_TOKEN")
+WHATSAPP_PHONE_NUMBER_ID = os.getenv("WHATSAPP_PHONE_NUMBER_ID")
+# "live" - реальные API мессенджеров, "fake" - локальный адаптер без сети (только для разработки)
+DISPATCH_ADAPTER_MODE = os.getenv("DISPATCH_ADAPTER_MODE", "live").lower()
+DISPATCH_HTTP_TIMEOUT = float(os.getenv("DISPATCH_HTTP_TIMEOUT", "10"))
+# --- Конец загрузки конфигурации ---
+
+
+class OutboundMessage(BaseModel):
+    """Одно исходящее сообщение в конкретный канал."""
+    channel: str
+    recipient: str
+    text: str
+    template_id: int
+    user_id: Optional[int] = None
+    attempt: int = 0
+    job_key: Optional[int] = None  # задача очереди, которая подтверждается после обработки всех ее сообщений
+
+
+class DeliveryResult(BaseModel):
+    ok: bool
+    retryable: bool = False
+    error: Optional[str] = None
+
+
+class ChannelAdapter:
+    """
+    Базовый адаптер канала доставки.
+    Адаптер получает пачку сообщений и возвращает результат по каждому (в том же порядке).
+    """
+
+    name: str = ""
+
+    def __init__(self, rate_per_second: float, burst: int, batch_size: int):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.batch_size = batch_size
+
+    async def send_batch(self, messages: List[OutboundMessage]) -> List[DeliveryResult]:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class HttpChannelAdapter(ChannelAdapter):
+    """Адаптер поверх HTTP API: сообщения пачки отправляются конкурентно через один клиент."""
+
+    def __init__(self, rate_per_second: float, burst: int, batch_size: int):
+        super().__init__(rate_per_second, burst, batch_size)
+        self._client = httpx.AsyncClient(timeout=DISPATCH_HTTP_TIMEOUT)
+
+    async def send_one(self, message: OutboundMessage) -> DeliveryResult:
+        raise NotImplementedError
+
+    async def send_batch(self, messages: List[OutboundMessage]) -> List[DeliveryResult]:
+        results = await asyncio.gather(*(self.send_one(m) for m in messages), return_exceptions=True)
+        return [
+            r if isinstance(r, DeliveryResult) else DeliveryResult(ok=False, retryable=True, error=str(r))
+            for r in results
+        ]
+
+    @staticmethod
+    def _result_from_response(response: httpx.Response) -> DeliveryResult:
+        if response.status_code < 300:
+            return DeliveryResult(ok=True)
+        # 429 и 5xx - временные ошибки, остальные 4xx повторять бессмысленно
+        retryable = response.status_code == 429 or response.status_code >= 500
+        return DeliveryResult(ok=False, retryable=retryable, error=f"HTTP {response.status_code}: {response.text[:200]}")
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+class TelegramAdapter(HttpChannelAdapter):
+    name = "telegram"
+
+    def __init__(self, token: str, **limits):
+        super().__init__(**limits)
+        self._url = f"https://api.telegram.org/bot{token}/sendMessage"
+
+    async def send_one(self, message: OutboundMessage) -> DeliveryResult:
+        # Личный чат по @username бот начать не может - только по chat_id из привязки (telegram_link)
+        if not is_chat_id(message.recipient):
+            return DeliveryResult(ok=False, retryable=False, error="Telegram chat is not linked")
+        response = await self._client.post(self._url, json={"chat_id": int(message.recipient), "text": message.text})
+        return self._result_from_response(response)
+
+
+class WhatsAppAdapter(HttpChannelAdapter):
+    name = "whatsapp"
+
+    def __init__(self, token: str, phone_number_id: str, **limits):
+        super().__init__(**limits)
+        self._url = f"https://graph.facebook.com/v19.0/{phone_number_id}/messages"
+        self._headers = {"Authorization": f"Bearer {token}"}
+
+    async def send_one(self, message: OutboundMessage) -> DeliveryResult:
+        phone = re.sub(r"\D", "", message.recipient)
+        if not phone:
+            return DeliveryResult(ok=False, retryable=False, error="Invalid phone number")
+        payload = {
+            "messaging_product": "whatsapp",
+            "to": phone,
+            "type": "text",
+            "text": {"body": message.text},
+        }
+        response = await self._client.post(self._url, json=payload, headers=self._headers)
+        return self._result_from_response(response)
+
+
+class FakeChannelAdapter(ChannelAdapter):
+    """
+    Локальный адаптер для разработки и тестов: ничего не отправляет по сети,
+    запоминает доставленные сообщения и умеет имитировать задержку и сбои.
+    """
+
+    def __init__(self, name: str, latency: float = 0.0, failure_rate: float = 0.0,
+                 permanent_failures: Optional[set] = None, **limits):
+        super().__init__(**limits)
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.permanent_failures = permanent_failures or set()
+        self.sent: List[OutboundMessage] = []
+        self.batches: List[int] = []
+
+    async def send_batch(self, messages: List[OutboundMessage]) -> List[DeliveryResult]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.batches.append(len(messages))
+        results = []
+        for message in messages:
+            if message.recipient in self.permanent_failures:
+                results.append(DeliveryResult(ok=False, retryable=False, error="Recipient rejected"))
+            elif self.failure_rate and random.random() < self.failure_rate:
+                results.append(DeliveryResult(ok=False, retryable=True, error="Simulated transient failure"))
+            else:
+                self.sent.append(message)
+                results.append(DeliveryResult(ok=True))
+        return results
+
+
+def build_adapters(channels: List[str], mode: str = DISPATCH_ADAPTER_MODE) -> Dict[str, ChannelAdapter]:
+    """Создает адаптеры для перечисленных каналов согласно конфигурации."""
+    adapters: Dict[str, ChannelAdapter] = {}
+    if mode == "fake":
+        logger.warning("DISPATCH_ADAPTER_MODE=fake: messenger messages are not sent anywhere")
+    for channel in channels:
+        limits = DISPATCH_CHANNEL_LIMITS.get(channel, {"rate_per_second": 10, "burst": 10, "batch_size": 10})
+        if mode == "fake":
+            adapters[channel] = FakeChannelAdapter(channel, **limits)
+        elif channel == "telegram" and TELEGRAM_BOT_TOKEN:
+            adapters[channel] = TelegramAdapter(TELEGRAM_BOT_TOKEN, **limits)
+        elif channel == "whatsapp" and WHATSAPP_TOKEN and WHATSAPP_PHONE_NUMBER_ID:
+            adapters[channel] = WhatsAppAdapter(WHATSAPP_TOKEN, WHATSAPP_PHONE_NUMBER_ID, **limits)
+        else:
+            logger.warning(f"Dispatch channel '{channel}' is not configured, skipping")
+    return adapters
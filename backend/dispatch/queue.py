@@ -0,0 +1,138 @@
+# backend/dispatch/queue.py
+import asyncio
+import json
+import os
+import socket
+from datetime import datetime
+from typing import List, Optional
+
+from backend.config.logging_config import logger
+from backend.config.redis_client import get_redis
+
+# --- Загрузка конфигурации из .env ---
+# "redis" - общая очередь для API-серверов и воркеров, "memory" - очередь внутри процесса
+DISPATCH_QUEUE_BACKEND = os.getenv("DISPATCH_QUEUE_BACKEND", "memory").lower()
+# Имя воркера для его списка задач в работе; должно сохраняться между перезапусками процесса
+DISPATCH_WORKER_ID = os.getenv("DISPATCH_WORKER_ID") or socket.gethostname()
+# --- Конец загрузки конфигурации ---
+
+JOBS_KEY = "dispatch:jobs"
+PROCESSING_KEY = f"dispatch:processing:{DISPATCH_WORKER_ID}"
+DEAD_LETTER_KEY = "dispatch:dead"
+
+
+class InMemoryDispatchQueue:
+    """
+    Очередь задач рассылки внутри процесса (локальная разработка и тесты).
+    Разобрать ее может только пул этого же процесса, поэтому без подключенного пула
+    задачи не принимаются - иначе они копились бы в памяти и не отправлялись.
+    """
+
+    def __init__(self):
+        self._jobs: asyncio.Queue = asyncio.Queue()
+        self.dead_letters: List[dict] = []
+        self._consumers = 0
+        self._warned = False
+
+    def register_consumer(self) -> None:
+        self._consumers += 1
+
+    def unregister_consumer(self) -> None:
+        self._consumers -= 1
+
+    async def enqueue(self, job: dict) -> bool:
+        if not self._consumers:
+            if not self._warned:
+                logger.warning(
+                    "Dispatch queue is in-process (DISPATCH_QUEUE_BACKEND=memory) and no dispatch pool runs "
+                    "in this process: messenger dispatch is skipped. Use DISPATCH_QUEUE_BACKEND=redis with "
+                    "the dispatch worker or enable DISPATCH_EMBEDDED_WORKER"
+                )
+                self._warned = True
+            return False
+        await self._jobs.put(job)
+        return True
+
+    async def dequeue(self, timeout: float = 1.0) -> Optional[dict]:
+        try:
+            return await asyncio.wait_for(self._jobs.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, job: dict) -> None:
+        pass
+
+    async def requeue_unacked(self) -> int:
+        return 0
+
+    async def dead_letter(self, payload: dict, error: str) -> None:
+        self.dead_letters.append({**payload, "error": error, "failed_at": datetime.utcnow().isoformat()})
+
+
+class RedisDispatchQueue:
+    """
+    Очередь задач рассылки в Redis: список задач и список "мертвых" сообщений.
+
+    Доставка "хотя бы один раз": задача атомарно переносится (BLMOVE) в список задач
+    в работе этого воркера и удаляется оттуда только после ack - когда все ее сообщения
+    отправлены или ушли в dead-letter. Задачи, не подтвержденные до остановки или падения,
+    возвращаются в очередь (requeue_unacked) и разворачиваются заново; получатели,
+    которым сообщение уже ушло, могут получить его повторно.
+    """
+
+    def register_consumer(self) -> None:
+        # Задачи разбирают воркеры в любых процессах
+        pass
+
+    def unregister_consumer(self) -> None:
+        pass
+
+    async def enqueue(self, job: dict) -> bool:
+        await get_redis().lpush(JOBS_KEY, json.dumps(job))
+        return True
+
+    async def dequeue(self, timeout: float = 1.0) -> Optional[dict]:
+        # LPUSH + забор справа - FIFO, как раньше с BRPOP
+        item = await get_redis().blmove(JOBS_KEY, PROCESSING_KEY, max(int(timeout), 1), src="RIGHT", dest="LEFT")
+        if item is None:
+            return None
+        return json.loads(item)
+
+    async def ack(self, job: dict) -> None:
+        # Задача сериализуется так же, как в enqueue, поэтому совпадает с элементом списка
+        await get_redis().lrem(PROCESSING_KEY, 1, json.dumps(job))
+
+    async def requeue_unacked(self) -> int:
+        """Возвращает задачи в работе этого воркера в начало очереди (будут взяты первыми)."""
+        moved = 0
+        while await get_redis().lmove(PROCESSING_KEY, JOBS_KEY, src="RIGHT", dest="RIGHT") is not None:
+            moved += 1
+        if moved:
+            logger.warning(f"Requeued {moved} unacknowledged dispatch jobs from {PROCESSING_KEY}")
+        return moved
+
+    async def dead_letter(self, payload: dict, error: str) -> None:
+        record = {**payload, "error": error, "failed_at": datetime.utcnow().isoformat()}
+        await get_redis().lpush(DEAD_LETTER_KEY, json.dumps(record))
+
+
+_queue = None
+
+
+def get_dispatch_queue():
+    global _queue
+    if _queue is None:
+        _queue = RedisDispatchQueue() if DISPATCH_QUEUE_BACKEND == "redis" else InMemoryDispatchQueue()
+    return _queue
+
+
+async def enqueue_template_dispatch(template_id: int) -> None:
+    """
+    Ставит шаблон уведомления в очередь на рассылку по мессенджерам.
+    Ошибки очереди не должны ломать основной запрос, поэтому только логируем их.
+    """
+    try:
+        if await get_dispatch_queue().enqueue({"kind": "template", "template_id": template_id}):
+            logger.info(f"Notification template {template_id} queued for messenger dispatch")
+    except Exception as e:
+        logger.error(f"Failed to queue template {template_id} for dispatch: {str(e)}")
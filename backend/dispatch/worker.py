@@ -0,0 +1,341 @@
+# backend/dispatch/worker.py
+# Запуск отдельным процессом: python -m backend.dispatch.worker
+import os
+from dotenv import load_dotenv, find_dotenv
+load_dotenv(find_dotenv())
+
+import asyncio
+import itertools
+import random
+import signal
+import sys
+import time
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import select
+
+from backend.config.logging_config import logger
+from backend.database.user_db import AsyncSessionLocal, NotificationTemplate, User
+from backend.dispatch.adapters import ChannelAdapter, DeliveryResult, OutboundMessage, build_adapters
+from backend.dispatch.queue import DISPATCH_QUEUE_BACKEND, get_dispatch_queue
+
+# --- Загрузка конфигурации из .env ---
+DISPATCH_CHANNELS = [c.strip() for c in os.getenv("DISPATCH_CHANNELS", "telegram,whatsapp").split(",") if c.strip()]
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "4"))        # отправителей на канал
+DISPATCH_MAX_ATTEMPTS = int(os.getenv("DISPATCH_MAX_ATTEMPTS", "5"))
+DISPATCH_RETRY_BASE_SECONDS = float(os.getenv("DISPATCH_RETRY_BASE_SECONDS", "1"))
+DISPATCH_BATCH_WINDOW_MS = int(os.getenv("DISPATCH_BATCH_WINDOW_MS", "50"))
+DISPATCH_RECIPIENT_PAGE_SIZE = int(os.getenv("DISPATCH_RECIPIENT_PAGE_SIZE", "1000"))
+DISPATCH_CHANNEL_QUEUE_SIZE = int(os.getenv("DISPATCH_CHANNEL_QUEUE_SIZE", "5000"))
+# Запускать пул внутри API-сервера. Очередь "memory" разбирается только в своем процессе,
+# поэтому для нее пул по умолчанию встроенный; с "redis" задачи разбирает отдельный воркер
+DISPATCH_EMBEDDED_WORKER = os.getenv(
+    "DISPATCH_EMBEDDED_WORKER", "True" if DISPATCH_QUEUE_BACKEND == "memory" else "False"
+).lower() in ("true", "1", "yes")
+# --- Конец загрузки конфигурации ---
+
+
+class TokenBucket:
+    """Асинхронный token bucket для соблюдения лимита канала."""
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: int = 1) -> None:
+        async with self._lock:
+            remaining = amount
+            while remaining > 0:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                take = min(remaining, int(self.tokens))
+                if take > 0:
+                    self.tokens -= take
+                    remaining -= take
+                    continue
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class DispatchWorkerPool:
+    """
+    Пул асинхронных воркеров рассылки.
+
+    Задачи-шаблоны берутся из общей очереди и разворачиваются в сообщения по каналам.
+    На каждый канал работает DISPATCH_CONCURRENCY отправителей, которые собирают
+    сообщения в пачки, соблюдают лимит канала, повторяют временные ошибки с
+    экспоненциальной задержкой и отправляют в dead-letter то, что доставить не удалось.
+    """
+
+    def __init__(self, adapters: Dict[str, ChannelAdapter], queue=None,
+                 concurrency: int = DISPATCH_CONCURRENCY, max_attempts: int = DISPATCH_MAX_ATTEMPTS,
+                 retry_base: float = DISPATCH_RETRY_BASE_SECONDS, batch_window_ms: int = DISPATCH_BATCH_WINDOW_MS):
+        self.adapters = adapters
+        self.queue = queue or get_dispatch_queue()
+        self.concurrency = max(concurrency, 1)
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.batch_window = batch_window_ms / 1000
+        self.buckets = {name: TokenBucket(a.rate_per_second, a.burst) for name, a in adapters.items()}
+        self.channel_queues: Dict[str, asyncio.Queue] = {
+            name: asyncio.Queue(maxsize=DISPATCH_CHANNEL_QUEUE_SIZE) for name in adapters
+        }
+        self.stats = {"sent": 0, "retried": 0, "dead": 0, "templates": 0, "unlinked": 0}
+        self._tasks: List[asyncio.Task] = []
+        self._retry_tasks: Set[asyncio.Task] = set()
+        # Задачи очереди, ожидающие подтверждения: ключ -> задача, число необработанных
+        # сообщений и признак того, что задача развернута полностью
+        self._job_keys = itertools.count(1)
+        self._open_jobs: Dict[int, dict] = {}
+
+    async def start(self) -> None:
+        # Задачи, не подтвержденные прошлым запуском этого воркера, обрабатываются заново
+        await self.queue.requeue_unacked()
+        self.queue.register_consumer()
+        for channel in self.adapters:
+            for _ in range(self.concurrency):
+                self._tasks.append(asyncio.create_task(self._sender(channel)))
+        self._tasks.append(asyncio.create_task(self._consume_jobs()))
+        logger.info(f"Dispatch worker pool started: channels={list(self.adapters)}, concurrency={self.concurrency}")
+
+    async def stop(self) -> None:
+        self.queue.unregister_consumer()
+        for task in [*self._tasks, *self._retry_tasks]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retry_tasks, return_exceptions=True)
+        self._tasks.clear()
+        self._retry_tasks.clear()
+        for adapter in self.adapters.values():
+            await adapter.close()
+        # Недоставленные сообщения пропадают вместе с очередями каналов, поэтому их задачи
+        # возвращаются в общую очередь - их подхватит другой воркер или следующий запуск
+        self._open_jobs.clear()
+        try:
+            await self.queue.requeue_unacked()
+        except Exception as e:
+            logger.error(f"Failed to requeue unacknowledged dispatch jobs: {str(e)}")
+        logger.info(f"Dispatch worker pool stopped: {self.stats}")
+
+    async def join(self) -> None:
+        """Ждет, пока все поставленные сообщения (включая повторы) будут обработаны."""
+        while True:
+            for q in self.channel_queues.values():
+                await q.join()
+            if not self._retry_tasks:
+                return
+            await asyncio.gather(*list(self._retry_tasks), return_exceptions=True)
+
+    async def _consume_jobs(self) -> None:
+        while True:
+            try:
+                job = await self.queue.dequeue(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to read dispatch queue: {str(e)}")
+                await asyncio.sleep(self.retry_base)
+                continue
+            if job is None:
+                continue
+            job_key = next(self._job_keys)
+            self._open_jobs[job_key] = {"job": job, "remaining": 0, "expanded": False}
+            try:
+                if job.get("kind") == "template":
+                    await self.dispatch_template(job["template_id"], job_key)
+                else:
+                    logger.warning(f"Unknown dispatch job: {job}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing dispatch job {job}: {str(e)}", exc_info=True)
+                try:
+                    await self.queue.dead_letter(job, str(e))
+                except Exception as dead_letter_error:
+                    logger.error(f"Failed to dead-letter dispatch job {job}: {str(dead_letter_error)}")
+            self._open_jobs[job_key]["expanded"] = True
+            try:
+                await self._ack_if_done(job_key)
+            except Exception as e:
+                # Неподтвержденная задача вернется в очередь при перезапуске воркера
+                logger.error(f"Failed to acknowledge dispatch job {job}: {str(e)}")
+
+    async def _ack_if_done(self, job_key: Optional[int]) -> None:
+        state = self._open_jobs.get(job_key)
+        if state is not None and state["expanded"] and state["remaining"] == 0:
+            del self._open_jobs[job_key]
+            await self.queue.ack(state["job"])
+
+    async def _message_done(self, message: OutboundMessage) -> None:
+        state = self._open_jobs.get(message.job_key)
+        if state is not None:
+            state["remaining"] -= 1
+            await self._ack_if_done(message.job_key)
+
+    async def dispatch_template(self, template_id: int, job_key: Optional[int] = None) -> int:
+        """Разворачивает шаблон в сообщения для всех получателей. Возвращает число поставленных сообщений."""
+        async with AsyncSessionLocal() as session:
+            template = await session.get(NotificationTemplate, template_id)
+            if template is None:
+                logger.warning(f"Notification template {template_id} not found, skipping dispatch")
+                return 0
+            text = template.message
+
+        queued = 0
+        unlinked = 0
+        last_id = 0
+        while True:
+            # Keyset-пагинация по пользователям; сессия открыта только на время чтения страницы,
+            # чтобы ожидание места в очереди канала не держало соединение с БД
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(User.id, User.telegram_chat_id, User.whatsapp)
+                    .where(User.id > last_id)
+                    .where(User.is_blocked.isnot(True))
+                    .order_by(User.id)
+                    .limit(DISPATCH_RECIPIENT_PAGE_SIZE)
+                )
+                rows = result.all()
+            if not rows:
+                break
+            for user_id, telegram_chat_id, whatsapp in rows:
+                # Telegram - только привязанный чат: по @username из профиля бот написать не может
+                handles = {"telegram": str(telegram_chat_id) if telegram_chat_id is not None else "", "whatsapp": whatsapp}
+                for channel, q in self.channel_queues.items():
+                    recipient = (handles.get(channel) or "").strip()
+                    if not recipient:
+                        if channel == "telegram":
+                            unlinked += 1
+                        continue
+                    if job_key in self._open_jobs:
+                        self._open_jobs[job_key]["remaining"] += 1
+                    await q.put(OutboundMessage(
+                        channel=channel, recipient=recipient, text=text,
+                        template_id=template_id, user_id=user_id, job_key=job_key,
+                    ))
+                    queued += 1
+            last_id = rows[-1][0]
+
+        self.stats["templates"] += 1
+        self.stats["unlinked"] += unlinked
+        logger.info(
+            f"Template {template_id} expanded into {queued} messenger messages"
+            f" ({unlinked} users skipped in telegram: chat not linked)"
+        )
+        return queued
+
+    async def _collect_batch(self, q: asyncio.Queue, batch_size: int) -> List[OutboundMessage]:
+        batch = [await q.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while len(batch) < batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(q.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _sender(self, channel: str) -> None:
+        adapter = self.adapters[channel]
+        q = self.channel_queues[channel]
+        bucket = self.buckets[channel]
+        while True:
+            batch = await self._collect_batch(q, adapter.batch_size)
+            try:
+                await bucket.acquire(len(batch))
+                try:
+                    results = await adapter.send_batch(batch)
+                except Exception as e:
+                    logger.error(f"Channel {channel} failed to send batch of {len(batch)}: {str(e)}")
+                    results = [DeliveryResult(ok=False, retryable=True, error=str(e))] * len(batch)
+                for message, result in zip(batch, results):
+                    try:
+                        await self._handle_result(message, result)
+                    except Exception as e:
+                        # Например, Redis недоступен для dead-letter или ack. Задача сообщения
+                        # остается неподтвержденной и вернется в очередь при перезапуске воркера
+                        logger.error(f"Channel {channel} failed to handle result for {message.recipient}: {str(e)}", exc_info=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Отправитель канала не должен завершаться: иначе пул принимает сообщения, которые некому отправить
+                logger.error(f"Channel {channel} sender error on batch of {len(batch)}: {str(e)}", exc_info=True)
+            finally:
+                for _ in batch:
+                    q.task_done()
+
+    async def _handle_result(self, message: OutboundMessage, result: DeliveryResult) -> None:
+        if result.ok:
+            self.stats["sent"] += 1
+            await self._message_done(message)
+            return
+        attempt = message.attempt + 1
+        if result.retryable and attempt < self.max_attempts:
+            self.stats["retried"] += 1
+            delay = self.retry_base * (2 ** message.attempt) * (1 + random.random() * 0.2)
+            retry = message.model_copy(update={"attempt": attempt})
+            task = asyncio.create_task(self._requeue_later(retry, delay))
+            self._retry_tasks.add(task)
+            task.add_done_callback(self._retry_tasks.discard)
+        else:
+            self.stats["dead"] += 1
+            logger.warning(f"Dead-lettering {message.channel} message to {message.recipient}: {result.error}")
+            await self.queue.dead_letter(message.model_dump(), result.error or "unknown error")
+            await self._message_done(message)
+
+    async def _requeue_later(self, message: OutboundMessage, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.channel_queues[message.channel].put(message)
+
+
+_embedded_pool: Optional[DispatchWorkerPool] = None
+
+
+async def start_embedded_dispatcher() -> None:
+    """Запускает пул рассылки внутри процесса сервера, если это разрешено конфигурацией."""
+    global _embedded_pool
+    if not DISPATCH_EMBEDDED_WORKER or _embedded_pool is not None:
+        return
+    adapters = build_adapters(DISPATCH_CHANNELS)
+    if adapters:
+        _embedded_pool = DispatchWorkerPool(adapters)
+        await _embedded_pool.start()
+
+
+async def stop_embedded_dispatcher() -> None:
+    global _embedded_pool
+    if _embedded_pool is not None:
+        await _embedded_pool.stop()
+        _embedded_pool = None
+
+
+async def main() -> None:
+    adapters = build_adapters(DISPATCH_CHANNELS)
+    if not adapters:
+        logger.error("No dispatch channels configured, worker is exiting")
+        return
+    pool = DispatchWorkerPool(adapters)
+    await pool.start()
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # add_signal_handler недоступен на Windows
+            pass
+    try:
+        await stop_event.wait()
+    finally:
+        await pool.stop()
+
+
+if __name__ == "__main__":
+    if sys.platform.startswith("win"):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
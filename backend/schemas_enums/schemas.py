@@ -1,7 +1,7 @@
 # backend/schemas_enums.schemas.py
 from datetime import datetime
-from typing import Optional, List, ForwardRef, Union, TypeVar, Generic
-from pydantic import BaseModel, EmailStr, validator, root_validator
+from typing import Optional, List, Dict, ForwardRef, Union, TypeVar, Generic
+from pydantic import BaseModel, EmailStr, Field, validator, root_validator
 from backend.schemas_enums.enums import EventStatus, TicketTypeEnum, Status
 
 #------------------------
@@ -96,6 +96,17 @@ class TicketTypeCreate(BaseModel):
     class Config:
         from_attributes = True
 
+class InventoryShardsUpdate(BaseModel):
+    shard_count: int = Field(..., ge=0, description="Число строк-счетчиков остатка (0 - без шардирования)")
+
+class TicketInventoryResponse(BaseModel):
+    ticket_type_id: int
+    event_id: int
+    shard_count: int
+    available_quantity: int
+    sold_quantity: int
+    remaining_quantity: int
+
 class EventCreate(BaseModel):
     id: Optional[int] = None
     title: str
@@ -111,6 +122,8 @@ class EventCreate(BaseModel):
     status: Optional[EventStatus] = EventStatus.draft
     url_slug: Optional[str] = None
     ticket_type: Optional[TicketTypeCreate] = None
+    registrations_count: Optional[int] = None  # заполняется только в списке админки
+    variants_ready: Optional[bool] = None  # False - оптимизированные версии изображения еще строятся
 
     class Config:
         from_attributes = True
@@ -181,8 +194,96 @@ class CancelRegistrationRequest(BaseModel):
     
 
 class RegistrationResponse(BaseModel):
-    message: str
+    message: Optional[str] = None
+    id: Optional[int] = None
+    event_id: Optional[int] = None
+    user_id: Optional[int] = None
+    ticket_type: Optional[str] = None
+    status: Optional[str] = None
+    ticket_number: Optional[str] = None
         
+class TicketHoldRequest(BaseModel):
+    event_id: int
+
+class TicketHoldResponse(BaseModel):
+    id: int
+    event_id: int
+    ticket_type: Optional[str] = None
+    ticket_number: str
+    amount: Optional[float] = None
+    status: str
+    expires_at: Optional[datetime] = None  # None - бронь уже подтверждена (бесплатный билет)
+
+class QueueJoinRequest(BaseModel):
+    event_id: int
+
+class QueueStatusResponse(BaseModel):
+    event_id: int
+    position: int
+    ahead: int
+    admitted: bool
+    queue_token: Optional[str] = None
+    admission_token: Optional[str] = None  # передается в заголовке X-Queue-Token при регистрации
+    retry_after: int = 1
+
+#------------------------
+# Uploads
+#------------------------
+
+class UploadIntentRequest(BaseModel):
+    target: str = Field(..., pattern="^(event_image|event_photo|event_video)$")
+    event_id: int
+    content_type: str
+    size: int = Field(..., gt=0, description="Размер файла в байтах")
+    sha256: str = Field(..., pattern="^[0-9a-f]{64}$", description="sha256 содержимого (hex)")
+
+class UploadIntentResponse(BaseModel):
+    token: str
+    upload_url: Optional[str] = None  # None - файл уже есть в хранилище, сразу вызывается /uploads/complete
+    method: str = "PUT"
+    headers: Dict[str, str] = {}      # заголовки, которые клиент обязан передать при загрузке
+    expires_at: datetime
+
+class UploadCompleteRequest(BaseModel):
+    token: str
+    caption: Optional[str] = Field(None, max_length=500)
+
+class UploadCompleteResponse(BaseModel):
+    url: str
+    media_id: str
+    event_id: int
+    record_id: Optional[int] = None   # id записи Media для фото и видео мероприятия
+    variants_pending: bool = False
+
+#------------------------
+# Deletion jobs
+#------------------------
+
+class DeletionJobResponse(BaseModel):
+    id: int
+    entity_type: str
+    entity_id: int
+    status: str
+    step: Optional[str] = None
+    deleted_rows: Dict[str, int] = {}
+    attempts: int = 0
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+#------------------------
+# Telegram
+#------------------------
+
+class TelegramLinkResponse(BaseModel):
+    url: str          # https://t.me/<бот>?start=<токен>: пользователь открывает ссылку и нажимает "Start"
+    expires_in: int
+    linked: bool      # чат уже привязан (рассылка в Telegram включена)
+
 #------------------------
 # Notifications
 #------------------------
@@ -239,6 +340,7 @@ class PaginatedResponse(BaseModel, Generic[ItemType]):
     total: int
     skip: int
     limit: int
+    next_cursor: Optional[str] = None  # курсор следующей страницы (keyset-пагинация)
 
     class Config:
         from_attributes = True # Важно для совместимости с ORM, если используется
\ No newline at end of file
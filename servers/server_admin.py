@@ -27,6 +27,7 @@ load_dotenv()
 import os # Добавляю os
 from datetime import timedelta
 from fastapi import FastAPI, Request
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from backend.api.admin_auth_routers import router as admin_auth_router
 from backend.api.admin_edit_routers import router as admin_edit_routers 
@@ -40,10 +41,17 @@ from datetime import datetime, timedelta  # Добавлен импорт для
 from authlib.jose import jwt  # Добавлен импорт для jwt
 # Удаляю импорты из constants (обратите внимание на дублирующий импорт ACCESS_TOKEN_EXPIRE_MINUTES)
 # from constants import ACCESS_TOKEN_EXPIRE_MINUTES, SECRET_KEY  
-from fastapi.staticfiles import StaticFiles
+from backend.config.media_store import mount_media
+from backend.config.storage import storage
 from fastapi.routing import APIRoute
 
 from backend.database.user_db import AsyncSessionLocal, get_async_db
+from backend.dispatch.worker import start_embedded_dispatcher, stop_embedded_dispatcher
+from backend.config.image_pipeline import image_pipeline
+from backend.database.media_gc import media_gc_scheduler
+from backend.config.deletion_jobs import deletion_worker
+from backend.api.image_routers import router as image_router
+from backend.api.upload_routers import router as upload_router
 # from constants import ACCESS_TOKEN_EXPIRE_MINUTES  # Удаляю дублирующий импорт
 
 # --- Загрузка конфигурации из .env --- 
@@ -65,7 +73,9 @@ except ValueError:
 app = FastAPI(
     title="Event Management API",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # Тела ответов кодирует orjson (см. backend/config/serialization.py)
+    default_response_class=ORJSONResponse
 )
 
 # Настройка CORS
@@ -113,6 +123,28 @@ async def refresh_token_middleware(request: Request, call_next):
     
     return response
 
+@app.on_event("startup")
+async def start_background_tasks():
+    # Встроенный пул рассылки (только если DISPATCH_EMBEDDED_WORKER=true)
+    await start_embedded_dispatcher()
+    # Досоздаем версии изображений, обработка которых прервалась перезапуском
+    try:
+        await image_pipeline.resume_pending()
+    except Exception as e:
+        logger.error(f"Failed to resume image processing: {str(e)}")
+    # Периодическая сборка осиротевших медиафайлов (MEDIA_GC_INTERVAL_MINUTES)
+    media_gc_scheduler.start()
+    # Фоновое удаление мероприятий и пользователей; прерванные задачи продолжаются с сохраненного шага
+    deletion_worker.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await stop_embedded_dispatcher()
+    await image_pipeline.stop()
+    await media_gc_scheduler.stop()
+    await deletion_worker.stop()
+    await storage.close()
+
 # Настройка rate limiting
 app.state.limiter = limiter
 app.state.limiter.key_func = get_user_or_ip_key
@@ -121,9 +153,12 @@ app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 # Подключение роутеров
 app.include_router(admin_auth_router, prefix="/admin", tags=["Admin Authentication"])
 app.include_router(admin_edit_routers, prefix="/admin_edits", tags=["Admin Edits"])
+app.include_router(image_router, tags=["Images"])
+# Загрузка файлов напрямую в хранилище по подписанным URL
+app.include_router(upload_router, prefix="/uploads", tags=["Uploads"])
 
-# Монтируем директорию private_media как статические файлы
-app.mount("/images", StaticFiles(directory="private_media"), name="images")
+# Раздача хранилища медиафайлов: каталог private_media или S3 (MEDIA_STORAGE_BACKEND)
+mount_media(app)
 
 if __name__ == "__main__":
     uvicorn.run(
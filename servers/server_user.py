@@ -23,8 +23,10 @@ if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from backend.config.media_store import mount_media
+from backend.config.storage import storage
 from backend.api.user_auth_routers import router as user_auth_router
 from backend.api.event_routers import router as event_router
 from backend.api.user_edit_routers import router as user_edit_routers
@@ -40,6 +42,13 @@ from datetime import datetime, timedelta
 from authlib.jose import jwt
 from backend.database.user_db import AsyncSessionLocal
 from backend.api.user_tickets_router import router as user_tickets_router
+from backend.api.image_routers import router as image_router
+from backend.api.telegram_routers import router as telegram_router
+from backend.config.notification_buffer import notification_view_buffer
+from backend.database.compact_notifications import notification_compaction_scheduler
+from backend.dispatch.worker import start_embedded_dispatcher, stop_embedded_dispatcher
+from backend.config.ticket_holds import ticket_hold_sweeper
+from backend.config.inventory import inventory_rollup_scheduler
 from sqlalchemy import text
 
 # --- Загрузка конфигурации из .env --- 
@@ -61,7 +70,9 @@ except ValueError:
 app = FastAPI(
     title="User Authentication API",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    # Тела ответов кодирует orjson (см. backend/config/serialization.py)
+    default_response_class=ORJSONResponse
 )
 
 app.add_middleware(
@@ -70,13 +81,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
 )
 
 app.state.limiter = limiter
 app.state.limiter.key_func = get_user_or_ip_key
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
-app.mount("/images", StaticFiles(directory="private_media"), name="images")
+# Версии изображений по ширине/формату; объявлены до монтирования статики, иначе /images перехватит запрос
+app.include_router(image_router, tags=["Images"])
+mount_media(app)
 
 app.include_router(user_edit_routers, prefix="/user_edits", tags=["User Edits"])
 app.include_router(user_auth_router, prefix="/auth", tags=["Authentication"])
@@ -84,6 +98,29 @@ app.include_router(event_router, prefix="/v1/public/events", tags=["Events"])
 app.include_router(guests_registration_routers, prefix="/registration", tags=["Registration"])
 app.include_router(notification_router, prefix="", tags=["Notifications"])  # Подключаем новый роутер
 app.include_router(user_tickets_router, prefix="/user_edits", tags=["User Tickets"])
+app.include_router(telegram_router, prefix="/telegram", tags=["Telegram"])
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Фоновый сброс отметок о просмотре уведомлений
+    notification_view_buffer.start()
+    # Периодическая очистка старых записей notification_views
+    notification_compaction_scheduler.start()
+    # Снятие истекших броней билетов
+    ticket_hold_sweeper.start()
+    # Сведение шардированных счетчиков остатка в ticket_types.sold_quantity
+    inventory_rollup_scheduler.start()
+    # Встроенный пул рассылки (только если DISPATCH_EMBEDDED_WORKER=true)
+    await start_embedded_dispatcher()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await stop_embedded_dispatcher()
+    await inventory_rollup_scheduler.stop()
+    await ticket_hold_sweeper.stop()
+    await notification_compaction_scheduler.stop()
+    await notification_view_buffer.stop()
+    await storage.close()
 
 @app.middleware("http")
 async def refresh_token_middleware(request: Request, call_next):
@@ -0,0 +1,14 @@
+# tests/conftest.py
+import os
+import sys
+
+# Модули конфигурации читают окружение при импорте; БД и Redis в тестах не используются
+os.environ.setdefault("DB_USER", "test")
+os.environ.setdefault("DB_PASSWORD", "test")
+os.environ.setdefault("DB_NAME", "test")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("RESPONSE_CACHE_BACKEND", "memory")
+
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
@@ -0,0 +1,45 @@
+# tests/test_dispatch_worker.py
+import asyncio
+
+from backend.dispatch.adapters import FakeChannelAdapter, OutboundMessage
+from backend.dispatch.queue import InMemoryDispatchQueue
+from backend.dispatch.worker import DispatchWorkerPool
+
+
+class FailingDeadLetterQueue(InMemoryDispatchQueue):
+    async def dead_letter(self, payload, error):
+        raise ConnectionError("redis is down")
+
+
+def message(recipient: str) -> OutboundMessage:
+    return OutboundMessage(channel="telegram", recipient=recipient, text="hi", template_id=1)
+
+
+def test_sender_survives_result_handling_errors():
+    async def scenario():
+        adapter = FakeChannelAdapter("telegram", permanent_failures={"rejected"}, rate_per_second=1000, burst=1000, batch_size=1)
+        pool = DispatchWorkerPool({"telegram": adapter}, queue=FailingDeadLetterQueue(), concurrency=1, batch_window_ms=0)
+        await pool.start()
+        try:
+            q = pool.channel_queues["telegram"]
+            # Сообщение уходит в dead-letter, который падает; следующее должно быть отправлено
+            await q.put(message("rejected"))
+            await q.put(message("100"))
+            await asyncio.wait_for(pool.join(), 5)
+        finally:
+            await pool.stop()
+        return adapter.sent
+
+    sent = asyncio.run(scenario())
+    assert [m.recipient for m in sent] == ["100"]
+
+
+def test_memory_queue_skips_jobs_without_consumer():
+    async def scenario():
+        queue = InMemoryDispatchQueue()
+        skipped = await queue.enqueue({"kind": "template", "template_id": 1})
+        queue.register_consumer()
+        accepted = await queue.enqueue({"kind": "template", "template_id": 1})
+        return skipped, accepted
+
+    assert asyncio.run(scenario()) == (False, True)
@@ -0,0 +1,84 @@
+# tests/test_event_detail.py
+import asyncio
+import json
+
+from starlette.requests import Request
+
+from backend.api import event_routers
+from backend.config import response_cache
+from backend.config.event_cache import EventDetailCache
+
+EVENT_ID = 7
+CANONICAL_SLUG = "concert-2026-7"
+
+
+def make_request(headers=None) -> Request:
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": f"/v1/public/events/{EVENT_ID}", "headers": raw_headers, "query_string": b""})
+
+
+async def fake_load_event_detail(event_id, db):
+    # Загрузчик отдает строковые поля, как load_event_detail
+    return {
+        "body": json.dumps({"id": event_id}).encode(),
+        "canonical_slug": CANONICAL_SLUG,
+        "etag": f'W/"event-{event_id}"',
+        "last_modified": "2026-01-01T10:00:00",
+    }
+
+
+async def fake_resolve_event_id(slug_or_id, db):
+    return EVENT_ID
+
+
+class BrokenCache:
+    async def get(self, key):
+        raise ConnectionError("cache is down")
+
+    async def set(self, key, entry, ttl, tags=()):
+        raise ConnectionError("cache is down")
+
+
+def setup(monkeypatch, backend):
+    monkeypatch.setattr(response_cache, "_cache", backend)
+    monkeypatch.setattr(event_routers, "event_detail_cache", EventDetailCache())
+    monkeypatch.setattr(event_routers, "resolve_event_id", fake_resolve_event_id)
+    monkeypatch.setattr(event_routers, "load_event_detail", fake_load_event_detail)
+
+
+def test_cold_cache_then_hit(monkeypatch):
+    setup(monkeypatch, response_cache.InMemoryCacheBackend())
+
+    async def scenario():
+        cold = await event_routers.get_event(CANONICAL_SLUG, db=None, request=make_request())
+        hit = await event_routers.get_event(CANONICAL_SLUG, db=None, request=make_request())
+        return cold, hit
+
+    cold, hit = asyncio.run(scenario())
+    for response in (cold, hit):
+        assert response.status_code == 200
+        assert json.loads(response.body) == {"id": EVENT_ID}
+        assert response.headers["etag"] == f'W/"event-{EVENT_ID}"'
+
+
+def test_cache_backend_down(monkeypatch):
+    setup(monkeypatch, BrokenCache())
+    response = asyncio.run(event_routers.get_event(str(EVENT_ID), db=None, request=make_request()))
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'W/"event-{EVENT_ID}"'
+
+
+def test_waiters_get_bytes(monkeypatch):
+    setup(monkeypatch, response_cache.InMemoryCacheBackend())
+    cache = EventDetailCache()
+
+    async def slow_loader():
+        await asyncio.sleep(0.01)
+        return await fake_load_event_detail(EVENT_ID, None)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_or_load(EVENT_ID, slow_loader) for _ in range(3)))
+
+    for entry in asyncio.run(scenario()):
+        assert entry["canonical_slug"] == CANONICAL_SLUG.encode()
+
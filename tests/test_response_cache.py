@@ -0,0 +1,39 @@
+# tests/test_response_cache.py
+import asyncio
+import time
+
+from backend.config import response_cache
+
+
+class FakeClock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def test_memory_version_expires_with_ttl(monkeypatch):
+    clock = FakeClock(time.time() + response_cache.RESPONSE_CACHE_TTL)
+    monkeypatch.setattr(response_cache, "_cache", response_cache.InMemoryCacheBackend())
+    monkeypatch.setattr(response_cache.time, "time", clock.time)
+
+    async def version():
+        return await response_cache.data_version(response_cache.EVENTS_LIST_TAG)
+
+    first = asyncio.run(version())
+    assert asyncio.run(version()) == first
+    # Правка через другой процесс этот счетчик не меняет: версия все равно сменится через TTL
+    clock.now += response_cache.RESPONSE_CACHE_TTL
+    second = asyncio.run(version())
+    assert second[0] != first[0]
+    assert second[1] > first[1]
+
+
+def test_shared_version_is_not_bucketed(monkeypatch):
+    class SharedBackend(response_cache.InMemoryCacheBackend):
+        shared = True
+
+    monkeypatch.setattr(response_cache, "_cache", SharedBackend())
+    token, _ = asyncio.run(response_cache.data_version(response_cache.EVENTS_LIST_TAG))
+    assert "." not in token
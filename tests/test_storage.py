@@ -0,0 +1,40 @@
+# tests/test_storage.py
+import asyncio
+import base64
+import hashlib
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from backend.config.storage import S3Storage
+
+# boto3 ставится вместе с aioboto3 и нужен только для MEDIA_STORAGE_BACKEND=s3
+pytest.importorskip("boto3")
+
+
+def test_presigned_upload_signs_size_type_and_checksum():
+    storage = S3Storage(
+        "media", "uploads/",
+        endpoint_url="http://minio:9000",
+        public_endpoint_url="http://localhost:9000",
+        region="us-east-1",
+        access_key_id="minioadmin",
+        secret_access_key="minioadmin",
+        part_size=5 * 1024 * 1024,
+    )
+    payload = b"x" * 1024
+    sha256 = hashlib.sha256(payload).hexdigest()
+
+    url, headers = asyncio.run(storage.presign_upload("a.jpg", "image/jpeg", len(payload), sha256, 300))
+
+    query = parse_qs(urlparse(url).query)
+    # SigV4: заголовки входят в подпись, S3 отклонит загрузку с другим размером или содержимым
+    assert query["X-Amz-Algorithm"] == ["AWS4-HMAC-SHA256"]
+    assert query["X-Amz-SignedHeaders"][0].split(";") == [
+        "content-length", "content-type", "host", "x-amz-checksum-sha256",
+    ]
+    assert url.startswith("http://localhost:9000/")
+    assert headers == {
+        "Content-Type": "image/jpeg",
+        "x-amz-checksum-sha256": base64.b64encode(bytes.fromhex(sha256)).decode(),
+    }